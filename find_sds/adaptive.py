@@ -0,0 +1,201 @@
+"""
+Adaptive (AIMD) concurrency limit for each SDS provider.
+
+Instead of hand-tuning `pool_size`, the number of requests in flight to
+each provider grows while the provider answers quickly and shrinks as soon as
+it slows down, errors out or throttles (429/503).
+"""
+
+
+import threading
+import time
+import uuid
+from typing import Dict, MutableMapping, Optional
+
+
+class AdaptiveLimiter:
+    """Additive-increase / multiplicative-decrease concurrency limit per provider
+
+    Each successful request with a latency close to the baseline latency of
+    the provider adds about one slot per "round" of requests
+    (`limit += increase / limit`). A slow request removes about one slot per
+    round. The baseline is a slow moving average of the latencies, so that it
+    follows the usual latency of the provider instead of its fastest response
+    ever. Probes (see `release()`) do not count in it. An error, a timeout or
+    a 429/503 response multiplies the limit by `decrease`, at most once per
+    typical request latency so that a burst of failures only counts once.
+
+    The state is kept in a mapping guarded by a lock so that it can be shared
+    across Pool workers using `multiprocessing.Manager().dict()` and
+    `multiprocessing.Manager().Lock()`.
+
+    Each slot taken is a lease expiring after `lease_timeout`: the slot of a
+    worker killed in the middle of a request is given back to the others
+    instead of shrinking the limit for the rest of the run.
+
+    Parameters
+    ----------
+    max_limit : int, optional
+        the highest concurrency allowed for one provider, by default 10
+    min_limit : int, optional
+        the lowest concurrency allowed for one provider, by default 1
+    initial_limit : int, optional
+        the concurrency a provider starts with, by default 2
+    increase : float, optional
+        slots added per round of fast requests, by default 1
+    decrease : float, optional
+        factor applied to the limit on errors and throttling, by default 0.5
+    latency_tolerance : float, optional
+        a request slower than this many times the baseline latency
+        counts as slow, by default 2
+    baseline_weight : float, optional
+        weight of each latency in the moving average of the baseline latency,
+        by default 0.05 (about the last 20 requests)
+    poll_interval : float, optional
+        how long (in seconds) acquire() waits before checking for a free
+        slot again, by default 0.05
+    lease_timeout : float, optional
+        how long (in seconds) a slot stays taken without being released,
+        by default 300. Longer than any request (timeouts, downloads)
+    state : MutableMapping, optional
+        the mapping holding the state of each provider, by default a new dict
+    lock : optional
+        the lock guarding `state`, by default a new threading.Lock
+    """
+
+    def __init__(self, max_limit: int = 10, min_limit: int = 1, initial_limit: int = 2,
+                 increase: float = 1.0, decrease: float = 0.5, latency_tolerance: float = 2.0,
+                 baseline_weight: float = 0.05, poll_interval: float = 0.05, lease_timeout: float = 300.0,
+                 state: Optional[MutableMapping] = None, lock=None) -> None:
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.initial_limit = max(min_limit, min(initial_limit, max_limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.baseline_weight = baseline_weight
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.state = state if state is not None else {}
+        self.lock = lock if lock is not None else threading.Lock()
+
+    def _get(self, provider: str) -> Dict:
+        return dict(self.state.get(provider) or {
+            'limit': float(self.initial_limit),
+            'in_flight': 0,
+            'leases': {},
+            'baseline_latency': None,
+            'avg_latency': None,
+            'last_decrease': None,
+            'requests': 0,
+            'throttled': 0,
+        })
+
+    @staticmethod
+    def _expire(status: Dict, now: float) -> None:
+        # Slots of workers that died (or hung) without releasing them
+        status['leases'] = {lease: expires for lease, expires in status['leases'].items() if expires > now}
+        status['in_flight'] = len(status['leases'])
+
+    def try_acquire(self, provider: str) -> Optional[str]:
+        """Take a request slot of `provider` if one is free
+
+        Returns
+        -------
+        Optional[str]
+            the lease of the slot taken, to give back with release();
+            None if no slot is free
+        """
+        with self.lock:
+            status = self._get(provider)
+            now = time.monotonic()
+            self._expire(status, now)
+            if status['in_flight'] >= int(status['limit']):
+                return None
+            lease = uuid.uuid4().hex
+            status['leases'][lease] = now + self.lease_timeout
+            status['in_flight'] = len(status['leases'])
+            self.state[provider] = status
+            return lease
+
+    def acquire(self, provider: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Wait for a free request slot of `provider` and take it
+
+        Parameters
+        ----------
+        provider : str
+            the name of the SDS provider
+        timeout : Optional[float], optional
+            the longest wait (in seconds), by default None (no limit)
+
+        Returns
+        -------
+        Optional[str]
+            the lease of the slot taken, None if no slot was free within `timeout`
+        """
+        give_up_at = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            lease = self.try_acquire(provider)
+            if lease is not None:
+                return lease
+            if give_up_at is not None and time.monotonic() >= give_up_at:
+                return None
+            time.sleep(self.poll_interval)
+
+    def release(self, provider: str, latency: Optional[float], status_code: Optional[int],
+                lease: Optional[str] = None) -> None:
+        """Give back the request slot of `provider` and adjust its limit
+
+        Parameters
+        ----------
+        provider : str
+            the name of the SDS provider
+        latency : Optional[float]
+            how long (in seconds) the request took, None for a probe (HEAD
+            request...) whose latency says nothing about the load of the provider
+        status_code : Optional[int]
+            the HTTP status of the response, None if the request failed
+            (timeout, connection error, ...)
+        lease : Optional[str], optional
+            the lease given by acquire(), by default None (the oldest lease).
+            Nothing is given back if it has already expired
+        """
+        with self.lock:
+            status = self._get(provider)
+            now = time.monotonic()
+            if lease is None and status['leases']:
+                lease = min(status['leases'], key=status['leases'].get)
+            status['leases'].pop(lease, None)
+            self._expire(status, now)
+            status['requests'] += 1
+
+            if status_code is None or status_code == 429 or status_code >= 500:
+                status['throttled'] += 1
+                backoff_period = status['avg_latency'] or latency or 0.0
+                if status['last_decrease'] is None or now - status['last_decrease'] >= backoff_period:
+                    status['limit'] = max(self.min_limit, status['limit'] * self.decrease)
+                    status['last_decrease'] = now
+            elif latency is not None:
+                baseline = status['baseline_latency'] if status['baseline_latency'] is not None else latency
+                step = self.increase / status['limit']
+                if latency <= baseline * self.latency_tolerance:
+                    status['limit'] = min(self.max_limit, status['limit'] + step)
+                else:
+                    status['limit'] = max(self.min_limit, status['limit'] - step)
+
+                status['baseline_latency'] = (1 - self.baseline_weight) * baseline + self.baseline_weight * latency
+                status['avg_latency'] = (latency if status['avg_latency'] is None
+                                         else 0.8 * status['avg_latency'] + 0.2 * latency)
+
+            self.state[provider] = status
+
+    def limits(self) -> Dict[str, int]:
+        """Get the current concurrency limit of every provider seen so far
+
+        Returns
+        -------
+        Dict[str, int]
+            provider name mapped to its concurrency limit
+        """
+        with self.lock:
+            return {provider: int(status['limit']) for provider, status in self.state.items()}
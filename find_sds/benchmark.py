@@ -0,0 +1,314 @@
+"""
+Micro-benchmarks of the parsing stage of each SDS provider, without network.
+
+The parse function of each provider (see PROVIDERS in find_sds.py) is fed
+response bodies of three sizes:
+    small:   a page with a single result
+    typical: a page of results as usually returned
+    worst:   a very long page, with the result searched for last when it matters
+Responses recorded with find_sds.http_fixtures (FIND_SDS_HTTP_FIXTURES=record)
+are benchmarked too with --fixture-dir.
+
+Each case reports ops/sec (best of `repeat` runs) and the memory allocated by
+one parse (tracemalloc peak and blocks still allocated). Compared with a saved
+baseline, the exit status is 1 when a case is slower, or allocates more, than
+the threshold allows:
+    python -m find_sds.benchmark --save benchmark.json
+    python -m find_sds.benchmark --baseline benchmark.json --threshold 0.2
+"""
+
+
+import argparse
+import json
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from bs4 import BeautifulSoup
+
+try:
+    from .find_sds import PROVIDERS, parse_chemblink_page, parse_chemicalsafety_results, \
+        parse_fisher_page, parse_fluorochem_results, parse_tci_products, parse_tci_state, parse_vwr_page
+except ImportError:    # running as a script: python find_sds/benchmark.py
+    from find_sds import PROVIDERS, parse_chemblink_page, parse_chemicalsafety_results, \
+        parse_fisher_page, parse_fluorochem_results, parse_tci_products, parse_tci_state, parse_vwr_page
+
+CAS_NR = '64-19-7'
+
+# Number of results in the body of each size
+SIZES = {'small': 1, 'typical': 25, 'worst': 1000}
+
+
+def _other_cas(i: int) -> str:
+    # CAS numbers of the other results, never containing CAS_NR
+    return f'{1000 + i}-00-{i % 10}'
+
+
+def chemblink_page(rows: int) -> str:
+    suppliers = ''.join(f'<tr><td class="label">Supplier</td><td><a href="/suppliers/{i}.htm">Supplier {i}</a>'
+                        f'</td><td>Tel: +1-555-{i:04d}</td></tr>' for i in range(rows))
+    return (f'<html><head><title>{CAS_NR} MSDS</title></head><body><table>{suppliers}</table>'
+            f'<a href="/MSDS/MSDSFiles/{CAS_NR}Alfa-Aesar.pdf" class="blue" onclick="blur()" '
+            f'target="_blank">View / download</a></body></html>')
+
+
+def vwr_page(rows: int) -> str:
+    products = ''.join(f'<tr><td data-title="Description">Acetic acid {i}</td>'
+                       f'<td data-title="Manufacturer"> TCI America </td>'
+                       f'<td data-title="SDS"><a href="https://us.vwr.com/assetsvc/asset/en_US/id/{18065210 + i}/contents">'
+                       f'SDS</a></td></tr>' for i in range(rows))
+    return (f'<html><body><div class="clearfix"><div class="pull-left">{rows} results were found</div></div>'
+            f'<table>{products}</table></body></html>')
+
+
+def fisher_page(rows: int) -> str:
+    def row(cas_nr: str, i: int) -> str:
+        return (f'<div class="msds_img"><img src="/structures/{cas_nr}.gif"></div>'
+                f'<div class="catalog_data"><div class="catlog_items">'
+                f'<a href="/store/msds?partNumber=AC{i:06d}&countryCode=US&language=en">AC{i:06d}</a></div></div>')
+    # Fisher lists close matches first: the exact match is the last row
+    rows_html = ''.join(row(_other_cas(i), i) for i in range(rows - 1)) + row(CAS_NR, rows)
+    return f'<html><body><div class="catalog_num">{rows_html}</div></body></html>'
+
+
+def tci_page(rows: int) -> str:
+    products = ''.join(f'<div class="prductlist" data-casno="{CAS_NR if i == 0 else _other_cas(i)}" '
+                       f'data-id="A{i:04d}"><span>Acetic Acid {i}</span></div>' for i in range(rows))
+    return f'''<html><body>
+<form><input type="hidden" name="CSRFToken" value="token"></form>
+<script>var ACC = {{config: {{}}}}; ACC.config.encodedContextPath = '\\/US\\/en';</script>
+<div id="contentSearchFacet"><span class="facet__text"><a href="#">Products</a><span class="facet__value__count">({rows})</span></span></div>
+{products}
+</body></html>'''
+
+
+def chemicalsafety_results(rows: int) -> str:
+    cols = ['MSDS_ID', 'COMMON', 'MANUFACT', 'CAS', 'CSDISPMSDSID', 'HASMSDS', 'HPHRASES_IDS',
+            'SDSSERVER', 'RS', 'DATE1', 'HTTPMSDSREF']
+    return json.dumps({
+        'cols': [{'name': name, 'prompt': name} for name in cols],
+        'rows': [[str(31303512 + i), f'Acetic acid {i}', f'Vendor {i}', CAS_NR if i % 2 == 0 else _other_cas(i),
+                  str(3395929 + i), '1', '', '', str(31303512 + i), '2020-02-14',
+                  f'https://www.example.com/sds/{i}.pdf'] for i in range(rows)],
+    })
+
+
+def fluorochem_results(rows: int) -> str:
+    return json.dumps({'data': [
+        {'molecule': {'code': f'F{i:06d}', 'name': f'Acetic acid {i}', 'cas': CAS_NR,
+                      'sds': {f'custrecord_sdslink_{language}': f'/core/media/media.nl?id={i}&lang={language}'
+                              for language in ['en', 'de', 'fr', 'es', 'it']}}}
+        for i in range(rows)]})
+
+
+def _parse_tci(text: str, cas_nr: str) -> Optional[str]:
+    # Same stages as TCIClient._search(): the token of the page, then its products
+    html = BeautifulSoup(text, 'html.parser')
+    parse_tci_state(html)
+    return parse_tci_products(html, cas_nr)
+
+
+# Provider: (body of a number of results, parse stage called with the body and the CAS#).
+# The JSON of ChemicalSafety and Fluorochem is decoded by the parse stage, as by `response.json()`
+CASES: Dict[str, Tuple[Callable[[int], str], Callable[[str, str], object]]] = {
+    'chemblink': (chemblink_page, lambda text, cas_nr: parse_chemblink_page(text)),
+    'vwr': (vwr_page, lambda text, cas_nr: parse_vwr_page(text)),
+    'fisher': (fisher_page, parse_fisher_page),
+    'tci': (tci_page, _parse_tci),
+    'chemicalsafety': (chemicalsafety_results,
+                       lambda text, cas_nr: parse_chemicalsafety_results(json.loads(text), [cas_nr])),
+    'fluorochem': (fluorochem_results, lambda text, cas_nr: parse_fluorochem_results(json.loads(text), ['en-US'])),
+}
+
+# Host of the responses of each provider, for recorded fixtures
+FIXTURE_HOSTS = {
+    'www.chemblink.com': 'chemblink',
+    'us.vwr.com': 'vwr',
+    'www.fishersci.com': 'fisher',
+    'www.tcichemicals.com': 'tci',
+    'chemicalsafety.com': 'chemicalsafety',
+    'dougdiscovery.com': 'fluorochem',
+}
+
+
+def load_fixture_bodies(fixture_dir: str) -> Dict[str, List[Tuple[str, str]]]:
+    """Get the bodies of the responses recorded by find_sds.http_fixtures.
+    Only the pages parsed by a provider are kept (e.g. the TCI search, not its SDS requests)
+
+    Parameters
+    ----------
+    fixture_dir : str
+        FIND_SDS_FIXTURE_DIR of the recording
+
+    Returns
+    -------
+    Dict[str, List[Tuple[str, str]]]
+        each provider mapped to the bodies of its responses and the CAS# searched
+    """
+    bodies = {}
+    for host, provider in FIXTURE_HOSTS.items():
+        for path in sorted((Path(fixture_dir) / host).glob('*.json')):
+            fixture = json.loads(path.read_text(encoding='utf-8'))
+            request, response = fixture['request'], fixture['response']
+            if response['status_code'] != 200 or 'text' not in response:
+                continue
+            if provider == 'tci' and request['method'] != 'GET':
+                continue
+            query = parse_qs(urlsplit(request['url']).query)
+            # The CAS# is in the query of the searches sent with GET
+            cas_nr = next((values[0] for key in ['msdsKeyword', 'text', 'keyword'] for values in [query.get(key)]
+                           if values), CAS_NR)
+            bodies.setdefault(provider, []).append((response['text'], cas_nr))
+    return bodies
+
+
+def measure(parse: Callable[[str, str], object], text: str, cas_nr: str = CAS_NR, repeat: int = 5) -> Dict:
+    """Benchmark one parse of a body
+
+    Parameters
+    ----------
+    parse : Callable[[str, str], object]
+        parse stage of a provider, see CASES
+    text : str
+        the response body
+    cas_nr : str, optional
+        CAS# searched, by default CAS_NR
+    repeat : int, optional
+        the number of timed runs (about 0.2 s each), by default 5
+
+    Returns
+    -------
+    Dict
+        ops_per_sec (of the fastest run), peak_kb and blocks (still allocated) of one parse, body_kb
+    """
+    timer = timeit.Timer(lambda: parse(text, cas_nr))
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    allocated_before = tracemalloc.get_traced_memory()[0]
+    result = parse(text, cas_nr)
+    peak = tracemalloc.get_traced_memory()[1] - allocated_before
+    blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    del result
+    if not tracing:
+        tracemalloc.stop()
+
+    return {'ops_per_sec': round(1 / best, 1), 'peak_kb': round(peak / 2**10, 1), 'blocks': blocks,
+            'body_kb': round(len(text.encode()) / 2**10, 1)}
+
+
+def run_benchmarks(providers: Optional[List[str]] = None, sizes: Optional[List[str]] = None,
+                   fixture_dir: Optional[str] = None, repeat: int = 5) -> Dict[str, Dict]:
+    """Benchmark the parse stage of providers on bodies of each size
+
+    Parameters
+    ----------
+    providers : Optional[List[str]], optional
+        by default all PROVIDERS
+    sizes : Optional[List[str]], optional
+        keys of SIZES, by default all
+    fixture_dir : Optional[str], optional
+        folder of recorded responses benchmarked too, as 'recorded-<n>', by default None
+    repeat : int, optional
+        see measure(), by default 5
+
+    Returns
+    -------
+    Dict[str, Dict]
+        '<provider>:<size>' mapped to the result of measure()
+    """
+    recorded = load_fixture_bodies(fixture_dir) if fixture_dir else {}
+    results = {}
+    for provider in providers or PROVIDERS:
+        make_body, parse = CASES[provider]
+        for size in sizes or list(SIZES):
+            results[f'{provider}:{size}'] = measure(parse, make_body(SIZES[size]), repeat=repeat)
+        for i, (text, cas_nr) in enumerate(recorded.get(provider, [])):
+            results[f'{provider}:recorded-{i}'] = measure(parse, text, cas_nr, repeat=repeat)
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float = 0.2) -> List[str]:
+    """Find the cases that regressed from a baseline
+
+    Parameters
+    ----------
+    results : Dict[str, Dict]
+        see run_benchmarks()
+    baseline : Dict[str, Dict]
+        results of an earlier run; cases missing from it are not compared
+    threshold : float, optional
+        the fraction of ops/sec lost, or of peak memory gained, allowed, by default 0.2
+
+    Returns
+    -------
+    List[str]
+        a description of each regression
+    """
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if not base:
+            continue
+        if result['ops_per_sec'] < base['ops_per_sec'] * (1 - threshold):
+            regressions.append(f"{case}: {result['ops_per_sec']:.1f} ops/sec, "
+                               f"{1 - result['ops_per_sec'] / base['ops_per_sec']:.0%} slower than {base['ops_per_sec']:.1f}")
+        # Ignore a few KB on tiny parses
+        if result['peak_kb'] > max(base['peak_kb'] * (1 + threshold), base['peak_kb'] + 4):
+            # A peak rounded to 0.0 KB has no ratio
+            growth = (f"{result['peak_kb'] / base['peak_kb'] - 1:.0%}" if base['peak_kb']
+                      else f"{result['peak_kb'] - base['peak_kb']:.1f} KB")
+            regressions.append(f"{case}: {result['peak_kb']:.1f} KB peak, "
+                               f"{growth} more than {base['peak_kb']:.1f} KB")
+    return regressions
+
+
+def format_results(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]] = None) -> str:
+    lines = [f"{'case':<28}{'body KB':>10}{'ops/sec':>12}{'peak KB':>10}{'blocks':>8}"
+             + (f"{'vs baseline':>14}" if baseline else '')]
+    for case, result in results.items():
+        line = (f"{case:<28}{result['body_kb']:>10.1f}{result['ops_per_sec']:>12.1f}"
+                f"{result['peak_kb']:>10.1f}{result['blocks']:>8}")
+        if baseline and case in baseline:
+            line += f"{result['ops_per_sec'] / baseline[case]['ops_per_sec'] - 1:>+14.0%}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the parse stage of each SDS provider')
+    parser.add_argument('--provider', action='append', choices=PROVIDERS, help='by default all (repeat for several)')
+    parser.add_argument('--size', action='append', choices=list(SIZES), help='by default all (repeat for several)')
+    parser.add_argument('--fixture-dir', help='benchmark the responses recorded in this folder too')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of each case (default: 5)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fraction of ops/sec lost or of peak memory gained that fails the run (default: 0.2)')
+    parser.add_argument('--save', help='save the results to this JSON file, e.g. as the next baseline')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.provider, args.size, args.fixture_dir, args.repeat)
+    baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8')) if args.baseline else None
+    print(format_results(results, baseline))
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=1), encoding='utf-8')
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:')
+            print('\n'.join(f'  {regression}' for regression in regressions))
+            sys.exit(1)
+        print(f'\nNo regression beyond {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+SDS of a list of chemicals streamed into one ZIP archive.
+
+Each SDS is added to the archive as soon as a worker has it, without being
+saved to disk first: the archive grows (and can be read from a pipe) while
+the other CAS numbers are still searched. Files are stored, not compressed
+again. SDS already in a download folder are taken from there. The archive
+ends with 'manifest.json', listing the SDS found and the CAS numbers missing.
+
+Usage:
+    python -m find_sds.bundle 64-19-7 67-64-1 -o sds.zip
+    python -m find_sds.bundle --cas-file cas_list.txt --download-path SDS -o - > sds.zip
+"""
+
+
+import argparse
+import json
+import os
+import sys
+import time
+import zipfile
+from contextlib import ExitStack
+from functools import partial
+from multiprocessing import Manager, Pool
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+try:
+    from .find_sds import TCIClient, _deadline, _download_content, _find_download_url, _init_worker
+    from .provider_health import CircuitBreaker
+    from .storage import SDSLibrary
+except ImportError:    # running as a script: python find_sds/bundle.py
+    from find_sds import TCIClient, _deadline, _download_content, _find_download_url, _init_worker
+    from provider_health import CircuitBreaker
+    from storage import SDSLibrary
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _init_bundle_worker(worker_state: Dict[str, Any], to_stdout: bool) -> None:
+    _init_worker(worker_state)
+    if to_stdout:
+        # The archive is written to stdout: messages of the workers go to stderr
+        sys.stdout = sys.stderr
+
+
+def _bundle_task(cas_nr: str, download_path: Optional[str] = None, deadline: float = None
+                 ) -> Tuple[str, Optional[str], Optional[str], Optional[bytes], Optional[str]]:
+    """Get the SDS of a chemical for the archive (Pool task)
+
+    Returns
+    -------
+    Tuple[str, Optional[str], Optional[str], Optional[bytes], Optional[str]]
+        - the CAS number
+        - the name of the SDS source, None if not found
+        - the path of the SDS in `download_path`, if it was there
+        - the downloaded SDS, if it was not
+        - the error met, if any
+    """
+    if download_path:
+        existing_file = SDSLibrary.open(download_path).find(cas_nr)
+        if existing_file:
+            return cas_nr, 'local', str(existing_file), None, None
+
+    deadline_token = _deadline.set(time.monotonic() + deadline if deadline else None)
+    try:
+        provider, sds_source, full_url = _find_download_url(cas_nr)
+        if full_url:
+            content = _download_content(cas_nr, provider, full_url)
+            if content is not None:
+                return cas_nr, sds_source or provider, None, content, None
+    except Exception as error:
+        return cas_nr, None, None, None, f'{type(error).__name__}: {error}'
+    finally:
+        _deadline.reset(deadline_token)
+    return cas_nr, None, None, None, None
+
+
+def bundle_sds(cas_list: List[str], output: Union[str, BinaryIO], download_path: str = None,
+               pool_size: int = 10, cas_deadline: float = None) -> Dict[str, int]:
+    """Stream the SDS of chemicals into a ZIP archive, as '<CAS>-SDS.pdf' files
+    (stored, not compressed) followed by 'manifest.json'
+
+    Parameters
+    ----------
+    cas_list : List[str]
+        List of CAS numbers
+    output : Union[str, BinaryIO]
+        the path of the archive, '-' for stdout, or a binary file open for writing.
+        Files that cannot seek (pipes, sockets) are fine
+    download_path : str, optional
+        a download folder whose SDS are added to the archive instead of
+        being downloaded again, by default None. Nothing is written to it
+    pool_size : int, optional
+        the number of CAS numbers searched at the same time, by default 10
+    cas_deadline : float, optional
+        the longest time (in seconds) spent on one CAS number, by default None (no limit)
+
+    Returns
+    -------
+    Dict[str, int]
+        the number of SDS 'found' and 'missing', and the 'bytes' of SDS in the archive
+    """
+    cas_list = list(dict.fromkeys(cas_list))
+    to_stdout = output == '-'
+    manifest = {'found': [], 'missing': []}
+    with ExitStack() as stack:
+        if to_stdout:
+            stream = sys.stdout.buffer
+        elif isinstance(output, (str, os.PathLike)):
+            stream = stack.enter_context(open(output, 'wb'))
+        else:
+            stream = output
+        manager = stack.enter_context(Manager())
+        archive = stack.enter_context(zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED))
+
+        worker_state = {'circuit_breaker': CircuitBreaker(state=manager.dict(), lock=manager.Lock()),
+                        'tci_client': TCIClient(),
+                        'probe_urls': True}
+        task = partial(_bundle_task, download_path=download_path, deadline=cas_deadline)
+        with Pool(pool_size, initializer=_init_bundle_worker, initargs=(worker_state, to_stdout)) as p:
+            for cas_nr, source, existing_file, content, error in p.imap_unordered(task, cas_list):
+                file_name = f'{cas_nr}-SDS.pdf'
+                if existing_file:
+                    # Copied in chunks from the download folder
+                    archive.write(existing_file, file_name)
+                elif content is not None:
+                    archive.writestr(file_name, content)
+                else:
+                    manifest['missing'].append({'cas_nr': cas_nr, 'error': error})
+                    continue
+                manifest['found'].append({'cas_nr': cas_nr, 'file': file_name, 'source': source,
+                                          'size': archive.getinfo(file_name).file_size})
+                # Hand each file over to the reader right away
+                stream.flush()
+
+        for entries in manifest.values():
+            entries.sort(key=lambda entry: entry['cas_nr'])
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=1))
+
+    return {'found': len(manifest['found']), 'missing': len(manifest['missing']),
+            'bytes': sum(entry['size'] for entry in manifest['found'])}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Stream the SDS of a list of chemicals into a ZIP archive')
+    parser.add_argument('cas_nr', nargs='*', help='CAS numbers')
+    parser.add_argument('--cas-file', help='a file with one CAS number per line')
+    parser.add_argument('-o', '--output', default='-', help="the ZIP archive, '-' for stdout (default)")
+    parser.add_argument('--download-path', help='a download folder to take existing SDS from')
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--cas-deadline', type=float, help='seconds allowed for one CAS number')
+    args = parser.parse_args()
+
+    cas_list = list(args.cas_nr)
+    if args.cas_file:
+        with open(args.cas_file, encoding='utf-8') as f:
+            cas_list += [line.strip() for line in f if line.strip()]
+    if not cas_list:
+        parser.error('no CAS number given')
+
+    counts = bundle_sds(cas_list, args.output, download_path=args.download_path, pool_size=args.pool_size,
+                        cas_deadline=args.cas_deadline)
+    print('{found} SDS ({mb:.1f} MB) bundled, {missing} missing.'.format(mb=counts['bytes'] / 2**20, **counts),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
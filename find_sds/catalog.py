@@ -0,0 +1,205 @@
+"""
+Local index of vendor catalogs: CAS number -> vendor product number / SDS URL.
+
+Providers consult the index before searching the vendor website, and go
+straight to the SDS when the index knows the product. The index is filled
+from vendor catalog dumps (CSV files) and from the results of previous
+searches.
+
+Usage:
+    python -m find_sds.catalog build catalog.sqlite tci_catalog.csv --vendor tci
+    python -m find_sds.catalog lookup catalog.sqlite 623-51-8
+
+CSV files need a header row with the columns:
+    cas, product_code and/or sds_url, and optionally vendor and source
+    (vendor is one of the SDS providers, e.g. 'tci', 'vwr', 'fisher').
+"""
+
+
+import argparse
+import csv
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS catalog (
+    vendor TEXT NOT NULL,
+    cas TEXT NOT NULL,
+    product_code TEXT NOT NULL DEFAULT '',
+    sds_url TEXT,
+    source TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (cas, vendor, product_code)
+) WITHOUT ROWID
+'''
+
+
+class CatalogIndex:
+    """SQLite index of vendor catalog entries, safe to use from several
+    threads and processes at once
+
+    Parameters
+    ----------
+    path : str
+        the SQLite file of the index, created if it does not exist
+    max_age : Optional[float], optional
+        entries older than this (in seconds) are ignored by lookup(),
+        by default None (never ignored)
+    """
+
+    def __init__(self, path: str, max_age: Optional[float] = None) -> None:
+        self.path = str(path)
+        self.max_age = max_age
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(SCHEMA)
+
+    def __getstate__(self) -> Dict:
+        # Each process opens its own connection
+        return {'path': self.path, 'max_age': self.max_age}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+        return connection
+
+    def lookup(self, cas_nr: str, vendor: Optional[str] = None) -> List[Dict]:
+        """Find the catalog entries of a chemical
+
+        Parameters
+        ----------
+        cas_nr : str
+            CAS# for chemical of interest
+        vendor : Optional[str], optional
+            only the entries of this vendor, by default None (all vendors)
+
+        Returns
+        -------
+        List[Dict]
+            entries with keys 'vendor', 'cas', 'product_code', 'sds_url', 'source',
+            most recently updated first
+        """
+        query = 'SELECT vendor, cas, product_code, sds_url, source FROM catalog WHERE cas = ?'
+        args = [cas_nr]
+        if vendor:
+            query += ' AND vendor = ?'
+            args.append(vendor)
+        if self.max_age:
+            query += ' AND updated >= ?'
+            args.append(time.time() - self.max_age)
+        query += ' ORDER BY updated DESC'
+        return [dict(row) for row in self._connection().execute(query, args)]
+
+    def add(self, entries: Iterable[Dict]) -> int:
+        """Add or update catalog entries
+
+        Parameters
+        ----------
+        entries : Iterable[Dict]
+            with keys 'vendor', 'cas' and 'product_code' and/or 'sds_url',
+            optionally 'source'
+
+        Returns
+        -------
+        int
+            the number of entries added or updated
+        """
+        now = time.time()
+        rows = [(entry['vendor'].strip().lower(), entry['cas'].strip(),
+                 (entry.get('product_code') or '').strip(),
+                 (entry.get('sds_url') or '').strip() or None,
+                 (entry.get('source') or '').strip() or None, now)
+                for entry in entries
+                if entry.get('cas') and (entry.get('product_code') or entry.get('sds_url'))]
+        with self._connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def remove(self, cas_nr: str, vendor: str, sds_url: Optional[str] = None) -> int:
+        """Remove the catalog entries of a chemical at a vendor, e.g. an SDS URL that is gone
+
+        Parameters
+        ----------
+        cas_nr : str
+            CAS# for chemical of interest
+        vendor : str
+            the vendor of the entries
+        sds_url : Optional[str], optional
+            only the entries with this SDS URL, by default None (all entries)
+
+        Returns
+        -------
+        int
+            the number of entries removed
+        """
+        query = 'DELETE FROM catalog WHERE cas = ? AND vendor = ?'
+        args = [cas_nr, vendor.strip().lower()]
+        if sds_url:
+            query += ' AND sds_url = ?'
+            args.append(sds_url)
+        with self._connection() as connection:
+            return connection.execute(query, args).rowcount
+
+    def import_csv(self, csv_path: str, vendor: Optional[str] = None) -> int:
+        """Import a vendor catalog dump
+
+        Parameters
+        ----------
+        csv_path : str
+            CSV file with a header row, see the module documentation
+        vendor : Optional[str], optional
+            the vendor of every row, by default None (read from the 'vendor' column)
+
+        Returns
+        -------
+        int
+            the number of entries imported
+        """
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            return self.add({**row, 'vendor': vendor or row.get('vendor') or ''}
+                            for row in reader if vendor or row.get('vendor'))
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Build or query the local vendor catalog index')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='import vendor catalog dumps (CSV) into the index')
+    build.add_argument('index', help='SQLite file of the index')
+    build.add_argument('csv_files', nargs='+')
+    build.add_argument('--vendor', help="vendor of every row, e.g. 'tci' (default: 'vendor' column)")
+
+    lookup = subparsers.add_parser('lookup', help='print the catalog entries of CAS numbers')
+    lookup.add_argument('index', help='SQLite file of the index')
+    lookup.add_argument('cas_numbers', nargs='+')
+
+    args = parser.parse_args()
+    index = CatalogIndex(args.index)
+    if args.command == 'build':
+        for csv_file in args.csv_files:
+            print(f'{Path(csv_file).name}: {index.import_csv(csv_file, vendor=args.vendor)} entries imported')
+    else:
+        for cas_nr in args.cas_numbers:
+            for entry in index.lookup(cas_nr) or [{'cas': cas_nr, 'vendor': None}]:
+                print(entry)
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,26 +11,173 @@ using multithreading
 """
 
 
+import hashlib
 import json
 import os
 import re
+import shutil
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import ContextVar, copy_context
 from functools import partial
-from multiprocessing import Pool
+from multiprocessing import Manager, Pool
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import requests
 from bs4 import BeautifulSoup
 
+try:
+    from .adaptive import AdaptiveLimiter
+    from .catalog import CatalogIndex
+    from .http2 import HTTP2Adapter, http2_available
+    from .http_fixtures import FixtureStore
+    from .profiling import WorkerProfiler, profile_report
+    from .progress import ProgressReporter, count_started
+    from .provider_health import CircuitBreaker
+    from .provider_stats import ProviderStats
+    from .response_cache import DiskResponseCache, ResponseCache, make_cache_key
+    from .sds_index import SDSIndex
+    from .storage import SDSLibrary, source_file_name
+    from .tracing import TraceRecorder, export_chrome_trace
+    from .write_behind import WriteBehindWriter
+except ImportError:    # running as a script: python find_sds/find_sds.py
+    from adaptive import AdaptiveLimiter
+    from catalog import CatalogIndex
+    from http2 import HTTP2Adapter, http2_available
+    from http_fixtures import FixtureStore
+    from profiling import WorkerProfiler, profile_report
+    from progress import ProgressReporter, count_started
+    from provider_health import CircuitBreaker
+    from provider_stats import ProviderStats
+    from response_cache import DiskResponseCache, ResponseCache, make_cache_key
+    from sds_index import SDSIndex
+    from storage import SDSLibrary, source_file_name
+    from tracing import TraceRecorder, export_chrome_trace
+    from write_behind import WriteBehindWriter
+
 debug = False
 # print out extra info in debug mode in case SDS is not found
 if len(sys.argv) == 2 and sys.argv[1] in ['--debug=True', '--debug=true', '--debug', '-d']:
     debug = True
 
-
-def find_sds(cas_list: List[str], download_path: str = None, pool_size: int = 10) -> None:
+# Recorded HTTP responses captured / replayed instead of the network (for tests),
+# see FIND_SDS_HTTP_FIXTURES in http_fixtures.py
+http_fixtures = FixtureStore.from_env()
+if http_fixtures:
+    http_fixtures.install()
+
+# SDS providers in the order they are searched by download_sds().
+# The search function of each provider is `extract_download_url_from_<name>()`
+PROVIDERS = ['chemblink', 'vwr', 'fisher', 'tci', 'chemicalsafety', 'fluorochem']
+# Locale of the SDS saved as '<CAS>-SDS.pdf'
+DEFAULT_LOCALE = 'en-US'
+# Providers that have SDS in other languages / for other countries,
+# searched by `extract_localized_urls_from_<name>()`
+LOCALE_PROVIDERS = ['tci', 'fluorochem']
+# Headers of the requests downloading SDS files
+DOWNLOAD_HEADERS = {
+    'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.192 Safari/537.36'}
+# Content-Type of the SDS files sent by the providers (a response without Content-Type is accepted too)
+SDS_CONTENT_TYPES = [
+    'application/pdf', 'application/x-pdf', 'application/acrobat', 'application/octet-stream',
+    'binary/octet-stream', 'application/download', 'application/x-download', 'application/force-download',
+    'application/unknown',
+]
+
+# State shared by all workers of a find_sds() run, installed by _init_worker()
+circuit_breaker: Optional[CircuitBreaker] = None
+concurrency_limiter: Optional[AdaptiveLimiter] = None
+response_cache: Optional[ResponseCache] = None
+# Provider responses kept on disk across runs, see DiskResponseCache
+http_cache: Optional[DiskResponseCache] = None
+# ChemicalSafety results looked up in batches, see extract_download_urls_from_chemicalsafety()
+chemicalsafety_urls: Optional[Dict[str, Optional[Tuple[str, str]]]] = None
+# TCI session kept by each worker, see TCIClient
+tci_client: Optional['TCIClient'] = None
+# Hit rate and search time of each provider, used to order the providers, see provider_stats.py
+provider_stats: Optional[ProviderStats] = None
+# Providers searched first when their statistics are the same
+preferred_providers: List[str] = []
+# Local vendor catalog consulted before searching the providers, see catalog.py
+catalog_index: Optional[CatalogIndex] = None
+# Check predictable URLs with a cheap request before fetching them, see _probe_url()
+probe_urls = False
+# Writes downloaded SDS files behind the workers, see write_behind.py
+disk_writer: Optional[WriteBehindWriter] = None
+# Longest wait (in seconds) to connect to a provider, whatever the timeout of the request
+connect_timeout: Optional[float] = None
+# Locales of the SDS downloaded for each CAS number: the first one is saved as
+# '<CAS>-SDS.pdf', the others as '<CAS>-<locale>-SDS.pdf' (see _download_locales())
+sds_locales: List[str] = [DEFAULT_LOCALE]
+# Profiles CPU time and memory of the worker, see profiling.py
+profiler: Optional[WorkerProfiler] = None
+# Records the timeline of the run, see tracing.py
+tracer: Optional[TraceRecorder] = None
+# Lookups started by each worker, for the progress report, see ProgressReporter
+tasks_started: Optional[Dict[int, int]] = None
+# Layout of each download folder used by this process, see _library()
+_libraries: Dict[str, SDSLibrary] = {}
+# Largest SDS file downloaded (in bytes) and Content-Type accepted, see _read_sds().
+# None / an empty list to accept any size / type
+max_download_bytes: Optional[int] = 50 * 2**20
+sds_content_types: List[str] = SDS_CONTENT_TYPES
+# Session for requests not sent on a session of their own, kept warm by long-running processes
+http_session: Optional[requests.Session] = None
+# Sends all requests of the process over shared HTTP/2 connections, see http2.py
+http2_adapter: Optional[HTTP2Adapter] = None
+
+# Provider searched in the current context, and the error it met, see _search_provider()
+_current_provider: ContextVar[Optional[str]] = ContextVar('_current_provider', default=None)
+_provider_error: ContextVar[Optional[Exception]] = ContextVar('_provider_error', default=None)
+# Time (time.monotonic()) by which the CAS number being looked up must be done, see download_sds()
+_deadline: ContextVar[Optional[float]] = ContextVar('_deadline', default=None)
+# SDS URL last taken from `catalog_index` instead of a search, see _search_provider()
+_catalog_url: ContextVar[Optional[str]] = ContextVar('_catalog_url', default=None)
+# Filled by download_sds() with the provider and size of the downloaded SDS, see _download_task()
+_download_info: ContextVar[Optional[Dict[str, Any]]] = ContextVar('_download_info', default=None)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """The time allowed for looking up a CAS number has run out"""
+
+
+class DownloadRejected(requests.RequestException):
+    """The server did not send a SDS file: the download was aborted"""
+    # Counted in the summary of find_sds() under this name
+    reason = 'rejected'
+
+
+class ResponseTooLarge(DownloadRejected):
+    """The response is larger than `max_download_bytes`"""
+    reason = 'too_large'
+
+
+class UnexpectedContentType(DownloadRejected):
+    """The response is not a PDF: Content-Type not in `sds_content_types`, or markup (e.g. HTML page)"""
+    reason = 'wrong_type'
+
+
+def find_sds(cas_list: List[str], download_path: str = None, pool_size: int = 10,
+             breaker_failures: int = 5, breaker_window: float = 60.0,
+             breaker_cooldown: float = 300.0, adaptive: bool = False,
+             response_cache_mb: float = 32, chemicalsafety_batch_size: int = 0,
+             probe: bool = True, catalog_path: str = None, catalog_max_age: float = None,
+             provider_stats_path: str = None, preferred: List[str] = None,
+             cas_deadline: float = None, connect_timeout: float = None,
+             http_cache_path: str = None, http_cache_mb: float = 256,
+             http_cache_ttl: float = 24 * 3600, write_behind: int = 0,
+             layout: str = None, progress_interval: float = 10.0,
+             progress_path: str = None, index: bool = False, all_sources: bool = False,
+             locales: List[str] = None, profile: str = None, profile_path: str = 'profile',
+             trace_path: str = None, http2: bool = False, max_sds_mb: float = 50,
+             content_types: List[str] = None) -> None:
     """Find safety data sheet (SDS) for list of CAS numbers
 
     Parameters
@@ -44,6 +191,129 @@ def find_sds(cas_list: List[str], download_path: str = None, pool_size: int = 10
     pool_size : int, optional
         the number of multithread that are running simultaneously,
         by default 10
+    breaker_failures : int, optional
+        the number of consecutive errors after which a provider is skipped
+        by all workers, by default 5. Use 0 to never skip a provider
+    breaker_window : float, optional
+        errors older than this (in seconds) do not count toward
+        `breaker_failures`, by default 60
+    breaker_cooldown : float, optional
+        how long (in seconds) a failing provider is skipped before
+        it is tried again, by default 300
+    adaptive : bool, optional
+        adjust the number of concurrent requests to each provider
+        based on its latency, errors and throttling (429/503), by default False.
+        `pool_size` is then the maximum number of concurrent lookups.
+        Only the searches count: SDS downloads, often from another host, are not limited
+    response_cache_mb : float, optional
+        the memory (in MB) used by each worker to keep provider responses,
+        so the same search is not sent twice during the run, by default 32.
+        Use 0 to turn off the cache
+    chemicalsafety_batch_size : int, optional
+        look up ChemicalSafety results for this many CAS numbers per request
+        before downloading, instead of one request per CAS number,
+        by default 0 (one request per CAS number)
+    probe : bool, optional
+        check that predictable pages and SDS files (ChemBlink, TCI) exist with
+        a HEAD request before fetching them, by default True
+    catalog_path : str, optional
+        the SQLite vendor catalog index (see catalog.py) consulted before
+        searching the providers; SDS URLs and product numbers found during
+        the run are added to it, by default None (no index). SDS URLs of the
+        index that cannot be downloaded any more are removed, and searched again
+    catalog_max_age : float, optional
+        entries of the index older than this (in seconds) are not used,
+        by default None (no limit)
+    provider_stats_path : str, optional
+        the JSON file keeping the hit rate and search time of each provider
+        across runs. Providers are then searched in the order that finds an
+        SDS the soonest (learned per group of similar CAS numbers), instead of
+        the order of `PROVIDERS`, by default None
+    preferred : List[str], optional
+        providers (from `PROVIDERS`) searched first among providers with the
+        same statistics, by default None. Also turns on the learned order
+        (statistics of this run only if `provider_stats_path` is not given)
+    cas_deadline : float, optional
+        the longest time (in seconds) spent on one CAS number, searching all
+        providers and downloading the SDS, by default None (no limit)
+    connect_timeout : float, optional
+        the longest wait (in seconds) to connect to a provider; the timeout of
+        each request then only bounds the wait for data, by default None
+        (the timeout of each request covers both)
+    http_cache_path : str, optional
+        the SQLite file keeping provider responses across runs, shared by
+        all processes using it, e.g. `Path(download_path) / 'http_cache.sqlite'`.
+        Responses are reused as long as their Cache-Control / Expires headers
+        allow, by default None (no cache across runs)
+    http_cache_mb : float, optional
+        the size (in MB) of the responses kept in `http_cache_path`, the least
+        recently used ones are removed first, by default 256
+    http_cache_ttl : float, optional
+        how long (in seconds) responses without Cache-Control / Expires headers
+        are kept in `http_cache_path`, by default 1 day
+    write_behind : int, optional
+        write downloaded SDS files from background threads instead of the
+        download workers, with up to this many files waiting to be written
+        (for slow storage such as SMB or NFS), by default 0 (workers write
+        their files themselves). All files are flushed to disk before the summary
+    layout : str, optional
+        how SDS files are spread into subfolders of `download_path`, one of
+        `storage.LAYOUTS` ('flat', 'prefix', 'hash'), recorded in the folder
+        for later runs. By default None: the layout recorded in the folder,
+        'flat' for a new folder. Use `python -m find_sds.storage migrate` to
+        change the layout of a folder that already has SDS files
+    progress_interval : float, optional
+        seconds between two progress lines (counts, CAS/s, MB/s, ETA, hits
+        of each provider) printed to stderr during the run, by default 10.
+        Use 0 to not print progress
+    progress_path : str, optional
+        a file progress snapshots are appended to, as one JSON object per line
+        (see progress.py), by default None
+    index : bool, optional
+        update the searchable index of the text and hazards of the SDS files
+        in the download folder after downloading (see sds_index.py, needs
+        pypdf), by default False. Only new and changed files are read
+    all_sources : bool, optional
+        search all providers at the same time for each CAS number, and save
+        the SDS of each source as '<CAS>-<source>-SDS.pdf', by default False
+        (first SDS found, saved as '<CAS>-SDS.pdf')
+    locales : List[str], optional
+        language and country of the SDS downloaded for each CAS number,
+        e.g. ['en-US', 'de-DE', 'ja-JP'], by default ['en-US']. The SDS in the
+        first locale is saved as '<CAS>-SDS.pdf', in the others as
+        '<CAS>-<locale>-SDS.pdf'. Only TCI and Fluorochem have SDS in other
+        locales: their product search is reused for all locales.
+        Not supported with `all_sources`
+    profile : str, optional
+        profile the workers: 'cpu' (cProfile), 'memory' (tracemalloc, slower)
+        or 'all', by default None (no profiling). The profile of each worker and
+        a report merging them are saved in `profile_path` (see profiling.py)
+    profile_path : str, optional
+        by default 'profile'
+    trace_path : str, optional
+        a file the timeline of the run is saved to, in the Chrome trace-event
+        format (chrome://tracing, https://ui.perfetto.dev): spans of each CAS
+        number, provider search, wait for a request slot, download and file
+        write, for each worker (see tracing.py), by default None
+    http2 : bool, optional
+        send the requests of each worker (searches and downloads) over HTTP/2
+        connections kept open across lookups, falling back to HTTP/1.1 for hosts
+        without HTTP/2, by default False. Needs `httpx[http2]` (see http2.py).
+        It saves no connections with the process pool: each worker has its own
+        connections and sends one request at a time, so `pool_size` workers still
+        open `pool_size` connections per host, as with HTTP/1.1. Requests are only
+        multiplexed when a worker sends them together, i.e. with `all_sources`.
+        Use the service (`python -m find_sds.service --http2`) to share connections
+        across lookups
+    max_sds_mb : float, optional
+        the largest SDS file downloaded, by default 50 MB. Larger responses are
+        aborted as soon as they pass the limit (or announce a larger Content-Length).
+        Use 0 for no limit
+    content_types : List[str], optional
+        the Content-Type accepted for SDS files, by default SDS_CONTENT_TYPES.
+        Other responses (e.g. an HTML catalog page), and responses starting with
+        markup instead of a PDF, are aborted. Use [] to accept any type.
+        Aborted downloads are counted in the summary by reason
 
     Returns
     -------
@@ -56,6 +326,10 @@ def find_sds(cas_list: List[str], download_path: str = None, pool_size: int = 10
 
     # global debug
 
+    if all_sources and len(locales or []) > 1:
+        raise ValueError('all_sources saves the SDS of each source in the first locale only, '
+                         'it cannot be used with several locales')
+
     # If the list of CAS is empty, exit the program
     if not cas_list:
         print('List of CAS numbers is empty!')
@@ -78,62 +352,267 @@ def find_sds(cas_list: List[str], download_path: str = None, pool_size: int = 10
     # https://stackoverflow.com/questions/12517451/automatically-creating-directories-with-file-output
     # https://docs.python.org/3/library/os.html#os.makedirs
     os.makedirs(download_path, exist_ok=True)
+    library = _library(download_path, layout)
+
+    if http2 and not http2_available():
+        print("HTTP/2 needs httpx with HTTP/2 support (pip install 'httpx[http2]'): using HTTP/1.1")
+        http2 = False
 
     print('Downloading missing SDS files. Please wait!')
 
     download_result = []
-    try:
-        # # Using multithreading
-        if not debug:
-            with Pool(pool_size) as p:
-                download_result = p.map(partial(
-                                        download_sds,
-                                        download_path=download_path),
-                                    to_be_downloaded)
-        else:
-            download_result = []
-            for cas_nr in to_be_downloaded:
-                download_result.append(download_sds(cas_nr=cas_nr, download_path=download_path))
-    except Exception as error:
-        # if debug:
-        traceback_str = ''.join(traceback.format_exception(etype=type(error), value=error, tb=error.__traceback__))
-        print(traceback_str)
+    with Manager() as manager:
+        # Circuit breaker is shared by all workers so a dead provider is skipped everywhere
+        breaker = None
+        if breaker_failures:
+            breaker = CircuitBreaker(max_failures=breaker_failures, window=breaker_window,
+                                     cooldown=breaker_cooldown,
+                                     state=manager.dict(), lock=manager.Lock())
+        # Concurrency limit of each provider, grown and shrunk by all workers together
+        limiter = None
+        if adaptive:
+            limiter = AdaptiveLimiter(max_limit=pool_size, state=manager.dict(), lock=manager.Lock())
+        # Provider responses cached by each worker, hit/miss counts shared
+        cache = None
+        if response_cache_mb:
+            cache = ResponseCache(max_bytes=int(response_cache_mb * 2**20),
+                                  stats=manager.dict(), stats_lock=manager.Lock())
+        # Provider responses kept on disk, hit/miss counts shared
+        disk_cache = None
+        if http_cache_path:
+            disk_cache = DiskResponseCache(http_cache_path, max_bytes=int(http_cache_mb * 2**20),
+                                           default_ttl=http_cache_ttl,
+                                           stats=manager.dict(), stats_lock=manager.Lock())
+        # ChemicalSafety results of CAS numbers looked up in batches
+        batches = []
+        if chemicalsafety_batch_size:
+            pending = sorted(cas_nr for cas_nr in to_be_downloaded
+                             if all_sources or not library.find(cas_nr))
+            batches = [pending[i:i + chemicalsafety_batch_size]
+                       for i in range(0, len(pending), chemicalsafety_batch_size)]
+        # Hit rate of each provider, learned by all workers together
+        stats = None
+        if provider_stats_path or preferred:
+            stats = ProviderStats(provider_stats_path, state=manager.dict(), lock=manager.Lock())
+            stats.load()
+        # Spans of all processes, merged into `trace_path` at the end
+        trace_recorder = TraceRecorder(tempfile.mkdtemp(prefix='find_sds_trace_')) if trace_path else None
+        # Downloaded files written by threads of this process, workers only queue them
+        writer = WriteBehindWriter(queue_size=write_behind, tracer=trace_recorder) if write_behind else None
+        worker_state = {'circuit_breaker': breaker, 'concurrency_limiter': limiter,
+                        'response_cache': cache,
+                        'http_cache': disk_cache,
+                        'chemicalsafety_urls': manager.dict() if batches else None,
+                        'tci_client': TCIClient(),
+                        'probe_urls': probe,
+                        'catalog_index': CatalogIndex(catalog_path, max_age=catalog_max_age) if catalog_path else None,
+                        'provider_stats': stats,
+                        'preferred_providers': list(preferred or []),
+                        'connect_timeout': connect_timeout,
+                        'disk_writer': writer,
+                        'sds_locales': list(locales or [DEFAULT_LOCALE]),
+                        'profiler': WorkerProfiler(profile_path, profile) if profile else None,
+                        'tracer': trace_recorder,
+                        'http2_adapter': HTTP2Adapter() if http2 else None,
+                        'max_download_bytes': int(max_sds_mb * 2**20) or None,
+                        'sds_content_types': SDS_CONTENT_TYPES if content_types is None else list(content_types),
+                        'tasks_started': manager.dict()}
+        if profile:
+            worker_state['profiler'].clear()
+
+        progress = ProgressReporter(len(to_be_downloaded), workers=1 if debug else pool_size,
+                                    interval=progress_interval, snapshot_path=progress_path,
+                                    started=worker_state['tasks_started'])
+        task = partial(_download_task, download_path=download_path, deadline=cas_deadline,
+                       all_sources=all_sources)
 
+        try:
+            progress.start()
+            # # Using multithreading
+            if not debug:
+                with Pool(pool_size, initializer=_init_worker, initargs=(worker_state,)) as p:
+                    p.map(_prefetch_chemicalsafety, batches)
+                    for result, info in p.imap_unordered(task, to_be_downloaded):
+                        download_result.append(result)
+                        progress.update(**info)
+                    # Let the workers exit on their own, saving their profile
+                    p.close()
+                    p.join()
+            else:
+                previous_state = _init_worker(worker_state)
+                try:
+                    for batch in batches:
+                        _prefetch_chemicalsafety(batch)
+                    download_result = []
+                    for cas_nr in to_be_downloaded:
+                        result, info = task(cas_nr)
+                        download_result.append(result)
+                        progress.update(**info)
+                finally:
+                    if profiler:
+                        profiler.stop()
+                    _init_worker(previous_state)
+        except Exception as error:
+            # if debug:
+            traceback.print_exception(error)
 
-    # Step 2: print out summary
-    finally:
-        # Sometimes Pool worker return 'None', remove 'None' as the following
-        # print(download_result)
-        download_result = [x for x in download_result if x]
 
-        missing_sds = set()
-        updated_sds = set()
+        # Step 2: print out summary
+        finally:
+            progress_snapshot = progress.close()
+            # Wait for the files still being written
+            write_failures = writer.close() if writer else {}
 
-        for cas_nr, sds_existed, sds_source in download_result:
-            if sds_existed:
-                updated_sds.add(cas_nr)
-            else:
-                missing_sds.add(cas_nr)
+            # Sometimes Pool worker return 'None', remove 'None' as the following
+            # print(download_result)
+            download_result = [x for x in download_result if x]
+
+            missing_sds = set()
+            updated_sds = set()
+
+            for cas_nr, sds_existed, sds_source in download_result:
+                if sds_existed and cas_nr not in write_failures:
+                    updated_sds.add(cas_nr)
+                else:
+                    missing_sds.add(cas_nr)
+
+            for cas_nr, error in write_failures.items():
+                print(f'Could not write SDS of {cas_nr}: {error}')
+
+            index_counts = None
+            if index:
+                try:
+                    sds_index = SDSIndex(download_path)
+                    index_counts = sds_index.update(processes=pool_size)
+                    sds_index.close()
+                except (ImportError, sqlite3.Error) as error:
+                    print(f'Could not index SDS files: {error}')
+
+            if missing_sds:
+                print('\nStill missing SDS:\n{}'.format(missing_sds))
+
+            print('\nSummary: ')
+            print('\t{} SDS files are missing.'.format(len(missing_sds)))
+            print('\t{} SDS files downloaded.'.format(len(updated_sds)))
+
+            # Report providers that were skipped because of repeated errors
+            provider_health = breaker.summary() if breaker else {}
+            for provider, status in provider_health.items():
+                print('\t{}: skipped after repeated errors ({} time(s), {} lookup(s) skipped{}).'.format(
+                    provider, status['trips'], status['skipped'],
+                    ', still failing' if status['open'] else ''))
+
+            if cache:
+                print('\tResponse cache: {hits} hit(s), {misses} miss(es), {evictions} eviction(s).'.format(
+                    **cache.summary()))
+            if disk_cache:
+                print('\tHTTP cache on disk: {hits} hit(s), {misses} miss(es), {evictions} eviction(s).'.format(
+                    **disk_cache.summary()))
+
+            if index_counts:
+                print('\tSDS index: {indexed} file(s) indexed, {unchanged} unchanged, {removed} removed, '
+                      '{failed} unreadable.'.format(**index_counts))
+
+            if progress_snapshot['rejected']:
+                print('\tDownloads rejected: {}'.format(
+                    ', '.join(f'{reason}={count}' for reason, count in progress_snapshot['rejected'].items())))
+
+            if progress_snapshot['provider_hits']:
+                print('\tSDS downloaded from: {}'.format(
+                    ', '.join(f'{provider}={hits}' for provider, hits in progress_snapshot['provider_hits'].items())))
+
+            if stats:
+                stats.save()
+                print('\tProvider order: {}'.format(', '.join(stats.order(PROVIDERS, preferred=preferred))))
+
+            if trace_recorder:
+                trace_recorder.close()
+                spans = export_chrome_trace(trace_recorder.trace_dir, trace_path)
+                shutil.rmtree(trace_recorder.trace_dir, ignore_errors=True)
+                print('\tTimeline: {} span(s) saved to {}'.format(spans, trace_path))
+
+            if profile and profile_report(profile_path):
+                print('\tProfile of the workers: {}'.format(Path(profile_path) / 'report.txt'))
+
+            if limiter:
+                print('\tAdaptive concurrency settled at: {}'.format(
+                    ', '.join(f'{provider}={limit}' for provider, limit in limiter.limits().items())))
+
+            # Advice user about turning on debug mode for more error printing
+            if not debug:
+                print('\n\n(Optional): you can turn on debug mode (more error printing during search) using the following command:')
+                print('python find_sds/find_sds.py  --debug\n')
+
+            # All the program statements
+            stop = timeit.default_timer()
+            execution_time = stop - start
+
+            print(f"Program executed in {str(execution_time)} seconds.") # It returns time in seconds
 
-        if missing_sds:
-            print('\nStill missing SDS:\n{}'.format(missing_sds))
 
-        print('\nSummary: ')
-        print('\t{} SDS files are missing.'.format(len(missing_sds)))
-        print('\t{} SDS files downloaded.'.format(len(updated_sds)))
+def _init_worker(worker_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Install the state shared by all workers of a find_sds() run.
+    Used as the Pool initializer.
+
+    Parameters
+    ----------
+    worker_state : Dict[str, Any]
+        module-level names mapped to their values for this run
+
+    Returns
+    -------
+    Dict[str, Any]
+        the previous values, to restore the module state afterward
+    """
+    previous_state = {name: globals()[name] for name in worker_state}
+    globals().update(worker_state)
+    return previous_state
+
+
+def _download_task(cas_nr: str, download_path: str, deadline: float = None, all_sources: bool = False
+                   ) -> Tuple[Tuple[str, bool, Optional[str]], Dict[str, Any]]:
+    """Download the SDS of a chemical (Pool task), telling how it went for the progress report
+
+    Returns
+    -------
+    Tuple[Tuple[str, bool, Optional[str]], Dict[str, Any]]
+        - the result of download_sds()
+        - the keyword arguments of ProgressReporter.update()
+    """
+    count_started(tasks_started, os.getpid())
+    if profiler:
+        profiler.start()
+    info = {}
+    token = _download_info.set(info)
+    try:
+        with _span(cas_nr, 'cas') as span:
+            result = download_sds(cas_nr, download_path=download_path, deadline=deadline,
+                                  all_sources=all_sources)
+            span['downloaded'] = bool(result and result[1])
+    finally:
+        _download_info.reset(token)
+        if tracer:
+            tracer.flush()
+    if result is None:
+        return result, {'downloaded': False}
+    return result, {'downloaded': result[1], 'existed': result[1] and 'provider' not in info,
+                    **{key: value for key, value in info.items() if key in ['provider', 'size', 'rejected']}}
 
-        # Advice user about turning on debug mode for more error printing
-        if not debug:
-            print('\n\n(Optional): you can turn on debug mode (more error printing during search) using the following command:')
-            print('python find_sds/find_sds.py  --debug\n')
 
-        # All the program statements
-        stop = timeit.default_timer()
-        execution_time = stop - start
+def _prefetch_chemicalsafety(cas_list: List[str]) -> None:
+    """Look up ChemicalSafety results for a batch of CAS# into the shared
+    `chemicalsafety_urls` (Pool task)
 
-        print(f"Program executed in {str(execution_time)} seconds.") # It returns time in seconds
+    Parameters
+    ----------
+    cas_list : List[str]
+        CAS# for chemicals of interest
+    """
+    chemicalsafety_urls.update(extract_download_urls_from_chemicalsafety(cas_list, batch_size=len(cas_list)))
 
-def download_sds(cas_nr: str, download_path: str) -> Tuple[str, bool, Optional[str]]:
+
+def download_sds(cas_nr: str, download_path: str, deadline: float = None,
+                 refresh: bool = False, all_sources: bool = False) -> Tuple[str, bool, Optional[str]]:
     """Download SDS from variety of sources
 
     Parameters
@@ -142,6 +621,17 @@ def download_sds(cas_nr: str, download_path: str) -> Tuple[str, bool, Optional[s
         The CAS number of the molecule of interest
     download_path : str
         The path to download folder
+    deadline : float, optional
+        the longest time (in seconds) spent searching all providers and
+        downloading the SDS, by default None (no limit). Every request gets
+        the time left as its timeout
+    refresh : bool, optional
+        download the SDS again even if it exists, by default False.
+        The file is only rewritten if the new SDS differs
+    all_sources : bool, optional
+        search all providers at the same time and save the SDS of each source
+        as '<CAS>-<source>-SDS.pdf', by default False (first SDS found, saved
+        as '<CAS>-SDS.pdf'). The other locales of `sds_locales` are then not downloaded
 
     Returns
     -------
@@ -149,6 +639,7 @@ def download_sds(cas_nr: str, download_path: str) -> Tuple[str, bool, Optional[s
         - str: CAS number of the input chemical
         - bool: True if SDS file downloaded or exists
         - Optional[str]: the name of the SDS source or None
+          (in `all_sources` mode: the names of the sources downloaded, comma-separated)
     """
 
     # global debug
@@ -158,11 +649,20 @@ def download_sds(cas_nr: str, download_path: str) -> Tuple[str, bool, Optional[s
     # Set initial return value for if SDS is downloaded (or existed)
     downloaded = False
 
+    library = _library(download_path)
+    if all_sources:
+        return _download_all_sources(cas_nr, library, deadline=deadline, refresh=refresh)
+    # One deadline for the SDS in all locales
+    deadline_at = time.monotonic() + deadline if deadline else None
+    if len(sds_locales) > 1:
+        _download_locales(cas_nr, library, sds_locales[1:], deadline_at=deadline_at, refresh=refresh)
+
     file_name = cas_nr + '-SDS.pdf'
-    download_file = Path(download_path) / file_name
+    download_file = library.path(cas_nr)
+    existing_file = library.find(cas_nr)
     # Check if the file not exists and download
     # check file exists: https://stackoverflow.com/questions/82831/how-do-i-check-whether-a-file-exists
-    if download_file.exists():
+    if existing_file and not refresh:
         # print('{} already downloaded'.format(file_name))
         # print('.', end='')
         downloaded = True
@@ -170,29 +670,39 @@ def download_sds(cas_nr: str, download_path: str) -> Tuple[str, bool, Optional[s
 
     else:
         print('\nSearching for {} ...'.format(file_name))
-        headers = {
-            'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.192 Safari/537.36'}
 
+        deadline_token = _deadline.set(deadline_at)
+        catalog_token = _catalog_url.set(None)
         try:
             # print('CAS {} ...'.format(file_name))
-            sds_source, full_url = (
-                extract_download_url_from_chemblink(cas_nr) or \
-                extract_download_url_from_vwr(cas_nr) or \
-                extract_download_url_from_fisher(cas_nr) or \
-                extract_download_url_from_tci(cas_nr) or \
-                extract_download_url_from_chemicalsafety(cas_nr) or \
-                extract_download_url_from_fluorochem(cas_nr) or \
-                (None, None)
-            )
+            provider, sds_source, full_url = _find_download_url(cas_nr)
             # sds_source, full_url = extract_download_url_from_tci(cas_nr)
 
+            # A URL of the catalog index that is gone is removed, and the providers are searched again
+            content = None
+            while full_url and full_url == _catalog_url.get():
+                try:
+                    content = _download_content(cas_nr, provider, full_url)
+                except (DownloadRejected, requests.ConnectionError, requests.HTTPError):
+                    content = None
+                if content is not None:
+                    break
+                print('\nSDS URL of {} in the catalog index is gone: {}'.format(cas_nr, full_url))
+                _catalog_drop(provider, cas_nr, full_url)
+                _catalog_url.set(None)
+                provider, sds_source, full_url = _find_download_url(cas_nr)
+
             # print('full url is: {}'.format(full_url))
             if full_url:    # extract with chemicalsafety
-                r = requests.get(full_url, headers=headers, timeout=20)
-                # Check to see if give OK status (200) and not redirect
-                if r.status_code == 200 and len(r.history) == 0:
+                if content is None:
+                    content = _download_content(cas_nr, provider, full_url)
+                if content is not None:
                     # print('\nDownloading {} ...'.format(file_name))
-                    open(download_file, 'wb').write(r.content)
+                    with _measure('write'), _span('write', 'write', cas=cas_nr):
+                        changed = _save_sds(cas_nr, download_file, existing_file, content)
+                    info = _download_info.get()
+                    if info is not None:
+                        info.update(provider=provider, size=len(content), changed=changed)
                     # print()
                     # return (0, sds_source)
                     downloaded = True
@@ -203,11 +713,678 @@ def download_sds(cas_nr: str, download_path: str) -> Tuple[str, bool, Optional[s
                 return (cas_nr, downloaded, None)
 
         except Exception as error:
+            if isinstance(error, DownloadRejected):
+                print('\nRejected SDS of {}: {}'.format(cas_nr, error))
+                info = _download_info.get()
+                if info is not None:
+                    info['rejected'] = error.reason
             if debug:
                 # traceback_str = ''.join(traceback.format_exception(etype=type(error), value=error, tb=error.__traceback__))
                 # print(traceback_str)
                 traceback.print_exception(error)
             return (cas_nr, downloaded, None)
+        finally:
+            _catalog_url.reset(catalog_token)
+            _deadline.reset(deadline_token)
+
+
+def _download_content(cas_nr: str, provider: str, full_url: str) -> Optional[bytes]:
+    """Download the SDS file found by a provider, without saving it
+
+    Returns
+    -------
+    Optional[bytes]
+        the SDS file, None if the server did not send it (error status or redirect)
+    """
+    with _measure('download'), _span('download', 'download', cas=cas_nr, provider=provider) as span:
+        # Streamed: the response is closed even when its body is not read
+        with _fetch('get', full_url, provider=provider, cache=False, limit=False, headers=DOWNLOAD_HEADERS,
+                    timeout=20, stream=True) as r:
+            # Check to see if give OK status (200) and not redirect
+            content = _read_sds(r) if r.status_code == 200 and len(r.history) == 0 else None
+        span['size'] = len(content) if content is not None else None
+    return content
+
+
+def _measure(stage: str):
+    """Count the time and memory of a stage in the profile of the worker, if it is profiled"""
+    return profiler.measure(stage) if profiler else nullcontext()
+
+
+def _span(name: str, category: str, **args):
+    """Record a span in the timeline of the run, if it is traced (see tracing.py)"""
+    return tracer.span(name, category, **args) if tracer else nullcontext(args)
+
+
+def _save_sds(cas_nr: str, download_file: Path, existing_file: Optional[Path], content: bytes) -> bool:
+    """Save a downloaded SDS, through `disk_writer` when it is set.
+    A refreshed SDS replaces the existing file where it is, and is not written again if unchanged
+
+    Returns
+    -------
+    bool
+        True if the file is new or changed
+    """
+    if existing_file and existing_file.read_bytes() == content:
+        return False
+    download_file = existing_file or download_file
+    if disk_writer:
+        disk_writer.submit(cas_nr, download_file, content)
+    else:
+        download_file.parent.mkdir(parents=True, exist_ok=True)
+        open(download_file, 'wb').write(content)
+    return True
+
+
+def _download_all_sources(cas_nr: str, library: SDSLibrary, deadline: float = None,
+                          refresh: bool = False) -> Tuple[str, bool, Optional[str]]:
+    """Download the SDS of a chemical from every source, see `all_sources` of download_sds().
+    Providers are searched, and SDS downloaded, at the same time by threads sharing
+    the worker state (sessions, caches, circuit breaker, concurrency limits).
+    A SDS found by several providers (same URL or same content) is saved once
+
+    Returns
+    -------
+    Tuple[str, bool, Optional[str]]
+        see download_sds()
+    """
+    print('\nSearching all providers for {} ...'.format(cas_nr))
+    deadline_token = _deadline.set(time.monotonic() + deadline if deadline else None)
+    try:
+        # One file for each source, from the first provider (in search order) that found it
+        found = {}
+        for provider, sds_source, full_url in _find_download_urls(cas_nr):
+            found.setdefault(source_file_name(cas_nr, sds_source or provider), (provider, sds_source, full_url))
+        existing = {file_name: library.find(cas_nr, file_name) for file_name in found}
+        to_download = {file_name: found[file_name] for file_name in found if refresh or not existing[file_name]}
+
+        def download(provider: str, full_url: str) -> Optional[bytes]:
+            try:
+                with _span('download', 'download', cas=cas_nr, provider=provider):
+                    with _fetch('get', full_url, provider=provider, cache=False, limit=False,
+                                headers=DOWNLOAD_HEADERS, timeout=20, stream=True) as r:
+                        if r.status_code == 200 and len(r.history) == 0:
+                            return _read_sds(r)
+            except Exception as error:
+                if debug:
+                    traceback.print_exception(error)
+            return None
+
+        with ThreadPoolExecutor(max_workers=len(to_download) or 1) as executor:
+            contents = {file_name: executor.submit(copy_context().run, download, provider, full_url)
+                        for file_name, (provider, sds_source, full_url) in to_download.items()}
+            contents = {file_name: future.result() for file_name, future in contents.items()}
+
+        # Also skip SDS identical to an existing file of another source
+        saved, sizes, changed = [], 0, False
+        hashes = {hashlib.sha1(path.read_bytes()).digest() for file_name, path in existing.items()
+                  if path and file_name not in contents}
+        for file_name, content in contents.items():
+            if content is None or hashlib.sha1(content).digest() in hashes:
+                continue
+            hashes.add(hashlib.sha1(content).digest())
+            changed |= _save_sds(cas_nr, library.path(cas_nr, file_name), existing[file_name], content)
+            saved.append(found[file_name])
+            sizes += len(content)
+
+        info = _download_info.get()
+        if info is not None and saved:
+            info.update(provider=saved[0][0], size=sizes, changed=changed)
+        downloaded = bool(saved) or any(existing.values())
+        return cas_nr, downloaded, ', '.join(sds_source or provider for provider, sds_source, _ in saved) or None
+    finally:
+        _deadline.reset(deadline_token)
+
+
+def parse_locale(locale: str) -> Tuple[str, str]:
+    """Split a locale into language and country
+
+    Examples
+    --------
+    >>> parse_locale('ja-JP')
+    ('ja', 'JP')
+    >>> parse_locale('de')
+    ('de', 'DE')
+    """
+    language, _, country = locale.replace('_', '-').partition('-')
+    return language.lower(), (country or language).upper()
+
+
+def _download_locales(cas_nr: str, library: SDSLibrary, locales: List[str], deadline_at: float = None,
+                      refresh: bool = False) -> List[str]:
+    """Download the SDS of a chemical in other locales, saved as '<CAS>-<locale>-SDS.pdf'.
+    The providers of `LOCALE_PROVIDERS` are searched in order for the locales not found yet,
+    each for all of these locales at once
+
+    Parameters
+    ----------
+    cas_nr : str
+        CAS# for chemical of interest
+    library : SDSLibrary
+        the SDS files of the download folder
+    locales : List[str]
+        e.g. ['de-DE', 'ja-JP']
+    deadline_at : float, optional
+        the time (time.monotonic()) by which the CAS number must be done, shared
+        with the SDS of the first locale, by default None (no limit)
+    refresh : bool, optional
+        see download_sds()
+
+    Returns
+    -------
+    List[str]
+        the locales downloaded
+    """
+    file_names = {locale: f'{cas_nr}-{locale}-SDS.pdf' for locale in locales}
+    missing = [locale for locale in locales if refresh or not library.find(cas_nr, file_names[locale])]
+    downloaded = []
+    deadline_token = _deadline.set(deadline_at)
+    try:
+        for provider in LOCALE_PROVIDERS:
+            if not missing or _deadline_passed():
+                break
+            if circuit_breaker and not circuit_breaker.allow(provider):
+                continue
+            provider_token = _current_provider.set(provider)
+            try:
+                urls = globals()[f'extract_localized_urls_from_{provider}'](cas_nr, missing)
+            finally:
+                _current_provider.reset(provider_token)
+            for locale, (sds_source, full_url) in urls.items():
+                try:
+                    with _fetch('get', full_url, provider=provider, cache=False, limit=False,
+                                headers=DOWNLOAD_HEADERS, timeout=20, stream=True) as r:
+                        if r.status_code == 200 and len(r.history) == 0:
+                            _save_sds(cas_nr, library.path(cas_nr, file_names[locale]),
+                                      library.find(cas_nr, file_names[locale]), _read_sds(r))
+                            downloaded.append(locale)
+                            missing.remove(locale)
+                except Exception as error:
+                    if debug:
+                        traceback.print_exception(error)
+    finally:
+        _deadline.reset(deadline_token)
+    return downloaded
+
+
+def _library(download_path: str, layout: Optional[str] = None) -> SDSLibrary:
+    """Get the SDS files of a download folder, with the layout recorded in it
+
+    Parameters
+    ----------
+    download_path : str
+        the download folder
+    layout : Optional[str], optional
+        the layout to use, recorded in the folder if it has no SDS files yet,
+        by default None (the recorded layout)
+
+    Returns
+    -------
+    SDSLibrary
+
+    Raises
+    ------
+    ValueError
+        if `layout` differs from the layout of SDS files already in the folder
+    """
+    key = str(download_path)
+    if key not in _libraries or layout:
+        library = SDSLibrary.open(download_path)
+        if layout and layout != library.layout:
+            if next(library.files(), None):
+                raise ValueError(f'{download_path} has SDS files in the {library.layout!r} layout, '
+                                 f'move them with: python -m find_sds.storage migrate {download_path} '
+                                 f'--layout {layout}')
+            library = SDSLibrary(download_path, layout)
+            library.save_layout()
+        _libraries[key] = library
+    return _libraries[key]
+
+
+def _read_sds(response: requests.Response) -> bytes:
+    """Read a downloaded SDS file, giving up as soon as the headers or the
+    first bytes show it is not one, or when it passes `max_download_bytes`
+
+    Parameters
+    ----------
+    response : requests.Response
+        sent with `stream=True`
+
+    Returns
+    -------
+    bytes
+
+    Raises
+    ------
+    DownloadRejected
+        ResponseTooLarge or UnexpectedContentType
+    DeadlineExceeded
+        if the deadline passed before the whole file was read
+    """
+    with response:
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type and sds_content_types and content_type not in sds_content_types:
+            raise UnexpectedContentType(f'Content-Type {content_type} instead of a PDF: {response.url}',
+                                        response=response)
+        content_length = response.headers.get('Content-Length', '')
+        if max_download_bytes and content_length.isdigit() and int(content_length) > max_download_bytes:
+            raise ResponseTooLarge(f'{int(content_length) / 2**20:.1f} MB announced, more than '
+                                   f'{max_download_bytes / 2**20:.1f} MB: {response.url}', response=response)
+        return _read_content(response, max_bytes=max_download_bytes, pdf=True)
+
+
+def _read_content(response: requests.Response, chunk_size: int = 65536, max_bytes: Optional[int] = None,
+                  pdf: bool = False) -> bytes:
+    """Read the body of a streamed response, giving up when the deadline of
+    the CAS number has passed (a server trickling data never times out)
+
+    Parameters
+    ----------
+    response : requests.Response
+        sent with `stream=True`
+    chunk_size : int, optional
+        by default 64 kB
+    max_bytes : Optional[int], optional
+        give up once the body is larger, by default None (no limit)
+    pdf : bool, optional
+        give up if the body starts with markup (e.g. an HTML page) instead of a PDF,
+        by default False
+
+    Returns
+    -------
+    bytes
+
+    Raises
+    ------
+    DeadlineExceeded
+        if the deadline passed before the whole body was read
+    ResponseTooLarge
+        if the body is larger than `max_bytes`
+    UnexpectedContentType
+        if `pdf` and the body is markup
+    """
+    chunks = []
+    size = 0
+    checked = not pdf
+    with response:
+        for chunk in response.iter_content(chunk_size):
+            chunks.append(chunk)
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise ResponseTooLarge(f'More than {max_bytes / 2**20:.1f} MB: {response.url}')
+            if not checked:
+                # A PDF never starts with markup: HTML error or catalog page sent with a 200 status
+                head = b''.join(chunks).lstrip()
+                if head:
+                    checked = True
+                    if head[:1] == b'<':
+                        raise UnexpectedContentType(f'Markup ({head[:20]!r}) instead of a PDF: {response.url}')
+            if _deadline_passed():
+                raise DeadlineExceeded(f'Deadline passed while downloading {response.url}')
+    return b''.join(chunks)
+
+
+def _time_left() -> Optional[float]:
+    """Get the time (in seconds) left before the deadline of the CAS number
+    being looked up, None if there is no deadline"""
+    deadline = _deadline.get()
+    return deadline - time.monotonic() if deadline is not None else None
+
+
+def _deadline_passed() -> bool:
+    time_left = _time_left()
+    return time_left is not None and time_left <= 0
+
+
+def _request_timeout(timeout) -> Optional[Tuple[float, float]]:
+    """Split the timeout of a request into (connect, read) timeouts, capped by
+    `connect_timeout` and by the time left before the deadline
+
+    Parameters
+    ----------
+    timeout : Optional[float | Tuple[float, float]]
+        as passed to `requests.get()`
+
+    Returns
+    -------
+    Optional[Tuple[float, float]]
+
+    Raises
+    ------
+    DeadlineExceeded
+        if the deadline has passed
+    """
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    if connect_timeout:
+        connect = min(connect, connect_timeout) if connect else connect_timeout
+
+    time_left = _time_left()
+    if time_left is not None:
+        if time_left <= 0:
+            raise DeadlineExceeded('Deadline passed for this CAS number')
+        connect = min(connect, time_left) if connect else time_left
+        read = min(read, time_left) if read else time_left
+
+    if connect is None and read is None:
+        return None
+    return connect, read
+
+
+def _find_download_url(cas_nr: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Search the providers in order for url to download SDS for chemical with cas_nr.
+    The order is learned from `provider_stats` when it is set
+
+    Parameters
+    ----------
+    cas_nr : str
+        CAS# for chemical of interest
+
+    Returns
+    -------
+    Tuple[Optional[str], Optional[str], Optional[str]]
+        - the name of the provider that found the SDS, one of `PROVIDERS`
+        - the name of the SDS source
+        - the URL of the SDS file
+        (None, None, None) if URL cannot be found
+    """
+    providers = provider_stats.order(PROVIDERS, cas_nr, preferred_providers) if provider_stats else PROVIDERS
+    for provider in providers:
+        if _deadline_passed():
+            if debug:
+                print(f'Deadline passed for {cas_nr}, not searching {provider} and later providers')
+            break
+        sds_source, full_url = _search_provider(provider, cas_nr) or (None, None)
+        if full_url:
+            return provider, sds_source, full_url
+    return None, None, None
+
+
+def _find_download_urls(cas_nr: str) -> List[Tuple[str, Optional[str], str]]:
+    """Search all providers at the same time for urls to download SDS for chemical with cas_nr
+
+    Parameters
+    ----------
+    cas_nr : str
+        CAS# for chemical of interest
+
+    Returns
+    -------
+    List[Tuple[str, Optional[str], str]]
+        the provider, the name of the SDS source and the URL of each SDS found,
+        in the search order of the providers (see _find_download_url()), without duplicate URLs
+    """
+    providers = provider_stats.order(PROVIDERS, cas_nr, preferred_providers) if provider_stats else PROVIDERS
+
+    def search(provider: str) -> Optional[Tuple[str, str]]:
+        try:
+            return _search_provider(provider, cas_nr)
+        except Exception as error:
+            if debug:
+                traceback.print_exception(error)
+
+    # Each thread runs in a copy of the context: same deadline and download info, its own provider
+    with ThreadPoolExecutor(max_workers=len(providers)) as executor:
+        futures = [executor.submit(copy_context().run, search, provider) for provider in providers]
+        results = [future.result() for future in futures]
+
+    urls = []
+    for provider, result in zip(providers, results):
+        sds_source, full_url = result or (None, None)
+        if full_url and full_url not in [url for _, _, url in urls]:
+            urls.append((provider, sds_source, full_url))
+    return urls
+
+
+def _search_provider(provider: str, cas_nr: str) -> Optional[Tuple[str, str]]:
+    """Search for url to download SDS for chemical with cas_nr from a single provider.
+    Providers that keep failing are skipped (see `CircuitBreaker`)
+
+    Parameters
+    ----------
+    provider : str
+        the name of the provider, one of `PROVIDERS`
+    cas_nr : str
+        CAS# for chemical of interest
+
+    Returns
+    -------
+    Optional[Tuple[str, str]]
+        the result of `extract_download_url_from_<provider>()`,
+        None if the provider is skipped
+    """
+    if circuit_breaker and not circuit_breaker.allow(provider):
+        if debug:
+            print(f'Skipping {provider}: too many recent errors')
+        return None
+
+    # The SDS URL is already known: no search needed
+    entry = next((entry for entry in _catalog_lookup(cas_nr, provider) if entry['sds_url']), None)
+    if entry:
+        _catalog_url.set(entry['sds_url'])
+        return entry['source'] or provider, entry['sds_url']
+
+    provider_token = _current_provider.set(provider)
+    error_token = _provider_error.set(None)
+    start = time.monotonic()
+    try:
+        with _measure(f'search:{provider}'), _span(provider, 'search', cas=cas_nr) as span:
+            result = globals()[f'extract_download_url_from_{provider}'](cas_nr)
+            span['found'] = bool(result and result[1])
+    except Exception:
+        # Running out of time for this CAS number is not the provider's fault
+        if _deadline_passed():
+            if circuit_breaker:
+                circuit_breaker.record_unknown(provider)
+            raise
+        if circuit_breaker:
+            circuit_breaker.record_failure(provider)
+        if provider_stats:
+            provider_stats.record(provider, cas_nr, hit=False, search_time=time.monotonic() - start)
+        raise
+    else:
+        hit = bool(result and result[1])
+        if not hit and _deadline_passed():
+            if circuit_breaker:
+                circuit_breaker.record_unknown(provider)
+            return result
+        if provider_stats:
+            provider_stats.record(provider, cas_nr, hit=hit, search_time=time.monotonic() - start)
+        if circuit_breaker:
+            if _provider_error.get():
+                circuit_breaker.record_failure(provider)
+            else:
+                circuit_breaker.record_success(provider)
+        if result and result[1]:
+            _catalog_add(provider, cas_nr, sds_url=result[1], source=result[0])
+        return result
+    finally:
+        _provider_error.reset(error_token)
+        _current_provider.reset(provider_token)
+
+
+def _catalog_lookup(cas_nr: str, provider: str) -> List[Dict]:
+    """Get the entries of `catalog_index` for a chemical at a provider
+
+    Parameters
+    ----------
+    cas_nr : str
+        CAS# for chemical of interest
+    provider : str
+        the name of the provider, one of `PROVIDERS`
+
+    Returns
+    -------
+    List[Dict]
+        see CatalogIndex.lookup(), empty if there is no index
+    """
+    if not catalog_index:
+        return []
+    try:
+        return catalog_index.lookup(cas_nr, provider)
+    except sqlite3.Error as error:
+        if debug:
+            traceback.print_exception(error)
+        return []
+
+
+def _catalog_drop(provider: str, cas_nr: str, sds_url: str) -> None:
+    """Remove an SDS URL that could not be downloaded from `catalog_index`"""
+    if not catalog_index:
+        return
+    try:
+        catalog_index.remove(cas_nr, provider, sds_url=sds_url)
+    except sqlite3.Error as error:
+        if debug:
+            traceback.print_exception(error)
+
+
+def _catalog_add(provider: str, cas_nr: str, **entry) -> None:
+    """Add what a provider search found (product number and/or SDS URL) to `catalog_index`"""
+    if not catalog_index:
+        return
+    try:
+        catalog_index.add([{'vendor': provider, 'cas': cas_nr, **entry}])
+    except sqlite3.Error as error:
+        if debug:
+            traceback.print_exception(error)
+
+
+def _fetch(method: str, url: str, session: Optional[requests.Session] = None,
+           provider: Optional[str] = None, cache: bool = True, limit: bool = True,
+           probe: bool = False, **kwargs) -> requests.Response:
+    """Send an HTTP request on behalf of an SDS provider.
+    Server errors (5xx) and throttling (429) count as an error of the provider.
+    In adaptive mode, waits for a free request slot of the provider first.
+    Responses are answered from / stored in `response_cache` and `http_cache` when they are set
+
+    Parameters
+    ----------
+    method : str
+        'get' or 'post'
+    url : str
+        the url of the request
+    session : Optional[requests.Session], optional
+        the session used to send the request, by default None (no session)
+    provider : Optional[str], optional
+        the provider the request is sent for,
+        by default None: the provider currently searched by _search_provider()
+    cache : bool, optional
+        use the response cache for this request, by default True
+    limit : bool, optional
+        take a request slot of the provider in adaptive mode, by default True.
+        False for SDS downloads, usually from another host than the provider's search
+    probe : bool, optional
+        the request only checks that a URL exists (see _probe_url()): its latency
+        is not used to adapt the concurrency limit of the provider, by default False
+    **kwargs
+        passed to `requests.get()` / `requests.post()`
+
+    Returns
+    -------
+    requests.Response
+    """
+    cache_key = None
+    if (response_cache or http_cache) and cache:
+        cache_key = make_cache_key(method, url, params=kwargs.get('params'),
+                                   data=kwargs.get('data'), json=kwargs.get('json'))
+        cached = response_cache.get(cache_key) if response_cache else None
+        if not cached and http_cache:
+            cached = http_cache.get(cache_key)
+            if cached and response_cache:
+                response_cache.put(cache_key, cached[0])
+        if cached:
+            response, cookies = cached
+            # Later requests of the session may depend on cookies set by this response
+            if session is not None and cookies:
+                session.cookies.update(cookies)
+            return response
+
+    # Requests sent over the network, for the budget of refresh runs
+    info = _download_info.get()
+    if info is not None:
+        info['requests'] = info.get('requests', 0) + 1
+
+    if connect_timeout or _deadline.get() is not None:
+        kwargs['timeout'] = _request_timeout(kwargs.get('timeout'))
+
+    provider = provider or _current_provider.get()
+    limiter = concurrency_limiter if provider and limit else None
+    if limiter:
+        with _span(provider, 'wait', url=url):
+            lease = limiter.acquire(provider, timeout=_time_left())
+        if lease is None:
+            raise DeadlineExceeded(f'Deadline passed waiting for a request slot of {provider}')
+
+    sender = session or http_session
+    if http2_adapter:
+        # Requests without a session of their own share the connections of the process too
+        sender = http2_adapter.mount(sender or requests.Session())
+
+    start = time.monotonic()
+    response = None
+    try:
+        response = getattr(sender or requests, method)(url, **kwargs)
+    finally:
+        if limiter:
+            limiter.release(provider, None if probe else time.monotonic() - start,
+                            response.status_code if response is not None else None, lease=lease)
+
+    if response.status_code == 429 or response.status_code >= 500:
+        _provider_error.set(requests.HTTPError(f'{response.status_code} Error for url: {url}', response=response))
+    elif cache_key:
+        if response_cache:
+            response_cache.put(cache_key, response)
+        if http_cache:
+            http_cache.put(cache_key, response)
+    return response
+
+
+def _probe_url(url: str, headers: Optional[Dict[str, str]] = None,
+               session: Optional[requests.Session] = None, timeout: float = 10) -> Optional[bool]:
+    """Check if a page or file exists without downloading it:
+    HEAD request, or GET of the first 1 KB if the server does not answer HEAD requests
+
+    Parameters
+    ----------
+    url : str
+    headers : Optional[Dict[str, str]], optional
+        by default None
+    session : Optional[requests.Session], optional
+        by default None
+    timeout : float, optional
+        by default 10
+
+    Returns
+    -------
+    Optional[bool]
+        True if it exists,
+        False if it does not (4xx or redirect, which the downloads reject),
+        None if unknown
+    """
+    r = _fetch('head', url, session=session, probe=True, headers=headers, timeout=timeout)
+    if r.status_code in (405, 501):
+        r = _fetch('get', url, session=session, cache=False, probe=True, stream=True, timeout=timeout,
+                   headers={**(headers or {}), 'Range': 'bytes=0-1023'})
+        r.close()
+
+    if r.status_code in (200, 206):
+        return True
+    if 300 <= r.status_code < 500 and r.status_code not in (401, 403, 408, 429):
+        return False
+    return None
+
+
+def _report_provider_error(error: Exception) -> None:
+    """Handle an error caught while searching a provider:
+    print it out in debug mode and count it as an error of the provider
+
+    Parameters
+    ----------
+    error : Exception
+    """
+    if debug:
+        traceback.print_exception(error)
+    _provider_error.set(error)
 
 
 def extract_download_url_from_chemblink(cas_nr: str) -> Optional[Tuple[str, str]]:
@@ -246,35 +1423,51 @@ def extract_download_url_from_chemblink(cas_nr: str) -> Optional[Tuple[str, str]
         print('Searching on https://www.chemblink.com')
 
     try:
-        r1 = requests.get(extract_info_url, headers=headers, timeout=20)
+        # Most CAS numbers have no page on chemblink: skip them without downloading the page
+        if probe_urls and _probe_url(extract_info_url, headers=headers) is False:
+            return
+
+        r1 = _fetch('get', extract_info_url, headers=headers, timeout=20)
         # print(r1)
 
         # Check to see if give OK status (200) and not redirect
         if r1.status_code == 200 and len(r1.history) == 0:
-            soup = BeautifulSoup(r1.text, 'html.parser')
-            if soup:
-                # Find all <a> tags with content "View / download", example: https://www.chemblink.com/MSDS/64-19-7_MSDS.htm
-                # Example of a correct <a> tag for SDS download: '<a href="/MSDS/MSDSFiles/64-19-7_Alfa-Aesar.pdf" class="blue" onclick="blur()" target="_blank">View / download</a>'
-                a_tags = soup.find_all('a', string=re.compile(r'View / download'))
-                if a_tags:
-                    domain = 'https://www.chemblink.com'
-                    sds_link = a_tags[0]['href']
-                    # # Get source name from sds_link, example of sds_link href: '/MSDS/MSDSFiles/64-19-7_Alfa-Aesar.pdf' (before Jul 21 2024)
-                    # source = re.search(r'\S+_(\S*)\.pdf', sds_link).group(1)
-                    # Get source name from sds_link, example of sds_link href: '/MSDS/MSDSFiles/64-19-7Alfa-Aesar.pdf'
-                    source = re.search(r'([a-zA-Z\-]+)\.pdf', sds_link).group(1)
-                    full_url = f'{domain}{sds_link}'
-                    return source, full_url
+            return parse_chemblink_page(r1.text)
 
     except Exception as error:
         # print('.', end='')
-        if debug:
-            # traceback_str = ''.join(traceback.format_exception(etype=type(error), value=error, tb=error.__traceback__))
-            # print(traceback_str)
-            traceback.print_exception(error)
+        _report_provider_error(error)
         # return None
 
 
+def parse_chemblink_page(text: str) -> Optional[Tuple[str, str]]:
+    """Get the SDS source and URL from the MSDS page of a chemical on ChemBlink
+
+    Parameters
+    ----------
+    text : str
+        the page, e.g. https://www.chemblink.com/MSDS/64-19-7MSDS.htm
+
+    Returns
+    -------
+    Optional[Tuple[str, str]]
+        the name of the SDS source and the URL of the SDS file, None if there is no SDS link
+    """
+    soup = BeautifulSoup(text, 'html.parser')
+    # Find all <a> tags with content "View / download", example: https://www.chemblink.com/MSDS/64-19-7_MSDS.htm
+    # Example of a correct <a> tag for SDS download: '<a href="/MSDS/MSDSFiles/64-19-7_Alfa-Aesar.pdf" class="blue" onclick="blur()" target="_blank">View / download</a>'
+    a_tags = soup.find_all('a', string=re.compile(r'View / download'))
+    if a_tags:
+        domain = 'https://www.chemblink.com'
+        sds_link = a_tags[0]['href']
+        # # Get source name from sds_link, example of sds_link href: '/MSDS/MSDSFiles/64-19-7_Alfa-Aesar.pdf' (before Jul 21 2024)
+        # source = re.search(r'\S+_(\S*)\.pdf', sds_link).group(1)
+        # Get source name from sds_link, example of sds_link href: '/MSDS/MSDSFiles/64-19-7Alfa-Aesar.pdf'
+        source = re.search(r'([a-zA-Z\-]+)\.pdf', sds_link).group(1)
+        full_url = f'{domain}{sds_link}'
+        return source, full_url
+
+
 def extract_download_url_from_vwr(cas_nr: str) -> Optional[Tuple[str, str]]:
     """Search for url to download SDS for chemical with cas_nr
     from https://us.vwr.com/store/search/searchMSDS.jsp
@@ -313,30 +1506,10 @@ def extract_download_url_from_vwr(cas_nr: str) -> Optional[Tuple[str, str]]:
 
     try:
         with requests.Session() as s1:
-            get_id = s1.get(adv_search_url, headers=headers, params=params, timeout=10)
+            get_id = _fetch('get', adv_search_url, session=s1, headers=headers, params=params, timeout=10)
 
             if get_id.status_code == 200 and len(get_id.history) == 0:
-                html = BeautifulSoup(get_id.text, 'html.parser')
-                # print(html.prettify())
-
-                result_count_css = '.clearfix .pull-left'
-                result_count = re.search(r'(\d+).*results were found', html.select(result_count_css)[0].text)[1]
-                # print(result_count)
-
-                # Check to make sure that there is at least 1 hit
-                if result_count:
-                    # Find first product
-                    sds_link_css = 'td[data-title="SDS"] a'
-                    sds_links = html.select(sds_link_css)
-                    # print(sds_links[0]['href'])
-                    full_url = sds_links[0]['href']
-
-                    sds_manufacturer_css = 'td[data-title="Manufacturer"]'
-                    sds_manufacturers = html.select(sds_manufacturer_css)
-                    # print(sds_manufacturers[0].text)
-                    sds_source = sds_manufacturers[0].text.strip()
-
-                    return sds_source, full_url
+                return parse_vwr_page(get_id.text)
 
                 #     full_url = sds_links[0]['href']
                 #     sds = s1.get(full_url)
@@ -348,13 +1521,46 @@ def extract_download_url_from_vwr(cas_nr: str) -> Optional[Tuple[str, str]]:
                 #         open('vwr0.pdf', 'wb').write(sds.content)
 
     except Exception as error:
-        if debug:
-            # traceback_str = ''.join(traceback.format_exception(etype=type(error), value=error, tb=error.__traceback__))
-            # print(traceback_str)
-            traceback.print_exception(error)
+        _report_provider_error(error)
         # return (cas_nr, downloaded, None)
 
 
+def parse_vwr_page(text: str) -> Optional[Tuple[str, str]]:
+    """Get the SDS source and URL of the first product of a VWR SDS search
+
+    Parameters
+    ----------
+    text : str
+        the search page, e.g. https://us.vwr.com/store/msds?keyword=64-19-7
+
+    Returns
+    -------
+    Optional[Tuple[str, str]]
+        the name of the SDS source (the manufacturer) and the URL of the SDS file, None if nothing was found
+    """
+    html = BeautifulSoup(text, 'html.parser')
+    # print(html.prettify())
+
+    result_count_css = '.clearfix .pull-left'
+    result_count = re.search(r'(\d+).*results were found', html.select(result_count_css)[0].text)[1]
+    # print(result_count)
+
+    # Check to make sure that there is at least 1 hit
+    if result_count:
+        # Find first product
+        sds_link_css = 'td[data-title="SDS"] a'
+        sds_links = html.select(sds_link_css)
+        # print(sds_links[0]['href'])
+        full_url = sds_links[0]['href']
+
+        sds_manufacturer_css = 'td[data-title="Manufacturer"]'
+        sds_manufacturers = html.select(sds_manufacturer_css)
+        # print(sds_manufacturers[0].text)
+        sds_source = sds_manufacturers[0].text.strip()
+
+        return sds_source, full_url
+
+
 def extract_download_url_from_fisher(cas_nr: str) -> Optional[Tuple[str, str]]:
     """Search for url to download SDS for chemical with cas_nr
     from https://www.fishersci.com
@@ -394,44 +1600,59 @@ def extract_download_url_from_fisher(cas_nr: str) -> Optional[Tuple[str, str]]:
         print('Searching on https://www.fishersci.com/us/en/catalog/search/sdshome.html')
 
     try:
-        r = requests.get(extract_info_url, headers=headers, timeout=10, params=payload)
+        r = _fetch('get', extract_info_url, headers=headers, timeout=10, params=payload)
         # Check to see if give OK status (200) and not redirect
         if r.status_code == 200 and len(r.history) == 0:
-            # BeautifulSoup ref: https://www.digitalocean.com/community/tutorials/how-to-scrape-web-pages-with-beautiful-soup-and-python-3
-            # Using BeautifulSoup to scrap text
-            html = BeautifulSoup(r.text, 'html.parser')
-            # The list of found sds is in class 'catalog_num', with each item in class 'catlog_items'
-            # cat_no_list = html.find(class_='catalog_num')    # This is to find all of the sds
-
-            # Check if there is error message. Fisher automatically does a close search with error message
-            # breakpoint()
-            # error_message = html.find(class_='errormessage search_results_error_message')
-            # # Fisher give non-display message for un-real error message
-            # if error_message.attrs['style'] == 'display: none;':
-            #     error_message = None
-            # cat_no_list = exact_compound_row.find(class_='catlog_items')    # This will find the first sds
-
-            # Find the row with the image (first column in the result table) name containing the CAS number:
-            exact_compound_row = html.select_one(f'.msds_img:has(img[src*="{cas_nr}"]) + *.catalog_data .catlog_items')
-
-            if exact_compound_row:
-                cat_no_items = exact_compound_row.find_all('a')   #
-                # download info
-                rel_download_url = cat_no_items[0].get('href')
-                catalogID = cat_no_items[0].contents[0]
-                full_url = 'https://www.fishersci.com' + rel_download_url
-                # print(f'rel_download_url is {rel_download_url}')
-                return 'Fisher', full_url
+            return parse_fisher_page(r.text, cas_nr)
 
     except Exception as error:
         # print('.', end='')
-        if debug:
-            # traceback_str = ''.join(traceback.format_exception(etype=type(error), value=error, tb=error.__traceback__))
-            # print(traceback_str)
-            traceback.print_exception(error)
+        _report_provider_error(error)
         # return None
 
 
+def parse_fisher_page(text: str, cas_nr: str) -> Optional[Tuple[str, str]]:
+    """Get the SDS URL of the chemical with cas_nr from a Fisher SDS search
+
+    Parameters
+    ----------
+    text : str
+        the search page, e.g. https://www.fishersci.com/us/en/catalog/search/sds?msdsKeyword=64-19-7
+    cas_nr : str
+        CAS# searched: Fisher also lists close matches
+
+    Returns
+    -------
+    Optional[Tuple[str, str]]
+        'Fisher' and the URL of the SDS file, None if the chemical was not found
+    """
+    # BeautifulSoup ref: https://www.digitalocean.com/community/tutorials/how-to-scrape-web-pages-with-beautiful-soup-and-python-3
+    # Using BeautifulSoup to scrap text
+    html = BeautifulSoup(text, 'html.parser')
+    # The list of found sds is in class 'catalog_num', with each item in class 'catlog_items'
+    # cat_no_list = html.find(class_='catalog_num')    # This is to find all of the sds
+
+    # Check if there is error message. Fisher automatically does a close search with error message
+    # breakpoint()
+    # error_message = html.find(class_='errormessage search_results_error_message')
+    # # Fisher give non-display message for un-real error message
+    # if error_message.attrs['style'] == 'display: none;':
+    #     error_message = None
+    # cat_no_list = exact_compound_row.find(class_='catlog_items')    # This will find the first sds
+
+    # Find the row with the image (first column in the result table) name containing the CAS number:
+    exact_compound_row = html.select_one(f'.msds_img:has(img[src*="{cas_nr}"]) + *.catalog_data .catlog_items')
+
+    if exact_compound_row:
+        cat_no_items = exact_compound_row.find_all('a')   #
+        # download info
+        rel_download_url = cat_no_items[0].get('href')
+        catalogID = cat_no_items[0].contents[0]
+        full_url = 'https://www.fishersci.com' + rel_download_url
+        # print(f'rel_download_url is {rel_download_url}')
+        return 'Fisher', full_url
+
+
 def extract_download_url_from_chemicalsafety(cas_nr: str) -> Optional[Tuple[str, str]]:
     """Search for url to download SDS for chemical with cas_nr
     from https://chemicalsafety.com/sds-search/
@@ -452,6 +1673,106 @@ def extract_download_url_from_chemicalsafety(cas_nr: str) -> Optional[Tuple[str,
 
     # global debug
 
+    # Already looked up in a batch by find_sds(), see extract_download_urls_from_chemicalsafety()
+    if chemicalsafety_urls is not None and cas_nr in chemicalsafety_urls:
+        return chemicalsafety_urls[cas_nr]
+
+    if debug:
+        print('Searching on https://chemicalsafety.com/sds-search/')
+
+    try:
+        with requests.Session() as s:
+            return _search_chemicalsafety([cas_nr], session=s).get(cas_nr)
+
+            # # Check to see if give OK status (200) and not redirect
+            # if r1.status_code == 200 and len(r1.history) == 0 and r1.json():
+            #     id_list = r1.json()['rows']
+            #     msds_id = ''
+            #     for item in id_list:
+            #         if item[3] == cas_nr:
+            #             msds_id = item[0]
+            #             break
+            #     if msds_id != '':
+            #         # sds_viewer_url = 'https://chemicalsafety.com/sds1/sdsviewer.php'
+            #         url2 = 'https://chemicalsafety.com/sds1/retriever.php'
+            #         form2 = {"Action": "msdsdetail",
+            #              "P1": msds_id,
+            #              "Bee": "chemsafe",
+            #              }
+            #         r2 = s.post(url2,
+            #                     headers=headers,
+            #             data=json.dumps(form2), timeout=20)
+            #         breakpoint()
+            #         result = r2.json()['rows'][0]
+            #         #Confirm the msds_id and cas_nr:
+            #         if msds_id == result[0] and cas_nr == result[3]:
+            #             sds_pdf_file = result[10].rstrip(',')
+            #             form3 = {"action":"getpdfurl","p1":sds_pdf_file,"p2":"","p3":"", "bee": "chemsafe", "isContains":""}
+            #             r3 = s.post(extract_info_url, headers=headers, data=json.dumps(form3), timeout=20)
+            #             #Get the url
+            #             # Translate curl to python https://curl.trillworks.com/
+            #             # urllib.parse doc: https://docs.python.org/3.6/library/urllib.parse.html
+            #             full_url = r3.json()['url']
+            #             # print(f'{full_url=}'); exit()
+            #             return 'ChemicalSafety', full_url
+    except Exception as error:
+        _report_provider_error(error)
+        # return None
+
+
+def extract_download_urls_from_chemicalsafety(cas_list: List[str], batch_size: int = 100
+                                              ) -> Dict[str, Optional[Tuple[str, str]]]:
+    """Search for urls to download SDS for many chemicals at once
+    from https://chemicalsafety.com/sds-search/,
+    sending up to `batch_size` CAS# in each search request
+
+    Parameters
+    ----------
+    cas_list : List[str]
+        CAS# for chemicals of interest
+    batch_size : int, optional
+        the number of CAS# searched per request, by default 100
+
+    Returns
+    -------
+    Dict[str, Optional[Tuple[str, str]]]
+        CAS# mapped to the same result as extract_download_url_from_chemicalsafety():
+        the name of the SDS source and the URL of the SDS file, None if URL cannot be found.
+        CAS# of a batch whose search failed are left out
+    """
+    if debug:
+        print(f'Searching on https://chemicalsafety.com/sds-search/ for {len(cas_list)} CAS numbers')
+
+    results = {}
+    with requests.Session() as s:
+        for start in range(0, len(cas_list), batch_size):
+            batch = cas_list[start:start + batch_size]
+            try:
+                results.update(_search_chemicalsafety(batch, session=s, timeout=60))
+            except Exception as error:
+                if debug:
+                    traceback.print_exception(error)
+    return results
+
+
+def _search_chemicalsafety(cas_list: List[str], session: requests.Session,
+                           timeout: float = 20) -> Dict[str, Optional[Tuple[str, str]]]:
+    """Send one search request for a list of CAS# to https://chemicalsafety.com/sds-search/
+
+    Parameters
+    ----------
+    cas_list : List[str]
+        CAS# for chemicals of interest
+    session : requests.Session
+    timeout : float, optional
+        by default 20
+
+    Returns
+    -------
+    Dict[str, Optional[Tuple[str, str]]]
+        each CAS# mapped to the name of the SDS source and the URL of its newest
+        SDS file, None if URL cannot be found
+    """
     headers = {
         'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.192 Safari/537.36',
         'accept-encoding': 'gzip, deflate, br',
@@ -475,22 +1796,16 @@ def extract_download_url_from_chemicalsafety(cas_nr: str) -> Optional[Tuple[str,
         "IsContains":"false",
         "IncludeSynonyms":"false",
         "SearchSdsServer":"false",
-        "Criteria":[f"cas|{cas_nr}"],
+        "Criteria":[f"cas|{cas_nr}" for cas_nr in cas_list],
         "HostName":"sfs website",
         # "Remote":"97.64.216.42",
         "Bee":"stevia","Action":"search","SearchUrl":"","ResultColumns":["revision_date"]
     }
 
-    if debug:
-        print('Searching on https://chemicalsafety.com/sds-search/')
+    r1 = _fetch('post', extract_info_url, session=session, provider='chemicalsafety', headers=headers,
+                data=json.dumps(form1), timeout=timeout)
 
-    try:
-        with requests.Session() as s:
-            r1 = s.post(extract_info_url, headers=headers,
-                           # params={'action': 'search'},
-                data=json.dumps(form1), timeout=20)
-
-            '''Example of r1.json():
+    '''Example of r1.json():
 {'cols': [{'name': 'MSDS_ID', 'prompt': 'MSDS_ID'},
           {'name': 'COMMON', 'prompt': 'Product Name'},
           {'name': 'MANUFACT', 'prompt': 'MANUFACTURER'},
@@ -557,59 +1872,38 @@ def extract_download_url_from_chemicalsafety(cas_nr: str) -> Optional[Tuple[str,
            '32508606',
            '2018-07-06',
            'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf']]}
-            '''
-            cols = [row['name'] for row in r1.json()['cols']]
-            cas_col_index = cols.index('CAS')
-            manufacture_col_index = cols.index('MANUFACT')
-            sds_url_col_index = cols.index('HTTPMSDSREF')
-            correct_compounds = [(row[sds_url_col_index], row[manufacture_col_index])
-                        for row in r1.json()['rows']
-                        if (row[cas_col_index] == cas_nr
-                            and re.search(r'^http.+\.pdf$', row[sds_url_col_index]))
-                        ]
-            if correct_compounds:
-                url = correct_compounds[-1][0]
-                manufacture = correct_compounds[-1][1]
-                return manufacture, url
+    '''
+    return parse_chemicalsafety_results(r1.json(), cas_list)
 
-            # # Check to see if give OK status (200) and not redirect
-            # if r1.status_code == 200 and len(r1.history) == 0 and r1.json():
-            #     id_list = r1.json()['rows']
-            #     msds_id = ''
-            #     for item in id_list:
-            #         if item[3] == cas_nr:
-            #             msds_id = item[0]
-            #             break
-            #     if msds_id != '':
-            #         # sds_viewer_url = 'https://chemicalsafety.com/sds1/sdsviewer.php'
-            #         url2 = 'https://chemicalsafety.com/sds1/retriever.php'
-            #         form2 = {"Action": "msdsdetail",
-            #              "P1": msds_id,
-            #              "Bee": "chemsafe",
-            #              }
-            #         r2 = s.post(url2,
-            #                     headers=headers,
-            #             data=json.dumps(form2), timeout=20)
-            #         breakpoint()
-            #         result = r2.json()['rows'][0]
-            #         #Confirm the msds_id and cas_nr:
-            #         if msds_id == result[0] and cas_nr == result[3]:
-            #             sds_pdf_file = result[10].rstrip(',')
-            #             form3 = {"action":"getpdfurl","p1":sds_pdf_file,"p2":"","p3":"", "bee": "chemsafe", "isContains":""}
-            #             r3 = s.post(extract_info_url, headers=headers, data=json.dumps(form3), timeout=20)
-            #             #Get the url
-            #             # Translate curl to python https://curl.trillworks.com/
-            #             # urllib.parse doc: https://docs.python.org/3.6/library/urllib.parse.html
-            #             full_url = r3.json()['url']
-            #             # print(f'{full_url=}'); exit()
-            #             return 'ChemicalSafety', full_url
-    except Exception as error:
-        # print('.', end='')
-        if debug:
-            # traceback_str = ''.join(traceback.format_exception(etype=type(error), value=error, tb=error.__traceback__))
-            # print(traceback_str)
-            traceback.print_exception(error)
-        # return None
+
+def parse_chemicalsafety_results(data: Dict, cas_list: List[str]) -> Dict[str, Optional[Tuple[str, str]]]:
+    """Get the SDS source and URL of each CAS# from a ChemicalSafety search result
+
+    Parameters
+    ----------
+    data : Dict
+        the decoded JSON search result, see _search_chemicalsafety()
+    cas_list : List[str]
+        CAS# searched
+
+    Returns
+    -------
+    Dict[str, Optional[Tuple[str, str]]]
+        each CAS# mapped to the name of the SDS source and the URL of its newest
+        SDS file, None if URL cannot be found
+    """
+    cols = [row['name'] for row in data['cols']]
+    cas_col_index = cols.index('CAS')
+    manufacture_col_index = cols.index('MANUFACT')
+    sds_url_col_index = cols.index('HTTPMSDSREF')
+
+    # Keep the last matching row of each CAS#, the same one a single-CAS search returns
+    results = dict.fromkeys(cas_list)
+    for row in data['rows']:
+        if (row[cas_col_index] in results
+                and re.search(r'^http.+\.pdf$', row[sds_url_col_index])):
+            results[row[cas_col_index]] = (row[manufacture_col_index], row[sds_url_col_index])
+    return results
 
 
 def extract_download_url_from_fluorochem(cas_nr: str) -> Optional[Tuple[str, str]]:
@@ -629,6 +1923,25 @@ def extract_download_url_from_fluorochem(cas_nr: str) -> Optional[Tuple[str, str
             the URL from Fisher for SDS file
         None: if URL cannot be found
     """
+    return extract_localized_urls_from_fluorochem(cas_nr, sds_locales[:1]).get(sds_locales[0])
+
+
+def extract_localized_urls_from_fluorochem(cas_nr: str, locales: List[str]) -> Dict[str, Tuple[str, str]]:
+    """Search for urls of SDS in several languages from http://www.fluorochem.co.uk/.
+    The search result has the links of all languages: a single request for all locales
+
+    Parameters
+    ----------
+    cas_nr : str
+        CAS# for chemical of interest
+    locales : List[str]
+        language (and country, not used) of each SDS, e.g. ['en-GB', 'de-DE']
+
+    Returns
+    -------
+    Dict[str, Tuple[str, str]]
+        each locale found mapped to the name of the SDS source and the URL of the SDS file
+    """
 
     # global debug
 
@@ -653,144 +1966,358 @@ def extract_download_url_from_fluorochem(cas_nr: str) -> Optional[Tuple[str, str
         # print('Searching on http://www.fluorochem.co.uk')
         print('Searching on Fluorochem (UK) using https://dougdiscovery.com/')
 
+    urls = {}
     try:
-        r = requests.post(url, headers=headers, timeout=20, data=json.dumps(payload))
+        r = _fetch('post', url, provider='fluorochem', headers=headers, timeout=20, data=json.dumps(payload))
         if r.status_code == 200 and len(r.history) == 0:
-            res = r.json()
-            sds_info = res['data'][0]['molecule']['sds'] if res['data'] else None
-            if not sds_info:
-                return
-            sds_partial_url_en = sds_info['custrecord_sdslink_en']
-            # download info
-            full_url = f'https://7128445.app.netsuite.com{sds_partial_url_en}'
-            return 'Fluorochem', full_url
+            urls = parse_fluorochem_results(r.json(), locales)
     except Exception as error:
         #     print('.', end='')
-        if debug:
-            # traceback_str = ''.join(traceback.format_exception(etype=type(error), value=error, tb=error.__traceback__))
-            # print(traceback_str)
-            traceback.print_exception(error)
-        # return None
+        _report_provider_error(error)
+    return urls
 
 
-def extract_download_url_from_tci(cas_nr: str) -> Optional[Tuple[str, str]]:
-    """Search for url of SDS from TCI Chemicals (www.tcichemicals.com)
+def parse_fluorochem_results(res: Dict, locales: List[str]) -> Dict[str, Tuple[str, str]]:
+    """Get the SDS URL of each locale from a Fluorochem search result
 
     Parameters
     ----------
-    cas_nr : str
-        The CAS number of the molecule of interest
+    res : Dict
+        the decoded JSON search result of https://dougdiscovery.com/api/v1/molecules/search
+    locales : List[str]
+        language (and country, not used) of each SDS, e.g. ['en-GB', 'de-DE']
 
     Returns
     -------
-    Tuple[str, bool, Optional[str]]
-        - str: CAS number of the input chemical
-        - bool: True if SDS file downloaded or exists
-        - str: the name of the SDS source or None
+    Dict[str, Tuple[str, str]]
+        each locale found mapped to the name of the SDS source and the URL of the SDS file
     """
-    global debug
+    urls = {}
+    sds_info = res['data'][0]['molecule']['sds'] if res['data'] else None
+    if not sds_info:
+        return urls
+    for locale in locales:
+        # e.g. 'custrecord_sdslink_en', 'custrecord_sdslink_de'
+        sds_partial_url = sds_info.get(f'custrecord_sdslink_{parse_locale(locale)[0]}')
+        if sds_partial_url:
+            # download info
+            urls[locale] = 'Fluorochem', f'https://7128445.app.netsuite.com{sds_partial_url}'
+    return urls
+
 
+class TCIClient:
+    """Session on TCI Chemicals (www.tcichemicals.com) kept across CAS lookups.
 
-    # adv_search_url = 'https://www.tcichemicals.com/US/en/search/?text={}&resulttype=product'.format(cas_nr)
-    # adv_search_url = 'https://www.tcichemicals.com/US/en/search/?text={}'.format(cas_nr)
-    adv_search_url = 'https://www.tcichemicals.com/US/en/search/'
+    The cookies, the CSRF token and the context path (e.g. '/US/en') needed
+    to ask for SDS file names are kept, and refreshed only when they are older
+    than `token_ttl` or when TCI rejects a request.
 
+    Parameters
+    ----------
+    token_ttl : float, optional
+        how long (in seconds) the CSRF token is used before refreshing it, by default 1800
+    """
+
+    search_url = 'https://www.tcichemicals.com/US/en/search/'
+    sds_search_url = 'https://www.tcichemicals.com/US/en/documentSearch/productSDSSearchDoc'
     headers = {
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36',
-        'Referer': adv_search_url,
+        'Referer': search_url,
         'Sec-Fetch-Dest': 'document',
         'Sec-Fetch-Mode':'navigate',
         'Sec-Fetch-Site':'same-origin',
         'Sec-Fetch-User':'?1',
     }
 
-    # # Set initial return value for if SDS is downloaded (or existed)
-    # downloaded = False
+    def __init__(self, token_ttl: float = 1800) -> None:
+        self.token_ttl = token_ttl
+        self._setup()
+
+    def _setup(self) -> None:
+        self.session = requests.Session()
+        self.csrf_token = None
+        self.encoded_context_path = None
+        self.token_time = None
+        # Product number of the last CAS number searched, reused for the SDS in other locales
+        self._last_search = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict:
+        # Each process opens its own session
+        return {'token_ttl': self.token_ttl}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._setup()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _read_state(self, html: BeautifulSoup) -> None:
+        """Keep the CSRF token and context path found in a TCI page"""
+        state = parse_tci_state(html)
+        if not state:
+            return
+
+        csrf_token, encodedContextPath = state
+        with self._lock:
+            self.csrf_token = csrf_token
+            self.encoded_context_path = encodedContextPath
+            self.token_time = time.monotonic()
+
+    def refresh(self) -> None:
+        """Get a new CSRF token and context path"""
+        r = _fetch('get', self.search_url, session=self.session, provider='tci', cache=False,
+                   headers=self.headers, timeout=10)
+        if r.status_code == 200 and len(r.history) == 0:
+            self._read_state(BeautifulSoup(r.text, 'html.parser'))
+
+    def _token_expired(self) -> bool:
+        return (not self.csrf_token
+                or time.monotonic() - self.token_time > self.token_ttl)
+
+    def search(self, cas_nr: str) -> Optional[str]:
+        """Search for the TCI product number of a chemical
+
+        Parameters
+        ----------
+        cas_nr : str
+            The CAS number of the molecule of interest
+
+        Returns
+        -------
+        Optional[str]
+            the TCI product number, None if not found
+        """
+        last_search = self._last_search
+        if last_search and last_search[0] == cas_nr:
+            return last_search[1]
+        prd_id = self._search(cas_nr)
+        self._last_search = (cas_nr, prd_id)
+        return prd_id
+
+    def _search(self, cas_nr: str) -> Optional[str]:
+        # adv_search_url = 'https://www.tcichemicals.com/US/en/search/?text={}&resulttype=product'.format(cas_nr)
+        # adv_search_url = 'https://www.tcichemicals.com/US/en/search/?text={}'.format(cas_nr)
+        # Not cached: the page carries the CSRF token of the session
+        get_id = _fetch('get', self.search_url, session=self.session, cache=False, headers=self.headers,
+                        timeout=10, params={'text': cas_nr})
+
+        if get_id.status_code == 200 and len(get_id.history) == 0:
+            # get_id.text
+            html = BeautifulSoup(get_id.text, 'html.parser')
+            # print(html.prettify()); exit(1)
+
+            # The search page comes with a fresh token, no need to ask for another one later
+            self._read_state(html)
+            if not self.csrf_token:
+                return
+
+            return parse_tci_products(html, cas_nr)
+
+    def _post_sds_search(self, product_code: str, locale: str = DEFAULT_LOCALE) -> requests.Response:
+        language, country = parse_locale(locale)
+        data = {
+            'productCode': f'{product_code}',
+            'langSelector': language,
+            'selectedCountry': country,
+            'CSRFToken': f'{self.csrf_token}'
+        }
+        return _fetch('post', self.sds_search_url, session=self.session, provider='tci', cache=False,
+                      headers=self.headers, timeout=15, data=data)
+
+    def sds_file_name(self, product_code: str, locale: str = DEFAULT_LOCALE) -> Optional[str]:
+        """Get the name of the SDS file of a TCI product.
+        The CSRF token is refreshed if it has expired or if TCI rejects the request
+
+        Parameters
+        ----------
+        product_code : str
+            the TCI product number, e.g. 'T0211'
+        locale : str, optional
+            language and country of the SDS, by default 'en-US'
+
+        Returns
+        -------
+        Optional[str]
+            the SDS file name, e.g. 'T0211_US_EN.pdf' ('T0211_JP_JA.pdf' for 'ja-JP'),
+            None if TCI does not send one
+        """
+        if self._token_expired():
+            self.refresh()
+
+        file_name_res = self._post_sds_search(product_code, locale)
+        # print(f"{file_name_res.headers.get('content-disposition')=}")
+        if file_name_res.status_code != 200 or not file_name_res.headers.get('content-disposition'):
+            # Token or session rejected: start over once
+            self.refresh()
+            file_name_res = self._post_sds_search(product_code, locale)
+
+        # Get the SDS file name using the return header, in "content-disposition"
+        match = re.search(r'filename=(\S+)$', file_name_res.headers.get('content-disposition') or '')
+        return match[1] if match else None
+
+    def sds_url(self, file_name: str) -> str:
+        """Get the URL of a SDS file
+
+        Parameters
+        ----------
+        file_name : str
+            the SDS file name, see sds_file_name()
+
+        Returns
+        -------
+        str
+            e.g. 'https://www.tcichemicals.com/US/en/sds/B3296_US_EN.pdf'
+        """
+        # url = f'https://www.tcichemicals.com/US/en/sds/{prd_id.upper()}_US_EN.pdf'
+        return f'https://www.tcichemicals.com{self.encoded_context_path or "/US/en"}/sds/{file_name}'
+
+
+def parse_tci_state(html: BeautifulSoup) -> Optional[Tuple[str, str]]:
+    """Get the CSRF token and context path (e.g. '/US/en') found in a TCI page
+
+    Parameters
+    ----------
+    html : BeautifulSoup
+        any page of www.tcichemicals.com
+
+    Returns
+    -------
+    Optional[Tuple[str, str]]
+        the CSRF token and the context path, None if the page has no token
+    """
+    # Get the token, required for POST request for SDS file name later
+    csrf_token = html.find('input', attrs={'name': 'CSRFToken'})['value'] if html.find('input', attrs={'name': 'CSRFToken'}) else None
+    if not csrf_token:
+        return
+
+    region_code = html.find_all(string=re.compile(r'(encodedContextPath[^;]+?;)'))
+    # print(region_code[0])
+    encodedContextPath = re.search(r'(encodedContextPath[^;]+?\'(\S+)\';)', region_code[0])[2].replace('\\' ,'')
+    # print(encodedContextPath)
+    return csrf_token, encodedContextPath
+
 
-    # file_name = cas_nr + '.pdf'
-    # # download_file = Path(download_path) / file_name
+def parse_tci_products(html: BeautifulSoup, cas_nr: str) -> Optional[str]:
+    """Get the TCI product number of the chemical with cas_nr from a TCI search page
+
+    Parameters
+    ----------
+    html : BeautifulSoup
+        the search page, e.g. https://www.tcichemicals.com/US/en/search/?text=64-19-7
+    cas_nr : str
+        CAS# searched
+
+    Returns
+    -------
+    Optional[str]
+        the product number of the first hit, None if it is not the chemical searched
+    """
+    product_cat_css = 'div#contentSearchFacet > span.facet__text:first-child > a:first-child'
+    product_category = html.select(product_cat_css)[0]
+    # print(product_category)
+
+    hit_count = 0
+    if product_category.text == 'Products':
+        hit_count = re.search(r'\((\d+)\)',
+                            html.select(f'{product_cat_css} + span.facet__value__count')[0].text)[1]
+    # print(f'{hit_count=}')
+
+    # Check to make sure that there is at least 1 hit
+    if hit_count:
+        # Find the first hit
+        first_hit_div = html.find('div', class_='prductlist')
+        # print(first_hit_form)
+
+        # Find the CAS# for the first hit
+        returned_cas = first_hit_div['data-casno']
+        # print(f'{returned_cas=}')
+
+        # Confirm the first hit has the same CAS# as search chemical
+        if returned_cas == cas_nr:
+            # Get this TCI product number as follow:
+            prd_id = first_hit_div['data-id']
+            # print(f'{prd_id=}')
+            return prd_id or None
+
+
+def extract_download_url_from_tci(cas_nr: str) -> Optional[Tuple[str, str]]:
+    """Search for url of SDS from TCI Chemicals (www.tcichemicals.com).
+    Uses the TCI session of the worker (`tci_client`) if there is one
+
+    Parameters
+    ----------
+    cas_nr : str
+        The CAS number of the molecule of interest
+
+    Returns
+    -------
+    Optional[Tuple[str, str]]
+        Tuple[str, str]:
+            the name of the SDS source
+            the URL from TCI for SDS file
+        None: if URL cannot be found
+    """
+    return extract_localized_urls_from_tci(cas_nr, sds_locales[:1]).get(sds_locales[0])
+
+
+def extract_localized_urls_from_tci(cas_nr: str, locales: List[str]) -> Dict[str, Tuple[str, str]]:
+    """Search for urls of SDS in several locales from TCI Chemicals (www.tcichemicals.com).
+    The product number is searched once: each locale costs one more request on the same session
+
+    Parameters
+    ----------
+    cas_nr : str
+        The CAS number of the molecule of interest
+    locales : List[str]
+        language and country of each SDS, e.g. ['en-US', 'ja-JP']
+
+    Returns
+    -------
+    Dict[str, Tuple[str, str]]
+        each locale found mapped to the name of the SDS source and the URL from TCI for SDS file
+    """
+    global debug
 
     if debug:
         print('Searching on https://www.tcichemicals.com')
 
+    urls = {}
     try:
-        with requests.Session() as s:
-            get_id = s.get(adv_search_url, headers=headers, timeout=10, params={'text': cas_nr})
-
-            if get_id.status_code == 200 and len(get_id.history) == 0:
-                # get_id.text
-                html = BeautifulSoup(get_id.text, 'html.parser')
-                # print(html.prettify()); exit(1)
-
-                # Get the token, required for POST request for SDS file name later
-                csrf_token = html.find('input', attrs={'name': 'CSRFToken'})['value'] if html.find('input', attrs={'name': 'CSRFToken'}) else None
-                # breakpoint()
-                if not csrf_token:
-                    return
-                # print(f'{csrf_token=}')
-
-                region_code = html.find_all(string=re.compile(r'(encodedContextPath[^;]+?;)'))
-                # print(region_code[0])
-                encodedContextPath = re.search(r'(encodedContextPath[^;]+?\'(\S+)\';)', region_code[0])[2].replace('\\' ,'')
-                # print(encodedContextPath)
-
-                product_cat_css = 'div#contentSearchFacet > span.facet__text:first-child > a:first-child'
-                product_category = html.select(product_cat_css)[0]
-                # print(product_category)
-
-                hit_count = 0
-                if product_category.text == 'Products':
-                    hit_count = re.search(r'\((\d+)\)',
-                                        html.select(f'{product_cat_css} + span.facet__value__count')[0].text)[1]
-                # print(f'{hit_count=}')
-
-                # Check to make sure that there is at least 1 hit
-                if hit_count:
-                    # Find the first hit
-                    first_hit_div = html.find('div', class_='prductlist')
-                    # print(first_hit_form)
-
-                    # Find the CAS# for the first hit
-                    returned_cas = first_hit_div['data-casno']
-                    # print(f'{returned_cas=}')
-
-                    # Confirm the first hit has the same CAS# as search chemical
-                    if returned_cas == cas_nr:
-                        # Get this TCI product number as follow:
-                        prd_id = first_hit_div['data-id']
-                        # print(f'{prd_id=}')
-
-                        # Check if TCI product number is found:
-                        if prd_id:
-                            sds_url = ' https://www.tcichemicals.com/US/en/documentSearch/productSDSSearchDoc'
-
-                            data = {
-                                'productCode': f'{prd_id}',
-                                'langSelector': 'en',
-                                'selectedCountry': 'US',
-                                'CSRFToken': f'{csrf_token}'
-                            }
-                            file_name_res = s.post(sds_url, headers=headers, timeout=15, data=data)
-                            # print(f'{file_name_res=}')
-                            # print(file_name_res.headers)
-                            # print(f"{file_name_res.headers.get('content-disposition')=}")
-
-                            # Get the SDS file name using the return header, in "content-disposition"
-                            res_file = re.search(r'filename=(\S+)$', file_name_res.headers.get('content-disposition'))[1]
-                            # print(f"{res_file=}")
-
-                            # url = f'https://www.tcichemicals.com/US/en/sds/{prd_id.upper()}_US_EN.pdf'
-                            # An example of an sds url: 'https://www.tcichemicals.com/US/en/sds/B3296_US_EN.pdf'
-                            url = f'https://www.tcichemicals.com{encodedContextPath}/sds/{res_file}'
-                            # print(url)
-
-                            return 'TCI', url
+        client = tci_client or TCIClient()
+        try:
+            # A product number from the catalog index saves the search
+            prd_id = next((entry['product_code'] for entry in _catalog_lookup(cas_nr, 'tci')
+                           if entry['product_code']), None)
+            if not prd_id:
+                prd_id = client.search(cas_nr)
+                if prd_id:
+                    _catalog_add('tci', cas_nr, product_code=prd_id)
+
+            # Check if TCI product number is found:
+            if prd_id:
+                for locale in locales:
+                    # Most SDS files follow '<product number>_<COUNTRY>_<LANGUAGE>.pdf', e.g. 'B3296_US_EN.pdf':
+                    # check it before asking TCI for the name
+                    if probe_urls:
+                        language, country = parse_locale(locale)
+                        url = client.sds_url(f'{prd_id.upper()}_{country}_{language.upper()}.pdf')
+                        if _probe_url(url, headers=client.headers, session=client.session):
+                            urls[locale] = 'TCI', url
+                            continue
+
+                    # An example of an sds url: 'https://www.tcichemicals.com/US/en/sds/B3296_US_EN.pdf'
+                    file_name = client.sds_file_name(prd_id, locale)
+                    if file_name:
+                        urls[locale] = 'TCI', client.sds_url(file_name)
+        finally:
+            if client is not tci_client:
+                client.close()
 
     except Exception as error:
-        if debug:
-            # traceback_str = ''.join(traceback.format_exception(etype=type(error), value=error, tb=error.__traceback__))
-            # print(traceback_str)
-            traceback.print_exception(error)
+        _report_provider_error(error)
+    return urls
 
 
 if __name__ == '__main__':
@@ -0,0 +1,172 @@
+"""
+HTTP/2 transport for the requests sent to SDS providers.
+
+`HTTP2Adapter` is a `requests` transport adapter sending through one httpx
+client per process: concurrent requests of the threads of a process to the
+same host (lookups of the service, searches of `all_sources`) are multiplexed
+on a few HTTP/2 connections instead of one HTTP/1.1 connection each. This
+saves no connections with the process pool of find_sds(): each worker looks
+up one CAS number at a time over its own connections, so the pool opens as
+many connections as with HTTP/1.1 sessions. Servers without HTTP/2 are
+answered over HTTP/1.1 (negotiated with ALPN).
+
+Needs the optional httpx with HTTP/2 support:
+    pip install 'httpx[http2]'
+"""
+
+
+import os
+from http.client import HTTPMessage
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import h2
+    import httpx
+except ImportError:
+    h2 = httpx = None
+
+# Connection-specific headers, not allowed in HTTP/2 (httpx keeps connections alive anyway)
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'upgrade'}
+
+
+def http2_available() -> bool:
+    """Check if httpx and its HTTP/2 support (h2) are installed"""
+    return httpx is not None and h2 is not None
+
+
+class _RawResponse:
+    """Body of an httpx response, read by `requests` the way it reads urllib3 responses"""
+
+    def __init__(self, response: 'httpx.Response') -> None:
+        self._response = response
+        self.http_version = response.http_version
+        # Headers for the cookie jar of `requests`, which reads them from `_original_response.msg`
+        msg = HTTPMessage()
+        for name, value in response.headers.multi_items():
+            msg[name] = value
+        self._original_response = self
+        self.msg = msg
+
+    def stream(self, chunk_size: Optional[int] = None, decode_content: bool = True) -> Iterator[bytes]:
+        try:
+            yield from self._response.iter_bytes(chunk_size)
+        except httpx.TransportError as error:
+            raise requests.ConnectionError(error) from error
+        finally:
+            self._response.close()
+
+    def close(self) -> None:
+        self._response.close()
+
+    release_conn = close
+
+
+class HTTP2Adapter(BaseAdapter):
+    """Send the requests of `requests` sessions through a shared httpx client,
+    over HTTP/2 when the server supports it
+
+    Redirects and cookies are still handled by the `requests` session. TLS
+    certificates are always verified; proxies are read from the environment.
+
+    Parameters
+    ----------
+    max_connections : int, optional
+        the number of connections of the process (all hosts), by default 20.
+        Each HTTP/2 connection carries many requests at a time
+    http2 : bool, optional
+        by default True; False sends HTTP/1.1 only through httpx
+    """
+
+    def __init__(self, max_connections: int = 20, http2: bool = True) -> None:
+        if not http2_available():
+            raise ImportError("HTTP/2 needs httpx with HTTP/2 support: pip install 'httpx[http2]'")
+        super().__init__()
+        self.max_connections = max_connections
+        self.http2 = http2
+        self._setup()
+
+    def _setup(self) -> None:
+        self._client: Optional['httpx.Client'] = None
+        self._pid = None
+
+    def __getstate__(self) -> Dict:
+        # Each process opens its own connections
+        return {'max_connections': self.max_connections, 'http2': self.http2}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._setup()
+
+    @property
+    def client(self) -> 'httpx.Client':
+        """The httpx client of this process"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            self._client = httpx.Client(http2=self.http2, limits=limits, follow_redirects=False)
+        return self._client
+
+    def mount(self, session: requests.Session) -> requests.Session:
+        """Send the requests of `session` through this adapter
+
+        Returns
+        -------
+        requests.Session
+            `session`
+        """
+        if session.adapters.get('https://') is not self:
+            session.mount('https://', self)
+            session.mount('http://', self)
+        return session
+
+    @staticmethod
+    def _timeout(timeout: Union[None, float, Tuple[Optional[float], Optional[float]]]) -> 'httpx.Timeout':
+        # `requests` timeouts are one number or (connect, read)
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return httpx.Timeout(read, connect=connect)
+        return httpx.Timeout(timeout)
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, timeout=None,
+             verify=True, cert=None, proxies=None) -> requests.Response:
+        client = self.client
+        headers = {name: value for name, value in request.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+        httpx_request = client.build_request(request.method, request.url, headers=headers,
+                                             content=request.body, timeout=self._timeout(timeout))
+        try:
+            httpx_response = client.send(httpx_request, stream=True)
+        except httpx.ConnectTimeout as error:
+            raise requests.ConnectTimeout(error, request=request) from error
+        except httpx.TimeoutException as error:
+            raise requests.ReadTimeout(error, request=request) from error
+        except httpx.TransportError as error:
+            raise requests.ConnectionError(error, request=request) from error
+
+        response = requests.Response()
+        response.status_code = httpx_response.status_code
+        response.reason = httpx_response.reason_phrase
+        response.headers = CaseInsensitiveDict(httpx_response.headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _RawResponse(httpx_response)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        requests.cookies.extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def close(self) -> None:
+        # Sessions close their adapters, but the client is shared by all sessions of the process:
+        # it is closed with the process, or by shutdown()
+        pass
+
+    def shutdown(self) -> None:
+        """Close the connections of this process"""
+        if self._client and self._pid == os.getpid():
+            self._client.close()
+        self._setup()
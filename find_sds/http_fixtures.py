@@ -0,0 +1,191 @@
+"""
+Record HTTP responses of SDS providers into fixture files and replay them
+without network.
+
+Set the environment variable FIND_SDS_HTTP_FIXTURES before running:
+    # Capture the responses of live sites (needs network)
+    FIND_SDS_HTTP_FIXTURES=record python -m pytest tests
+    # Run from the captured responses, offline
+    FIND_SDS_HTTP_FIXTURES=replay python -m pytest tests
+
+Fixtures are saved in FIND_SDS_FIXTURE_DIR (default: tests/fixtures/http),
+one JSON file per request, named after the host and a hash of the request.
+FIND_SDS_FIXTURE_LATENCY (in seconds) delays every replayed response, to
+replay fixtures at high concurrency with a realistic latency.
+
+Requests sent over HTTP/2 (`http2` of find_sds(), see http2.py) are recorded
+and replayed too.
+"""
+
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from .http2 import HTTP2Adapter
+    from .response_cache import build_response
+except ImportError:    # running as a script: python find_sds/find_sds.py
+    from http2 import HTTP2Adapter
+    from response_cache import build_response
+
+# Bump when the layout of fixture files changes; older files are then ignored
+FIXTURE_VERSION = 1
+
+MODES = ['record', 'replay']
+# Transport adapters whose requests go through the store once installed
+ADAPTERS = [HTTPAdapter, HTTP2Adapter]
+
+
+class FixtureNotFound(requests.ConnectionError):
+    """No recorded response for a request in replay mode"""
+
+
+class FixtureStore:
+    """Recorded HTTP responses, captured or replayed by all requests sent
+    through `requests` once installed
+
+    Parameters
+    ----------
+    fixture_dir : str
+        the folder of the fixture files
+    mode : str
+        'record' to send requests and save their responses,
+        'replay' to answer requests from saved responses only
+    latency : float, optional
+        seconds to wait before answering a replayed request, by default 0
+    """
+
+    def __init__(self, fixture_dir: str, mode: str, latency: float = 0.0) -> None:
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}, not {mode!r}')
+        self.fixture_dir = Path(fixture_dir)
+        self.mode = mode
+        self.latency = latency
+        self._fixtures: Dict[Path, Optional[Dict]] = {}
+        self._lock = threading.Lock()
+        self._original_sends: Dict[type, Callable] = {}
+
+    @classmethod
+    def from_env(cls) -> Optional['FixtureStore']:
+        """Create the fixture store set up by the environment variables, if any
+
+        Returns
+        -------
+        Optional[FixtureStore]
+            None if FIND_SDS_HTTP_FIXTURES is not set
+        """
+        mode = os.environ.get('FIND_SDS_HTTP_FIXTURES')
+        if not mode:
+            return None
+        return cls(os.environ.get('FIND_SDS_FIXTURE_DIR', Path('tests') / 'fixtures' / 'http'),
+                   mode=mode, latency=float(os.environ.get('FIND_SDS_FIXTURE_LATENCY', 0)))
+
+    def fixture_path(self, request: requests.PreparedRequest) -> Path:
+        """Get the fixture file of a request, from its method, url and body
+
+        Parameters
+        ----------
+        request : requests.PreparedRequest
+
+        Returns
+        -------
+        Path
+        """
+        body = request.body.encode() if isinstance(request.body, str) else (request.body or b'')
+        digest = hashlib.sha1(b'\n'.join([request.method.encode(), request.url.encode(), body])).hexdigest()
+        return self.fixture_dir / urlsplit(request.url).netloc / f'{request.method.lower()}-{digest[:20]}.json'
+
+    def _load(self, path: Path) -> Optional[Dict]:
+        with self._lock:
+            if path not in self._fixtures:
+                fixture = json.loads(path.read_text(encoding='utf-8')) if path.exists() else None
+                if fixture and fixture.get('version') != FIXTURE_VERSION:
+                    fixture = None
+                self._fixtures[path] = fixture
+            return self._fixtures[path]
+
+    def save(self, request: requests.PreparedRequest, response: requests.Response) -> None:
+        """Save the response of a request into its fixture file"""
+        content = response.content or b''
+        try:
+            body = {'text': content.decode('utf-8')}
+        except UnicodeDecodeError:
+            body = {'base64': base64.b64encode(content).decode('ascii')}
+
+        fixture = {
+            'version': FIXTURE_VERSION,
+            'request': {'method': request.method, 'url': request.url},
+            'response': {
+                'status_code': response.status_code,
+                'reason': response.reason,
+                'headers': dict(response.headers),
+                'encoding': response.encoding,
+                **body,
+            },
+        }
+        path = self.fixture_path(request)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(fixture, indent=1, ensure_ascii=False), encoding='utf-8')
+        with self._lock:
+            self._fixtures[path] = fixture
+
+    def replay(self, request: requests.PreparedRequest) -> requests.Response:
+        """Answer a request from its fixture file
+
+        Raises
+        ------
+        FixtureNotFound
+            if the request was never recorded
+        """
+        fixture = self._load(self.fixture_path(request))
+        if not fixture:
+            raise FixtureNotFound(f'No recorded response for {request.method} {request.url} '
+                                  f'(record it with FIND_SDS_HTTP_FIXTURES=record)', request=request)
+        if self.latency:
+            time.sleep(self.latency)
+
+        recorded = fixture['response']
+        content = (recorded['text'].encode('utf-8') if 'text' in recorded
+                   else base64.b64decode(recorded['base64']))
+        response = build_response(recorded['status_code'], recorded['headers'], content,
+                                  request.url, recorded['encoding'], recorded['reason'])
+        response.request = request
+        return response
+
+    def _send_through_store(self, original_send: Callable) -> Callable:
+        store = self
+
+        def send(adapter, request, *args, **kwargs):
+            if store.mode == 'replay':
+                response = store.replay(request)
+            else:
+                response = original_send(adapter, request, *args, **kwargs)
+                store.save(request, response)
+            response.connection = adapter
+            return response
+
+        return send
+
+    def install(self) -> None:
+        """Route every request sent through `requests` (HTTP/1.1 or HTTP/2) to this store"""
+        if self._original_sends:
+            return
+        for adapter_class in ADAPTERS:
+            self._original_sends[adapter_class] = adapter_class.send
+            adapter_class.send = self._send_through_store(adapter_class.send)
+
+    def uninstall(self) -> None:
+        """Send requests through `requests` as usual again"""
+        for adapter_class, original_send in self._original_sends.items():
+            adapter_class.send = original_send
+        self._original_sends = {}
@@ -0,0 +1,210 @@
+"""
+Profiling of find_sds() workers: where CPU time and memory go.
+
+Each worker runs under cProfile and/or tracemalloc, and saves when it exits:
+    worker-<pid>.prof: cProfile stats, for pstats or external viewers (e.g. snakeviz)
+    worker-<pid>.json: time and memory of each stage (search of each provider,
+                       SDS download, file write) and top allocation sites
+
+`profile_report()` merges the files of all workers into 'merged.prof' and
+'report.txt', e.g.:
+    python -m find_sds.profiling profile
+"""
+
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from multiprocessing import util
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+MODES = ['cpu', 'memory', 'all']
+
+
+class WorkerProfiler:
+    """Profile the process it is started in, until it exits (or `stop()`)
+
+    Parameters
+    ----------
+    output_dir : str
+        where the profiles of the workers are saved
+    mode : str, optional
+        one of `MODES`, by default 'cpu'. 'memory' uses tracemalloc, which slows down the workers
+    top : int, optional
+        the number of allocation sites saved, by default 25
+    """
+
+    def __init__(self, output_dir: str, mode: str = 'cpu', top: int = 25) -> None:
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}, not {mode!r}')
+        self.output_dir = str(output_dir)
+        self.mode = mode
+        self.top = top
+        self._setup()
+
+    def _setup(self) -> None:
+        self.pid = None
+        self._profile = None
+        self.stages: Dict[str, Dict[str, float]] = defaultdict(lambda: {'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                                                        'allocated': 0, 'peak': 0})
+
+    def __getstate__(self) -> Dict:
+        # Each worker starts its own profile
+        return {'output_dir': self.output_dir, 'mode': self.mode, 'top': self.top}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._setup()
+
+    @property
+    def cpu(self) -> bool:
+        return self.mode in ['cpu', 'all']
+
+    @property
+    def memory(self) -> bool:
+        return self.mode in ['memory', 'all']
+
+    def clear(self) -> None:
+        """Remove the profiles of a previous run from `output_dir`"""
+        for path in Path(self.output_dir).glob('worker-*'):
+            path.unlink()
+
+    def start(self) -> None:
+        """Start profiling this process, if not started yet.
+        The profile is saved when the process exits"""
+        if self.pid == os.getpid():
+            return
+        self._setup()
+        self.pid = os.getpid()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        if self.cpu:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        # Pool workers exit through multiprocessing, which runs its finalizers
+        util.Finalize(self, self.stop, exitpriority=10)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Count the time and memory of a stage, e.g. the search of a provider.
+        Allocations of other threads are counted too, when stages overlap"""
+        if self.pid != os.getpid():
+            yield
+            return
+        if self.memory:
+            allocated_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            stats = self.stages[stage]
+            stats['calls'] += 1
+            stats['wall'] += time.perf_counter() - wall
+            stats['cpu'] += time.thread_time() - cpu
+            if self.memory:
+                allocated, peak = tracemalloc.get_traced_memory()
+                stats['allocated'] += max(allocated - allocated_before, 0)
+                stats['peak'] = max(stats['peak'], peak - allocated_before)
+
+    def stop(self) -> None:
+        """Stop profiling, and save the profile of this process"""
+        if self.pid != os.getpid():
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        output = Path(self.output_dir) / f'worker-{self.pid}'
+        if self._profile:
+            self._profile.disable()
+        report = {'pid': self.pid, 'stages': dict(self.stages), 'allocation_sites': []}
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, cProfile.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+            ])
+            report['allocation_sites'] = [{'site': str(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+                                          for stat in snapshot.statistics('lineno')[:self.top]]
+            report['peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if self._profile:
+            self._profile.dump_stats(f'{output}.prof')
+        with open(f'{output}.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f)
+        self.pid = None
+
+
+def profile_report(output_dir: str, top: int = 25) -> Optional[str]:
+    """Merge the profiles of all workers into 'merged.prof' and 'report.txt'
+
+    Parameters
+    ----------
+    output_dir : str
+        the `output_dir` of WorkerProfiler
+    top : int, optional
+        the number of functions and allocation sites in the report, by default 25
+
+    Returns
+    -------
+    Optional[str]
+        the report, None if there is no profile in `output_dir`
+    """
+    output_dir = Path(output_dir)
+    reports = [json.loads(path.read_text(encoding='utf-8')) for path in sorted(output_dir.glob('worker-*.json'))]
+    if not reports:
+        return None
+
+    stages = defaultdict(lambda: {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'allocated': 0, 'peak': 0})
+    sites = defaultdict(lambda: {'size': 0, 'count': 0})
+    for report in reports:
+        for stage, stats in report['stages'].items():
+            for key in ['calls', 'wall', 'cpu', 'allocated']:
+                stages[stage][key] += stats[key]
+            stages[stage]['peak'] = max(stages[stage]['peak'], stats['peak'])
+        for site in report['allocation_sites']:
+            sites[site['site']]['size'] += site['size']
+            sites[site['site']]['count'] += site['count']
+
+    lines = [f'Profile of {len(reports)} worker(s)', '',
+             'Stages (wall and CPU seconds, summed over workers):',
+             f"  {'stage':<24}{'calls':>8}{'wall':>10}{'cpu':>10}{'allocated MB':>14}{'peak MB':>10}"]
+    for stage, stats in sorted(stages.items(), key=lambda item: -item[1]['wall']):
+        lines.append(f"  {stage:<24}{stats['calls']:>8}{stats['wall']:>10.2f}{stats['cpu']:>10.2f}"
+                     f"{stats['allocated'] / 2**20:>14.2f}{stats['peak'] / 2**20:>10.2f}")
+
+    if sites:
+        lines += ['', 'Top allocation sites (memory still allocated when workers exit):']
+        for site, stats in sorted(sites.items(), key=lambda item: -item[1]['size'])[:top]:
+            lines.append(f"  {stats['size'] / 2**10:>10.1f} KB {stats['count']:>8} blocks  {site}")
+
+    profiles = [str(path) for path in sorted(output_dir.glob('worker-*.prof'))]
+    if profiles:
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(output_dir / 'merged.prof')
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats('cumulative').print_stats(top)
+        lines += ['', f'Top {top} functions by cumulative time (all workers, see merged.prof):', stream.getvalue()]
+
+    report_text = '\n'.join(lines)
+    (output_dir / 'report.txt').write_text(report_text, encoding='utf-8')
+    return report_text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Merge the profiles of find_sds() workers into one report')
+    parser.add_argument('output_dir', help='the profile_path of find_sds()')
+    parser.add_argument('--top', type=int, default=25, help='functions and allocation sites in the report (default: 25)')
+    args = parser.parse_args()
+    print(profile_report(args.output_dir, top=args.top) or f'No profile in {args.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Progress of a find_sds() run: counts, throughput and ETA.
+
+A line is printed every few seconds, and snapshots can be appended to a
+JSON lines file to watch long runs from another tool, e.g.:
+    [progress] 1200/10000 (12.0%): 900 downloaded, 50 existing, 250 missing, 10 in flight
+    | 3.1 CAS/s, 1.20 MB/s | ETA 0:47:20 | tci=500, chemicalsafety=300, vwr=100
+"""
+
+
+import json
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import timedelta
+from typing import Dict, Mapping, Optional, TextIO
+
+
+class ProgressReporter:
+    """Counts of a run, reported every `interval` seconds from a background thread,
+    so that stalls show up even when no lookup completes
+
+    Rates and ETA are computed over the last `window` seconds, so that a drop
+    of throughput shows up quickly on long runs.
+
+    Parameters
+    ----------
+    total : int
+        the number of CAS numbers of the run
+    workers : int, optional
+        the number of lookups running at the same time, by default 1
+    interval : float, optional
+        seconds between two reports, by default 10
+    window : float, optional
+        seconds over which rates are computed, by default 60
+    stream : TextIO, optional
+        where reports are printed, by default sys.stderr. None to not print
+    snapshot_path : Optional[str], optional
+        a file each report is appended to, as one JSON object per line, by default None
+    started : Optional[Mapping], optional
+        the number of lookups started by each worker, shared with the workers
+        (e.g. `multiprocessing.Manager().dict()`, see count_started()), so that
+        'in_flight' counts the lookups really running. By default None: 'in_flight'
+        is then an estimate, `workers` until fewer lookups are left
+    """
+
+    def __init__(self, total: int, workers: int = 1, interval: float = 10.0, window: float = 60.0,
+                 stream: Optional[TextIO] = sys.stderr, snapshot_path: Optional[str] = None,
+                 started: Optional[Mapping] = None) -> None:
+        self.total = total
+        self.workers = workers
+        self.interval = interval
+        self.window = window
+        self.stream = stream
+        self.snapshot_path = snapshot_path
+        self.started = started
+
+        self.start_time = time.monotonic()
+        self.downloaded = 0
+        self.existing = 0
+        self.missing = 0
+        self.bytes = 0
+        self.provider_hits: Counter = Counter()
+        self.rejected: Counter = Counter()
+        self.last_done_time = self.start_time
+        self._samples = deque([(self.start_time, 0, 0)])
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def done(self) -> int:
+        return self.downloaded + self.existing + self.missing
+
+    def start(self) -> 'ProgressReporter':
+        """Start reporting every `interval` seconds"""
+        if self.interval:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def update(self, downloaded: bool, existed: bool = False, provider: Optional[str] = None,
+               size: int = 0, rejected: Optional[str] = None) -> None:
+        """Count a completed CAS number
+
+        Parameters
+        ----------
+        downloaded : bool
+            True if the SDS was downloaded or already existed
+        existed : bool, optional
+            True if the SDS already existed, by default False
+        provider : Optional[str], optional
+            the provider the SDS was downloaded from, by default None
+        size : int, optional
+            the size (in bytes) of the downloaded SDS, by default 0
+        rejected : Optional[str], optional
+            why a download was aborted (e.g. 'too_large'), by default None
+        """
+        with self._lock:
+            if existed:
+                self.existing += 1
+            elif downloaded:
+                self.downloaded += 1
+                if provider:
+                    self.provider_hits[provider] += 1
+            else:
+                self.missing += 1
+            self.bytes += size
+            if rejected:
+                self.rejected[rejected] += 1
+            self.last_done_time = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        """Get the current counts, rates and ETA
+
+        Returns
+        -------
+        Dict
+            JSON-serializable
+        """
+        with self._lock:
+            now = time.monotonic()
+            done, total_bytes = self.done, self.bytes
+            # Rates over the last `window` seconds
+            self._samples.append((now, done, total_bytes))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+            since, done_then, bytes_then = self._samples[0]
+            elapsed = now - since
+            cas_rate = (done - done_then) / elapsed if elapsed > 0 else 0.0
+            byte_rate = (total_bytes - bytes_then) / elapsed if elapsed > 0 else 0.0
+
+            remaining = self.total - done
+            if self.started is not None:
+                in_flight = max(0, sum(self.started.values()) - done)
+            else:
+                in_flight = min(self.workers, remaining)
+            return {
+                'time': time.time(),
+                'elapsed': round(now - self.start_time, 1),
+                'total': self.total,
+                'done': done,
+                'downloaded': self.downloaded,
+                'existing': self.existing,
+                'missing': self.missing,
+                'in_flight': in_flight,
+                'cas_per_sec': round(cas_rate, 3),
+                'bytes_per_sec': round(byte_rate),
+                'eta': round(remaining / cas_rate) if cas_rate > 0 else None,
+                'since_last_done': round(now - self.last_done_time, 1),
+                'provider_hits': dict(self.provider_hits.most_common()),
+                'rejected': dict(self.rejected.most_common()),
+            }
+
+    def report(self) -> Dict:
+        """Print the current progress and append it to `snapshot_path`
+
+        Returns
+        -------
+        Dict
+            see snapshot()
+        """
+        snapshot = self.snapshot()
+        if self.stream:
+            print(self.format(snapshot), file=self.stream, flush=True)
+        if self.snapshot_path:
+            with open(self.snapshot_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(snapshot) + '\n')
+        return snapshot
+
+    def format(self, snapshot: Dict) -> str:
+        """Format a snapshot as one line"""
+        eta = str(timedelta(seconds=snapshot['eta'])) if snapshot['eta'] is not None else '?'
+        line = ('[progress] {done}/{total} ({percent:.1f}%): {downloaded} downloaded, {existing} existing, '
+                '{missing} missing, {in_flight} in flight | {cas_per_sec:.1f} CAS/s, {mb_per_sec:.2f} MB/s '
+                '| ETA {eta}').format(percent=100 * snapshot['done'] / (snapshot['total'] or 1),
+                                      mb_per_sec=snapshot['bytes_per_sec'] / 2**20, **{**snapshot, 'eta': eta})
+        if snapshot['provider_hits']:
+            line += ' | ' + ', '.join(f'{provider}={hits}' for provider, hits in snapshot['provider_hits'].items())
+        if snapshot['rejected']:
+            line += ' | rejected ' + ', '.join(f'{reason}={count}' for reason, count in snapshot['rejected'].items())
+        if snapshot['in_flight'] and snapshot['since_last_done'] >= 3 * self.interval:
+            line += f" | nothing done for {timedelta(seconds=round(snapshot['since_last_done']))}"
+        return line
+
+    def close(self) -> Dict:
+        """Stop reporting, and write the final snapshot
+
+        Returns
+        -------
+        Dict
+            see snapshot()
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        snapshot = self.snapshot()
+        if self.snapshot_path:
+            with open(self.snapshot_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(snapshot) + '\n')
+        return snapshot
+
+
+def count_started(started: Optional[Dict], key) -> None:
+    """Count a lookup started by a worker in the `started` mapping of a ProgressReporter
+
+    Parameters
+    ----------
+    started : Optional[Dict]
+        see ProgressReporter, nothing is counted if None
+    key
+        the worker (e.g. its pid): each worker only writes its own entry, so no lock is needed
+    """
+    if started is not None:
+        started[key] = started.get(key, 0) + 1
@@ -0,0 +1,136 @@
+"""
+Track the health of SDS providers during a find_sds() run.
+
+A provider that keeps failing (site down, HTML changed, timeouts) is skipped
+for a cooldown period instead of slowing down every single CAS lookup.
+"""
+
+
+import threading
+import time
+from typing import Dict, MutableMapping, Optional
+
+
+class CircuitBreaker:
+    """Circuit breaker for each SDS provider
+
+    After `max_failures` consecutive errors within `window` seconds, the
+    provider's circuit opens and the provider is skipped. Once `cooldown`
+    seconds have passed, a single lookup is let through as a probe: success
+    closes the circuit again, another failure keeps it open for another cooldown.
+
+    The state is kept in a mapping guarded by a lock so that it can be shared
+    across Pool workers using `multiprocessing.Manager().dict()` and
+    `multiprocessing.Manager().Lock()`.
+
+    Parameters
+    ----------
+    max_failures : int, optional
+        the number of consecutive failures that opens the circuit, by default 5
+    window : float, optional
+        failures older than this (in seconds) are forgotten, by default 60
+    cooldown : float, optional
+        how long (in seconds) an open provider is skipped, by default 300
+    state : MutableMapping, optional
+        the mapping holding the state of each provider, by default a new dict
+    lock : optional
+        the lock guarding `state`, by default a new threading.Lock
+    """
+
+    def __init__(self, max_failures: int = 5, window: float = 60.0, cooldown: float = 300.0,
+                 state: Optional[MutableMapping] = None, lock=None) -> None:
+        self.max_failures = max_failures
+        self.window = window
+        self.cooldown = cooldown
+        self.state = state if state is not None else {}
+        self.lock = lock if lock is not None else threading.Lock()
+
+    def _get(self, provider: str) -> Dict:
+        return dict(self.state.get(provider) or {
+            'failures': 0,
+            'first_failure': None,
+            'opened_at': None,
+            'probing': False,
+            'trips': 0,
+            'skipped': 0,
+        })
+
+    def allow(self, provider: str) -> bool:
+        """Check if a lookup on `provider` should go ahead
+
+        Parameters
+        ----------
+        provider : str
+            the name of the SDS provider
+
+        Returns
+        -------
+        bool
+            False if the circuit of the provider is open
+        """
+        with self.lock:
+            status = self._get(provider)
+            if status['opened_at'] is None:
+                return True
+
+            if not status['probing'] and time.monotonic() - status['opened_at'] >= self.cooldown:
+                # Half-open: let this lookup through to probe the provider
+                status['probing'] = True
+                self.state[provider] = status
+                return True
+
+            status['skipped'] += 1
+            self.state[provider] = status
+            return False
+
+    def record_success(self, provider: str) -> None:
+        """Reset the failure count of `provider` and close its circuit"""
+        with self.lock:
+            status = self._get(provider)
+            status.update(failures=0, first_failure=None, opened_at=None, probing=False)
+            self.state[provider] = status
+
+    def record_failure(self, provider: str) -> None:
+        """Count a failure of `provider` and open its circuit if needed"""
+        with self.lock:
+            status = self._get(provider)
+            now = time.monotonic()
+
+            if status['first_failure'] is None or now - status['first_failure'] > self.window:
+                status['failures'] = 0
+                status['first_failure'] = now
+            status['failures'] += 1
+
+            if status['probing'] or (status['opened_at'] is None and status['failures'] >= self.max_failures):
+                status['opened_at'] = now
+                status['probing'] = False
+                status['trips'] += 1
+
+            self.state[provider] = status
+
+    def record_unknown(self, provider: str) -> None:
+        """A lookup of `provider` ended without telling if the provider works
+        (e.g. the lookup ran out of time): let the next lookup probe it instead"""
+        with self.lock:
+            status = self._get(provider)
+            if status['probing']:
+                status['probing'] = False
+                self.state[provider] = status
+
+    def summary(self) -> Dict[str, Dict]:
+        """Get the state of every provider that has had failures
+
+        Returns
+        -------
+        Dict[str, Dict]
+            provider name mapped to a dict with keys:
+            - 'open': True if the circuit is currently open
+            - 'trips': number of times the circuit opened
+            - 'skipped': number of lookups skipped while it was open
+        """
+        with self.lock:
+            return {provider: {'open': status['opened_at'] is not None,
+                               'trips': status['trips'],
+                               'skipped': status['skipped']}
+                    for provider, status in self.state.items()
+                    if status['trips'] or status['skipped']}
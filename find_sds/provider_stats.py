@@ -0,0 +1,169 @@
+"""
+Learn the order in which SDS providers are searched.
+
+The hits, misses and search time of each provider are counted (and kept
+across runs in a JSON file), and providers are searched in the order that
+finds an SDS the soonest on average.
+"""
+
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, MutableMapping, Optional
+
+# Statistics of all CAS numbers, used while a bucket has too few lookups
+ALL = '*'
+
+
+def cas_bucket(cas_nr: str) -> str:
+    """Group CAS numbers by the length of their first part.
+    Short CAS numbers are old, common chemicals (solvents, reagents);
+    long ones are recent, often research-only compounds
+
+    Parameters
+    ----------
+    cas_nr : str
+        CAS# for chemical of interest
+
+    Returns
+    -------
+    str
+        e.g. 'cas-2' for '64-19-7', 'cas-6' for '885051-07-0'
+    """
+    return f'cas-{len(cas_nr.split("-")[0])}'
+
+
+class ProviderStats:
+    """Hit rate and search time of each SDS provider, per bucket of CAS numbers
+
+    Providers are ordered by the expected search time per hit (mean search
+    time / hit rate), which minimizes the expected time to the first hit.
+    Both are smoothed toward a prior so that providers with few lookups are
+    still tried. Providers with the same expected time are ordered with the
+    preferred ones first, then in their default order.
+
+    The counters are kept in a mapping guarded by a lock so that they can be
+    shared across Pool workers using `multiprocessing.Manager().dict()` and
+    `multiprocessing.Manager().Lock()`.
+
+    Parameters
+    ----------
+    path : Optional[str], optional
+        the JSON file the statistics are loaded from and saved to,
+        by default None (statistics of the run only)
+    min_bucket_lookups : int, optional
+        the number of lookups of a provider in a bucket before the bucket
+        statistics are used instead of those of all CAS numbers, by default 20
+    prior_time : float, optional
+        the search time (in seconds) assumed for a provider without lookups, by default 1
+    state : MutableMapping, optional
+        the mapping holding the counters, by default a new dict
+    lock : optional
+        the lock guarding `state`, by default a new threading.Lock
+    """
+
+    def __init__(self, path: Optional[str] = None, min_bucket_lookups: int = 20,
+                 prior_time: float = 1.0, state: Optional[MutableMapping] = None, lock=None) -> None:
+        self.path = path
+        self.min_bucket_lookups = min_bucket_lookups
+        self.prior_time = prior_time
+        self.state = state if state is not None else {}
+        self.lock = lock if lock is not None else threading.Lock()
+
+    def load(self) -> None:
+        """Load the statistics saved in `path`, if any"""
+        if self.path and Path(self.path).exists():
+            saved = json.loads(Path(self.path).read_text(encoding='utf-8'))
+            with self.lock:
+                self.state.update(saved)
+
+    def save(self) -> None:
+        """Save the statistics into `path`"""
+        if not self.path:
+            return
+        with self.lock:
+            data = dict(self.state)
+        tmp_path = Path(f'{self.path}.tmp')
+        tmp_path.write_text(json.dumps(data, indent=1, sort_keys=True), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+    def record(self, provider: str, cas_nr: str, hit: bool, search_time: float) -> None:
+        """Count a search of a provider
+
+        Parameters
+        ----------
+        provider : str
+            the name of the SDS provider
+        cas_nr : str
+            CAS# for chemical of interest
+        hit : bool
+            True if the provider found the SDS
+        search_time : float
+            how long (in seconds) the search took
+        """
+        with self.lock:
+            for bucket in [ALL, cas_bucket(cas_nr)]:
+                key = f'{bucket}|{provider}'
+                hits, misses, total_time = self.state.get(key) or [0, 0, 0.0]
+                self.state[key] = [hits + hit, misses + (not hit), total_time + search_time]
+
+    def expected_time(self, provider: str, cas_nr: Optional[str] = None,
+                      state: Optional[Dict] = None) -> float:
+        """Get the expected search time per hit of a provider
+
+        Parameters
+        ----------
+        provider : str
+            the name of the SDS provider
+        cas_nr : Optional[str], optional
+            use the statistics of the bucket of this CAS number, if it has enough lookups
+        state : Optional[Dict], optional
+            a copy of the counters, by default read from `state`
+
+        Returns
+        -------
+        float
+            the mean search time divided by the hit rate, in seconds
+        """
+        state = state if state is not None else dict(self.state)
+        hits, misses, total_time = state.get(f'{ALL}|{provider}') or [0, 0, 0.0]
+        if cas_nr:
+            bucket_counts = state.get(f'{cas_bucket(cas_nr)}|{provider}')
+            if bucket_counts and bucket_counts[0] + bucket_counts[1] >= self.min_bucket_lookups:
+                hits, misses, total_time = bucket_counts
+
+        lookups = hits + misses
+        hit_rate = (hits + 1) / (lookups + 2)
+        mean_time = (total_time + self.prior_time) / (lookups + 1)
+        return mean_time / hit_rate
+
+    def order(self, providers: Iterable[str], cas_nr: Optional[str] = None,
+              preferred: Optional[Iterable[str]] = None) -> List[str]:
+        """Order providers by their expected search time per hit
+
+        Parameters
+        ----------
+        providers : Iterable[str]
+            the names of the SDS providers, in their default order
+        cas_nr : Optional[str], optional
+            order for this CAS number (see `cas_bucket()`), by default None
+        preferred : Optional[Iterable[str]], optional
+            providers that go first among providers with the same expected
+            time (to 10 ms), by default None
+
+        Returns
+        -------
+        List[str]
+        """
+        providers = list(providers)
+        preferred = list(preferred or [])
+        state = dict(self.state)
+
+        def sort_key(provider: str):
+            return (round(self.expected_time(provider, cas_nr, state), 2),
+                    preferred.index(provider) if provider in preferred else len(preferred),
+                    providers.index(provider))
+
+        return sorted(providers, key=sort_key)
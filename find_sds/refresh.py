@@ -0,0 +1,341 @@
+"""
+Refresh of the SDS files of a download folder, most overdue first, within a
+budget of requests, bytes or time per run.
+
+`find_sds()` never downloads an existing SDS again. A refresh run downloads
+the SDS of the chemicals that are due again, and replaces the files that
+changed. A chemical is due when it has not been checked for `max_age` days,
+sooner when its SDS changed before (or SDS of the same vendor often change),
+and sooner when its revision date is old (see `staleness()`). The revision
+dates come from the SDS index (see sds_index.py) if there is one. Only the
+main SDS of each chemical ('<CAS>-SDS.pdf') is refreshed, not the SDS saved
+for other locales or sources.
+
+When and how each chemical was checked is saved in the download folder
+('.find_sds_refresh.json'), so that successive runs with a small budget go
+through the whole library within `max_age` days. A chemical whose SDS is not
+found is tried again after `FAILURE_DELAY`, doubled after each failure, so
+that it does not take the budget of every run.
+
+Usage:
+    python -m find_sds.refresh SDS --max-requests 500 --max-mb 200 --max-minutes 30
+"""
+
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .find_sds import TCIClient, _download_info, _init_worker, download_sds
+    from .sds_index import INDEX_FILE
+    from .storage import CAS_FILE_NAME, SDSLibrary
+except ImportError:    # running as a script: python find_sds/refresh.py
+    from find_sds import TCIClient, _download_info, _init_worker, download_sds
+    from sds_index import INDEX_FILE
+    from storage import CAS_FILE_NAME, SDSLibrary
+
+STATE_FILE = '.find_sds_refresh.json'
+DAY = 24 * 3600
+# Most vendors revise their SDS at least every few years
+REVISION_AGE = 3 * 365 * DAY
+# Wait before checking again a SDS that was not found, doubled after each failure (up to max_age)
+FAILURE_DELAY = DAY
+DATE_FORMATS = ['%Y-%m-%d', '%d-%b-%Y', '%d-%B-%Y', '%m/%d/%Y', '%d.%m.%Y', '%Y/%m/%d',
+                '%B %d, %Y', '%B %d %Y', '%b %d, %Y', '%d %B %Y', '%d %b %Y']
+
+
+def parse_date(text: Optional[str]) -> Optional[float]:
+    """Get the timestamp of a revision date found in a SDS, None if it is not understood
+
+    Examples
+    --------
+    >>> parse_date('12-Feb-2020') == datetime(2020, 2, 12).timestamp()
+    True
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime((text or '').strip(), date_format).timestamp()
+        except ValueError:
+            pass
+    return None
+
+
+def staleness(now: float, checked: float, max_age: float, changes: int = 0, checks: int = 0,
+              vendor_change_rate: float = 0.0, revision_date: Optional[float] = None) -> float:
+    """Tell how overdue the refresh of a SDS is: due from 1
+
+    The SDS is checked again every `max_age` seconds, divided by 1 + the number of
+    times it changed. Staleness grows faster when SDS of its vendor often change,
+    and doubles when its revision date is older than `REVISION_AGE`.
+
+    Parameters
+    ----------
+    now : float
+        current timestamp
+    checked : float
+        timestamp of the last check (or download) of the SDS
+    max_age : float
+        seconds between two checks of a SDS that never changes
+    changes : int, optional
+        the number of times the SDS changed when it was checked, by default 0
+    checks : int, optional
+        the number of times the SDS was checked, by default 0
+    vendor_change_rate : float, optional
+        the fraction of checks that found a changed SDS, for the vendor of this SDS, by default 0.0
+    revision_date : Optional[float], optional
+        timestamp of the revision date printed in the SDS, by default None (unknown)
+
+    Returns
+    -------
+    float
+    """
+    interval = max_age / (1 + min(changes, checks))
+    score = (now - checked) / interval * (1 + vendor_change_rate)
+    if revision_date is not None and now - revision_date > REVISION_AGE:
+        score *= 2
+    return score
+
+
+class RefreshBudget:
+    """Limits of a refresh run. None means no limit
+
+    Parameters
+    ----------
+    max_requests : Optional[int], optional
+        HTTP requests sent over the network
+    max_bytes : Optional[int], optional
+        bytes of SDS files downloaded
+    max_seconds : Optional[float], optional
+        duration of the run
+    """
+
+    def __init__(self, max_requests: Optional[int] = None, max_bytes: Optional[int] = None,
+                 max_seconds: Optional[float] = None) -> None:
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.start_time = time.monotonic()
+        self.requests = 0
+        self.bytes = 0
+
+    def spend(self, requests: int = 0, size: int = 0) -> None:
+        self.requests += requests
+        self.bytes += size
+
+    def exhausted(self) -> bool:
+        return ((self.max_requests is not None and self.requests >= self.max_requests)
+                or (self.max_bytes is not None and self.bytes >= self.max_bytes)
+                or (self.max_seconds is not None and time.monotonic() - self.start_time >= self.max_seconds))
+
+    def time_left(self) -> Optional[float]:
+        """Seconds left, None if the duration is not limited"""
+        if self.max_seconds is None:
+            return None
+        return max(self.max_seconds - (time.monotonic() - self.start_time), 0.0)
+
+
+class RefreshScheduler:
+    """Order the SDS files of a download folder by staleness, and remember their checks
+
+    Parameters
+    ----------
+    download_path : str
+        the download folder of find_sds()
+    max_age : float, optional
+        seconds between two checks of a SDS that never changes, by default 365 days
+    """
+
+    def __init__(self, download_path: str, max_age: float = 365 * DAY) -> None:
+        self.library = SDSLibrary.open(download_path)
+        self.max_age = max_age
+        self.path = Path(download_path) / STATE_FILE
+        self.state: Dict[str, Dict] = {}
+        if self.path.exists():
+            self.state = json.loads(self.path.read_text(encoding='utf-8'))
+
+    def save(self) -> None:
+        """Write the state atomically"""
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        tmp_path.write_text(json.dumps(self.state, indent=1, sort_keys=True), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+    def _revision_dates(self) -> Dict[str, float]:
+        index_path = self.library.root / INDEX_FILE
+        if not index_path.exists():
+            return {}
+        try:
+            connection = sqlite3.connect(index_path)
+            rows = connection.execute('SELECT cas, revision_date FROM sds WHERE cas IS NOT NULL').fetchall()
+            connection.close()
+        except sqlite3.Error:
+            return {}
+        dates = {cas_nr: parse_date(revision_date) for cas_nr, revision_date in rows}
+        return {cas_nr: date for cas_nr, date in dates.items() if date is not None}
+
+    def vendor_change_rates(self) -> Dict[str, float]:
+        """Fraction of checks that found a changed SDS, for each vendor
+        (smoothed toward 0 for vendors checked a few times only)"""
+        totals: Dict[str, List[int]] = {}
+        for entry in self.state.values():
+            if entry.get('source'):
+                total = totals.setdefault(entry['source'], [0, 0])
+                total[0] += entry.get('changes', 0)
+                total[1] += entry.get('checks', 0)
+        return {source: changes / (checks + 2) for source, (changes, checks) in totals.items()}
+
+    def due(self, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Get the CAS numbers due for a refresh, most overdue first
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            CAS number and staleness (see staleness())
+        """
+        now = time.time() if now is None else now
+        revision_dates = self._revision_dates()
+        vendor_rates = self.vendor_change_rates()
+        scores: Dict[str, float] = {}
+        for path in self.library.files():
+            match = CAS_FILE_NAME.match(path.name)
+            if not match:
+                continue
+            cas_nr = match[1]
+            # Only the main SDS is downloaded again: the SDS of other locales and
+            # sources (see all_sources and sds_locales of find_sds()) are left as they are
+            if path.name != f'{cas_nr}-SDS.pdf':
+                continue
+            entry = self.state.get(cas_nr, {})
+            if entry.get('retry_after', 0) > now:
+                continue
+            score = staleness(now, entry.get('checked') or path.stat().st_mtime, self.max_age,
+                              changes=entry.get('changes', 0), checks=entry.get('checks', 0),
+                              vendor_change_rate=vendor_rates.get(entry.get('source'), 0.0),
+                              revision_date=revision_dates.get(cas_nr))
+            # A file not moved yet to the layout of the folder may be found twice
+            if score >= 1 and score > scores.get(cas_nr, 0):
+                scores[cas_nr] = score
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def record(self, cas_nr: str, changed: bool, source: Optional[str], now: Optional[float] = None) -> None:
+        """Remember a successful check of the SDS of a chemical"""
+        entry = self.state.setdefault(cas_nr, {'checks': 0, 'changes': 0})
+        entry['checked'] = time.time() if now is None else now
+        entry['checks'] += 1
+        entry['changes'] += bool(changed)
+        if source:
+            entry['source'] = source
+        entry.pop('failures', None)
+        entry.pop('retry_after', None)
+
+    def record_failure(self, cas_nr: str, now: Optional[float] = None) -> None:
+        """Remember a check that did not find the SDS of a chemical: it is not
+        due again before `FAILURE_DELAY`, doubled after each failure in a row"""
+        now = time.time() if now is None else now
+        entry = self.state.setdefault(cas_nr, {'checks': 0, 'changes': 0})
+        entry['failures'] = entry.get('failures', 0) + 1
+        entry['retry_after'] = now + min(FAILURE_DELAY * 2 ** (entry['failures'] - 1), self.max_age)
+
+
+def refresh_sds(download_path: str, pool_size: int = 10, max_age_days: float = 365,
+                max_requests: Optional[int] = None, max_mb: Optional[float] = None,
+                max_minutes: Optional[float] = None, cas_deadline: Optional[float] = None) -> Dict[str, int]:
+    """Download again the most overdue SDS of a download folder, within a budget
+
+    CAS numbers are refreshed `pool_size` at a time, and no new ones are started
+    once the budget is spent: a run can exceed its budget by what these last lookups use.
+
+    Parameters
+    ----------
+    download_path : str
+        the download folder of find_sds()
+    pool_size : int, optional
+        the number of SDS refreshed at the same time, by default 10
+    max_age_days : float, optional
+        days between two checks of a SDS that never changes, by default 365
+    max_requests : Optional[int], optional
+        HTTP requests allowed for this run, by default None (no limit)
+    max_mb : Optional[float], optional
+        MB of SDS files allowed for this run, by default None (no limit)
+    max_minutes : Optional[float], optional
+        duration of this run, by default None (no limit)
+    cas_deadline : Optional[float], optional
+        the longest time (in seconds) spent on one CAS number, by default None (no limit)
+
+    Returns
+    -------
+    Dict[str, int]
+        the number of SDS 'due', 'checked', 'changed' and 'failed' (not found this time)
+    """
+    scheduler = RefreshScheduler(download_path, max_age=max_age_days * DAY)
+    budget = RefreshBudget(max_requests=max_requests,
+                           max_bytes=int(max_mb * 2**20) if max_mb is not None else None,
+                           max_seconds=max_minutes * 60 if max_minutes is not None else None)
+    due = [cas_nr for cas_nr, score in scheduler.due()]
+    counts = {'due': len(due), 'checked': 0, 'changed': 0, 'failed': 0}
+
+    task = partial(_refresh_task, download_path=download_path)
+    with Pool(pool_size, initializer=_init_worker, initargs=({'tci_client': TCIClient()},)) as p:
+        for i in range(0, len(due), pool_size):
+            if budget.exhausted():
+                break
+            time_left = budget.time_left()
+            deadline = min(filter(None, [cas_deadline, time_left])) if cas_deadline or time_left else None
+            for cas_nr, found, info in p.map(partial(task, deadline=deadline), due[i:i + pool_size]):
+                budget.spend(info.get('requests', 0), info.get('size', 0))
+                if found:
+                    scheduler.record(cas_nr, info.get('changed', False), info.get('provider'))
+                    counts['checked'] += 1
+                    counts['changed'] += bool(info.get('changed'))
+                else:
+                    scheduler.record_failure(cas_nr)
+                    counts['failed'] += 1
+            scheduler.save()
+    return counts
+
+
+def _refresh_task(cas_nr: str, download_path: str, deadline: Optional[float] = None) -> Tuple[str, bool, Dict]:
+    """Download the SDS of a chemical again (Pool task)
+
+    Returns
+    -------
+    Tuple[str, bool, Dict]
+        CAS number, True if a SDS was found, and the 'provider', 'size',
+        'changed' and 'requests' of the download
+    """
+    info = {}
+    token = _download_info.set(info)
+    try:
+        result = download_sds(cas_nr, download_path=download_path, deadline=deadline, refresh=True)
+    finally:
+        _download_info.reset(token)
+    return cas_nr, bool(result and result[1] and 'provider' in info), info
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Download again the most overdue SDS files of a folder, within a budget')
+    parser.add_argument('download_path')
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--max-age-days', type=float, default=365,
+                        help='days between two checks of a SDS that never changes (default: 365)')
+    parser.add_argument('--max-requests', type=int, help='HTTP requests allowed for this run')
+    parser.add_argument('--max-mb', type=float, help='MB of SDS files allowed for this run')
+    parser.add_argument('--max-minutes', type=float, help='duration of this run')
+    parser.add_argument('--cas-deadline', type=float, help='seconds allowed for one CAS number')
+    args = parser.parse_args()
+
+    counts = refresh_sds(args.download_path, pool_size=args.pool_size, max_age_days=args.max_age_days,
+                         max_requests=args.max_requests, max_mb=args.max_mb, max_minutes=args.max_minutes,
+                         cas_deadline=args.cas_deadline)
+    print('{checked} of {due} overdue SDS checked: {changed} changed, {failed} not found.'.format(**counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,455 @@
+"""
+Cache of HTTP responses received from SDS providers.
+
+Search pages and JSON answers are kept in memory so the same search is not
+sent twice during a run (duplicate CAS numbers, retries, several lookups of
+the same CAS), and optionally on disk so later runs reuse them as long as the
+provider allows (Cache-Control / Expires).
+"""
+
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, MutableMapping, Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+CacheKey = Tuple[str, str, Optional[bytes]]
+
+
+def make_cache_key(method: str, url: str, params=None, data=None, json=None) -> CacheKey:
+    """Build the cache key of a request from its method, URL, query parameters and body
+
+    Parameters
+    ----------
+    method : str
+        'get' or 'post'
+    url : str
+    params, data, json : optional
+        as passed to `requests.get()` / `requests.post()`
+
+    Returns
+    -------
+    CacheKey
+        (method, full url with query string, body)
+    """
+    prepared = requests.Request(method.upper(), url, params=params, data=data, json=json).prepare()
+    body = prepared.body.encode() if isinstance(prepared.body, str) else prepared.body
+    return prepared.method, prepared.url, body
+
+
+def build_response(status_code: int, headers: Dict[str, str], content: bytes, url: str,
+                   encoding: Optional[str] = None, reason: str = '') -> requests.Response:
+    """Build a `requests.Response` from stored parts
+
+    Returns
+    -------
+    requests.Response
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = content
+    response._content_consumed = True
+    response.url = url
+    response.encoding = encoding
+    response.reason = reason
+    return response
+
+
+class ResponseCache:
+    """In-memory LRU cache of HTTP responses with a time to live
+
+    Only successful (200) responses that were not redirected are kept. The
+    least recently used responses are evicted once either `max_entries` or
+    `max_bytes` is exceeded.
+
+    The hit/miss counters can be shared across Pool workers by passing
+    `multiprocessing.Manager().dict()` and `multiprocessing.Manager().Lock()`
+    as `stats` and `stats_lock`; the cached responses stay in each worker.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        the total size of cached response bodies, by default 32 MB
+    max_entries : int, optional
+        the number of cached responses, by default 1024
+    ttl : float, optional
+        how long (in seconds) a response is kept, by default 600
+    stats : MutableMapping, optional
+        the mapping holding the counters, by default a new dict
+    stats_lock : optional
+        the lock guarding `stats`, by default a new threading.Lock
+    """
+
+    def __init__(self, max_bytes: int = 32 * 2**20, max_entries: int = 1024, ttl: float = 600.0,
+                 stats: Optional[MutableMapping] = None, stats_lock=None) -> None:
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = stats if stats is not None else {}
+        self.stats_lock = stats_lock if stats_lock is not None else threading.Lock()
+        self._init_entries()
+
+    def _init_entries(self) -> None:
+        self._entries: 'OrderedDict[CacheKey, Tuple[float, Dict]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict:
+        # Cached responses are not sent to other processes, only the settings and counters
+        state = self.__dict__.copy()
+        for name in ['_entries', '_size', '_lock']:
+            del state[name]
+        if isinstance(self.stats_lock, type(self._lock)):
+            state['stats_lock'] = None    # a local lock, unlike a Manager().Lock()
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        if self.stats_lock is None:
+            self.stats_lock = threading.Lock()
+        self._init_entries()
+
+    def _count(self, counter: str) -> None:
+        with self.stats_lock:
+            self.stats[counter] = self.stats.get(counter, 0) + 1
+
+    def _remove(self, key: CacheKey) -> None:
+        expires, entry = self._entries.pop(key)
+        self._size -= len(entry['content'])
+
+    def get(self, key: CacheKey) -> Optional[Tuple[requests.Response, Optional[requests.cookies.RequestsCookieJar]]]:
+        """Get a cached response
+
+        Parameters
+        ----------
+        key : CacheKey
+            see make_cache_key()
+
+        Returns
+        -------
+        Optional[Tuple[requests.Response, Optional[RequestsCookieJar]]]
+            a copy of the cached response and the cookies it set,
+            None if the response is not cached or has expired
+        """
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] < time.monotonic():
+                self._remove(key)
+                cached = None
+            if cached:
+                self._entries.move_to_end(key)
+
+        self._count('hits' if cached else 'misses')
+        if not cached:
+            return None
+
+        entry = cached[1]
+        response = build_response(entry['status_code'], entry['headers'], entry['content'],
+                                  entry['url'], entry['encoding'], entry['reason'])
+        if entry['cookies'] is not None:
+            response.cookies.update(entry['cookies'])
+        return response, entry['cookies']
+
+    def put(self, key: CacheKey, response: requests.Response) -> None:
+        """Cache a response if it is cacheable
+
+        Parameters
+        ----------
+        key : CacheKey
+            see make_cache_key()
+        response : requests.Response
+        """
+        if response.status_code != 200 or response.history:
+            return
+
+        content = response.content
+        if len(content) > self.max_bytes:
+            return
+
+        entry = {
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'content': content,
+            'url': response.url,
+            'encoding': response.encoding,
+            'reason': response.reason,
+            'cookies': response.cookies.copy() if response.cookies else None,
+        }
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._size += len(content)
+
+            evicted = 0
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+
+        for _ in range(evicted):
+            self._count('evictions')
+
+    def summary(self) -> Dict[str, int]:
+        """Get the hit, miss and eviction counts
+
+        Returns
+        -------
+        Dict[str, int]
+        """
+        with self.stats_lock:
+            return {counter: self.stats.get(counter, 0) for counter in ['hits', 'misses', 'evictions']}
+
+
+def freshness_lifetime(headers: Mapping[str, str], default_ttl: float) -> Optional[float]:
+    """Get how long (in seconds) a response may be reused, from its Cache-Control,
+    Expires, Date and Age headers (as a private cache, see RFC 9111)
+
+    Parameters
+    ----------
+    headers : Mapping[str, str]
+        the headers of the response, case-insensitive
+    default_ttl : float
+        the lifetime of responses that do not tell
+
+    Returns
+    -------
+    Optional[float]
+        None if the response must not be stored (no-store, no-cache)
+    """
+    directives = {}
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives or 'no-cache' in directives:
+        return None
+
+    age = _parse_seconds(headers.get('Age')) or 0
+    if 'max-age' in directives:
+        lifetime = _parse_seconds(directives['max-age'])
+        return lifetime - age if lifetime is not None else None
+
+    if 'Expires' in headers:
+        expires = _parse_http_date(headers['Expires'])
+        if expires is None:    # e.g. 'Expires: 0', already expired
+            return None
+        date = _parse_http_date(headers.get('Date', '')) or time.time()
+        return expires - date - age
+
+    return default_ttl - age
+
+
+def _parse_seconds(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class DiskResponseCache:
+    """HTTP responses of SDS providers kept in an SQLite file across runs,
+    shared by all processes using the same file
+
+    Responses are reused as long as their Cache-Control / Expires headers
+    allow, or for `default_ttl` if they do not tell. The least recently used
+    responses are evicted once the cached bodies exceed `max_bytes`, checked
+    every `evict_interval` responses cached by a process (or sooner once it
+    has cached 5% of `max_bytes`), so that caching does not slow down as the
+    cache grows.
+
+    Parameters
+    ----------
+    path : str
+        the SQLite file of the cache, created if it does not exist
+    max_bytes : int, optional
+        the total size of cached response bodies, by default 256 MB
+    default_ttl : float, optional
+        how long (in seconds) a response without caching headers is kept, by default 1 day
+    evict_interval : int, optional
+        the number of responses cached between two evictions, by default 100
+    stats : MutableMapping, optional
+        the mapping holding the counters, by default a new dict
+    stats_lock : optional
+        the lock guarding `stats`, by default a new threading.Lock
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 2**20, default_ttl: float = 24 * 3600,
+                 evict_interval: int = 100, stats: Optional[MutableMapping] = None, stats_lock=None) -> None:
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.evict_interval = evict_interval
+        # Cached by this process since the last eviction
+        self._puts = 0
+        self._put_bytes = 0
+        self.stats = stats if stats is not None else {}
+        self.stats_lock = stats_lock if stats_lock is not None else threading.Lock()
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    status_code INTEGER NOT NULL,
+                    reason TEXT,
+                    encoding TEXT,
+                    headers TEXT NOT NULL,
+                    cookies TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )''')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)')
+
+    def __getstate__(self) -> Dict:
+        # Each process opens its own connection
+        state = self.__dict__.copy()
+        del state['_local']
+        if isinstance(self.stats_lock, type(threading.Lock())):
+            state['stats_lock'] = None    # a local lock, unlike a Manager().Lock()
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        if self.stats_lock is None:
+            self.stats_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=30)
+            # Readers do not wait for writers of other processes
+            connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def _count(self, counter: str, count: int = 1) -> None:
+        with self.stats_lock:
+            self.stats[counter] = self.stats.get(counter, 0) + count
+
+    @staticmethod
+    def _key(key: CacheKey) -> str:
+        method, url, body = key
+        return hashlib.sha256(b'\n'.join([method.encode(), url.encode(), body or b''])).hexdigest()
+
+    def get(self, key: CacheKey) -> Optional[Tuple[requests.Response, Optional[requests.cookies.RequestsCookieJar]]]:
+        """Get a cached response
+
+        Parameters
+        ----------
+        key : CacheKey
+            see make_cache_key()
+
+        Returns
+        -------
+        Optional[Tuple[requests.Response, Optional[RequestsCookieJar]]]
+            the cached response and the cookies it set,
+            None if the response is not cached or has expired
+        """
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT status_code, headers, content, url, encoding, reason, cookies, expires, accessed '
+            'FROM responses WHERE key = ?', (self._key(key),)).fetchone()
+        if not row or row[7] < now:
+            self._count('misses')
+            return None
+
+        status_code, headers, content, url, encoding, reason, cookies, expires, accessed = row
+        # Recently used responses are not touched again, to save writes
+        if now - accessed > 60:
+            with connection:
+                connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, self._key(key)))
+        self._count('hits')
+
+        response = build_response(status_code, json.loads(headers), content, url, encoding, reason)
+        cookie_jar = None
+        if json.loads(cookies):
+            cookie_jar = requests.cookies.RequestsCookieJar()
+            for cookie in json.loads(cookies):
+                cookie_jar.set_cookie(requests.cookies.create_cookie(**cookie))
+            response.cookies.update(cookie_jar)
+        return response, cookie_jar
+
+    def put(self, key: CacheKey, response: requests.Response) -> None:
+        """Cache a response if it is cacheable
+
+        Parameters
+        ----------
+        key : CacheKey
+            see make_cache_key()
+        response : requests.Response
+        """
+        if response.status_code != 200 or response.history:
+            return
+        lifetime = freshness_lifetime(response.headers, self.default_ttl)
+        content = response.content
+        if not lifetime or lifetime <= 0 or len(content) > self.max_bytes:
+            return
+
+        cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path}
+                   for cookie in response.cookies]
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               (self._key(key), response.url, response.status_code, response.reason,
+                                response.encoding, json.dumps(dict(response.headers)), json.dumps(cookies),
+                                content, len(content), now + lifetime, now))
+        self._puts += 1
+        self._put_bytes += len(content)
+        if self._puts >= self.evict_interval or self._put_bytes >= self.max_bytes / 20:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove expired responses, then the least recently used ones while the cache is too big"""
+        self._puts = self._put_bytes = 0
+        with self._connection() as connection:
+            evicted = connection.execute('DELETE FROM responses WHERE expires < ?', (time.time(),)).rowcount
+            total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total_size > self.max_bytes:
+                to_remove = []
+                for key, size in connection.execute('SELECT key, size FROM responses ORDER BY accessed'):
+                    if total_size <= self.max_bytes:
+                        break
+                    to_remove.append((key,))
+                    total_size -= size
+                connection.executemany('DELETE FROM responses WHERE key = ?', to_remove)
+                evicted += len(to_remove)
+        if evicted:
+            self._count('evictions', evicted)
+
+    def summary(self) -> Dict[str, int]:
+        """Get the hit, miss and eviction counts
+
+        Returns
+        -------
+        Dict[str, int]
+        """
+        with self.stats_lock:
+            return {counter: self.stats.get(counter, 0) for counter in ['hits', 'misses', 'evictions']}
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            # Leave the cache within its size
+            if self._puts:
+                self._evict()
+            connection.close()
+            self._local.connection = None
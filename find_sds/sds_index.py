@@ -0,0 +1,276 @@
+"""
+Searchable index of the downloaded SDS files: text and key fields (product
+name, vendor, revision date, signal word, GHS hazard and precautionary codes).
+
+The index is an SQLite file kept in the download folder ('.sds_index.sqlite').
+PDF text is extracted by a pool of processes, and only new or changed files
+are read again when the index is updated. Reading PDFs needs `pypdf`
+(pip install pypdf); searching the index does not.
+
+Usage:
+    python -m find_sds.sds_index update SDS
+    python -m find_sds.sds_index search SDS --hazard H350 --signal-word Danger
+    python -m find_sds.sds_index search SDS --text "flammable liquid"
+"""
+
+
+import argparse
+import re
+import sqlite3
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import pypdf
+except ImportError:    # only needed to read PDF files
+    pypdf = None
+
+try:
+    from .storage import CAS_FILE_NAME, SDSLibrary
+except ImportError:    # running as a script: python find_sds/sds_index.py
+    from storage import CAS_FILE_NAME, SDSLibrary
+
+INDEX_FILE = '.sds_index.sqlite'
+
+# Hazard statements, also combined ones such as 'H300+H310+H330'
+H_CODE = re.compile(r'\b(EUH\d{3}|H\d{3}[A-Za-z]{0,2})(?:\b|(?=\+))')
+P_CODE = re.compile(r'\b(P\d{3})(?:\b|(?=\+))')
+SIGNAL_WORD = re.compile(r'Signal\s+word\s*:?\s*(Danger|Warning)', re.IGNORECASE)
+PRODUCT_NAME = re.compile(r'Product\s+name\s*:?\s*(.+)', re.IGNORECASE)
+VENDOR = re.compile(r'(?:Company|Manufacturer|Supplier)(?:\s+name)?\s*:?\s*(.+)', re.IGNORECASE)
+# e.g. '2021-03-01', '12-Feb-2020', '03/01/2021', 'March 1, 2021', '1 March 2021'
+REVISION_DATE = re.compile(r'(?:Revision|Revised|Version)\s+date\s*:?\s*'
+                           r'(\d{1,4}[-./]\w{1,9}[-./]\d{2,4}|[A-Za-z]+\s+\d{1,2},?\s+\d{4}|\d{1,2}\s+[A-Za-z]+\s+\d{4})',
+                           re.IGNORECASE)
+
+
+def extract_text(path: str) -> str:
+    """Get the text of a PDF file
+
+    Raises
+    ------
+    ImportError
+        if pypdf is not installed
+    """
+    if pypdf is None:
+        raise ImportError('Reading SDS files needs pypdf: pip install pypdf')
+    reader = pypdf.PdfReader(path)
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def parse_sds(text: str) -> Dict[str, Optional[str]]:
+    """Find the key fields of a SDS in its text
+
+    Parameters
+    ----------
+    text : str
+        the text of the SDS
+
+    Returns
+    -------
+    Dict[str, Optional[str]]
+        'product_name', 'vendor', 'revision_date', 'signal_word' (None if not found),
+        'h_codes' and 'p_codes' (space-separated codes, sorted)
+
+    Examples
+    --------
+    >>> parse_sds('Product name : Acetic acid\\nSignal word Danger\\nH226 H314\\nP280+P305')['h_codes']
+    'H226 H314'
+    """
+    def first(pattern: re.Pattern) -> Optional[str]:
+        match = pattern.search(text)
+        return match[1].strip() if match else None
+
+    signal_word = first(SIGNAL_WORD)
+    return {
+        'product_name': first(PRODUCT_NAME),
+        'vendor': first(VENDOR),
+        'revision_date': first(REVISION_DATE),
+        'signal_word': signal_word.capitalize() if signal_word else None,
+        'h_codes': ' '.join(sorted(set(H_CODE.findall(text)))),
+        'p_codes': ' '.join(sorted(set(P_CODE.findall(text)))),
+    }
+
+
+def _index_file(path: str) -> Tuple[str, Optional[Dict], Optional[str]]:
+    """Read a SDS file (Pool task)
+
+    Returns
+    -------
+    Tuple[str, Optional[Dict], Optional[str]]
+        the path, its fields and text (see parse_sds()), and the error if it cannot be read
+    """
+    try:
+        text = extract_text(path)
+        return path, {**parse_sds(text), 'text': text}, None
+    except ImportError:
+        raise
+    except Exception as error:
+        return path, None, repr(error)
+
+
+class SDSIndex:
+    """Index of the SDS files of a download folder
+
+    Parameters
+    ----------
+    download_path : str
+        the download folder of find_sds()
+    """
+
+    def __init__(self, download_path: str) -> None:
+        self.library = SDSLibrary.open(download_path)
+        self.connection = sqlite3.connect(Path(download_path) / INDEX_FILE, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS sds (
+                    path TEXT PRIMARY KEY,
+                    cas TEXT,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    product_name TEXT,
+                    vendor TEXT,
+                    revision_date TEXT,
+                    signal_word TEXT,
+                    h_codes TEXT NOT NULL,
+                    p_codes TEXT NOT NULL,
+                    error TEXT
+                )''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS sds_cas ON sds (cas)')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS codes (
+                    code TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    PRIMARY KEY (code, path)
+                ) WITHOUT ROWID''')
+            self.connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS sds_text USING fts5(path UNINDEXED, text)')
+
+    def update(self, processes: Optional[int] = None) -> Dict[str, int]:
+        """Index the new and changed SDS files of the download folder,
+        and forget the deleted ones
+
+        Parameters
+        ----------
+        processes : Optional[int], optional
+            the number of processes reading PDF files, by default the number of CPUs
+
+        Returns
+        -------
+        Dict[str, int]
+            the number of files 'indexed', 'unchanged', 'removed' and 'failed'
+        """
+        indexed = {row['path']: (row['size'], row['mtime'])
+                   for row in self.connection.execute('SELECT path, size, mtime FROM sds')}
+        files = {}
+        for path in self.library.files():
+            stat = path.stat()
+            files[str(path.relative_to(self.library.root))] = (stat.st_size, stat.st_mtime)
+
+        changed = [path for path, signature in files.items() if indexed.get(path) != signature]
+        removed = [path for path in indexed if path not in files]
+        counts = {'indexed': 0, 'unchanged': len(files) - len(changed), 'removed': len(removed), 'failed': 0}
+
+        with self.connection:
+            for path in removed:
+                self._delete(path)
+
+        if changed:
+            full_paths = [str(self.library.root / path) for path in changed]
+            with Pool(processes) as p:
+                for full_path, fields, error in p.imap_unordered(_index_file, full_paths, chunksize=8):
+                    path = str(Path(full_path).relative_to(self.library.root))
+                    self._save(path, files[path], fields, error)
+                    counts['failed' if error else 'indexed'] += 1
+        return counts
+
+    def _delete(self, path: str) -> None:
+        for table in ['sds', 'codes', 'sds_text']:
+            self.connection.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+
+    def _save(self, path: str, signature: Tuple[int, float], fields: Optional[Dict], error: Optional[str]) -> None:
+        fields = fields or {'product_name': None, 'vendor': None, 'revision_date': None,
+                            'signal_word': None, 'h_codes': '', 'p_codes': '', 'text': ''}
+        match = CAS_FILE_NAME.match(Path(path).name)
+        with self.connection:
+            self._delete(path)
+            self.connection.execute(
+                'INSERT INTO sds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, match[1] if match else None, *signature, fields['product_name'], fields['vendor'],
+                 fields['revision_date'], fields['signal_word'], fields['h_codes'], fields['p_codes'], error))
+            self.connection.executemany('INSERT INTO codes VALUES (?, ?)',
+                                        [(code, path) for code in (fields['h_codes'] + ' ' + fields['p_codes']).split()])
+            self.connection.execute('INSERT INTO sds_text VALUES (?, ?)', (path, fields['text']))
+
+    def search(self, code: Optional[str] = None, signal_word: Optional[str] = None,
+               text: Optional[str] = None, cas_nr: Optional[str] = None) -> List[Dict]:
+        """Find SDS files matching all given criteria
+
+        Parameters
+        ----------
+        code : Optional[str], optional
+            a GHS hazard or precautionary code, e.g. 'H350' or 'P201'
+        signal_word : Optional[str], optional
+            'Danger' or 'Warning'
+        text : Optional[str], optional
+            words of the SDS text, in SQLite FTS5 query syntax (e.g. '"flammable liquid"')
+        cas_nr : Optional[str], optional
+            CAS# for chemical of interest
+
+        Returns
+        -------
+        List[Dict]
+            the fields of each SDS file, with its 'path' in the download folder
+        """
+        query = ('SELECT path, cas, product_name, vendor, revision_date, signal_word, h_codes, p_codes '
+                 'FROM sds WHERE error IS NULL')
+        args = []
+        if code:
+            query += ' AND path IN (SELECT path FROM codes WHERE code = ?)'
+            args.append(code.upper())
+        if signal_word:
+            query += ' AND signal_word = ?'
+            args.append(signal_word.capitalize())
+        if text:
+            query += ' AND path IN (SELECT path FROM sds_text WHERE sds_text MATCH ?)'
+            args.append(text)
+        if cas_nr:
+            query += ' AND cas = ?'
+            args.append(cas_nr)
+        query += ' ORDER BY cas'
+        return [{**dict(row), 'path': self.library.root / row['path']}
+                for row in self.connection.execute(query, args)]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Index and search the text and hazards of downloaded SDS files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update = subparsers.add_parser('update', help='index new and changed SDS files')
+    update.add_argument('download_path')
+    update.add_argument('--processes', type=int, help='processes reading PDF files (default: number of CPUs)')
+
+    search = subparsers.add_parser('search', help='find SDS files')
+    search.add_argument('download_path')
+    search.add_argument('--hazard', help="GHS hazard or precautionary code, e.g. 'H350'")
+    search.add_argument('--signal-word', choices=['Danger', 'Warning'])
+    search.add_argument('--text', help='words of the SDS text (SQLite FTS5 query)')
+    search.add_argument('--cas')
+
+    args = parser.parse_args()
+    index = SDSIndex(args.download_path)
+    if args.command == 'update':
+        counts = index.update(processes=args.processes)
+        print('{indexed} SDS files indexed, {unchanged} unchanged, {removed} removed, {failed} failed.'.format(**counts))
+    else:
+        for row in index.search(code=args.hazard, signal_word=args.signal_word, text=args.text, cas_nr=args.cas):
+            print('{cas}\t{signal_word}\t{h_codes}\t{product_name}\t{path}'.format(**row))
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+Long-running SDS lookup service.
+
+Keeps HTTP sessions, provider state and results warm between lookups, and
+coalesces concurrent lookups of the same CAS number into a single search.
+
+Usage:
+    python -m find_sds.service --download-path SDS --port 8765
+    python -m find_sds.service --download-path SDS --unix-socket /tmp/find_sds.sock
+
+Endpoints:
+    GET /sds/<cas_nr>        the SDS file (application/pdf), 404 if not found
+    GET /sds/<cas_nr>/url    {"cas_nr": ..., "source": ..., "url": ...}
+"""
+
+
+import argparse
+import json
+import os
+import re
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+
+try:
+    from .find_sds import TCIClient, _find_download_url, _init_worker, download_sds
+    from .http2 import HTTP2Adapter
+    from .provider_health import CircuitBreaker
+    from .response_cache import ResponseCache
+    from .storage import sds_path
+except ImportError:    # running as a script: python find_sds/service.py
+    from find_sds import TCIClient, _find_download_url, _init_worker, download_sds
+    from http2 import HTTP2Adapter
+    from provider_health import CircuitBreaker
+    from response_cache import ResponseCache
+    from storage import sds_path
+
+# Only well-formed CAS numbers are looked up (they are also used as file names)
+CAS_PATTERN = re.compile(r'^\d{2,7}-\d{2}-\d$')
+
+
+class SDSService:
+    """SDS lookups shared by every client of a long-running process
+
+    Parameters
+    ----------
+    download_path : str
+        the folder holding downloaded SDS files, also used as the PDF cache
+    url_ttl : float, optional
+        how long (in seconds) a looked up URL (or a miss) is kept, by default 1 day
+    pool_maxsize : int, optional
+        the number of connections kept open per host, by default 20
+        (in all, with `http2`)
+    http2 : bool, optional
+        multiplex the requests of all lookups over HTTP/2 connections,
+        HTTP/1.1 for hosts without HTTP/2, by default False. Needs `httpx[http2]`
+
+    Notes
+    -----
+    The session, circuit breaker, response cache and TCI client of the
+    service are installed as the module state of `find_sds.find_sds`, for
+    the whole process: a find_sds() run or a second `SDSService` in the same
+    process uses (or replaces) them. Run one service per process, and call
+    close() to put the previous state back when embedding it.
+    """
+
+    def __init__(self, download_path: str, url_ttl: float = 24 * 3600, pool_maxsize: int = 20,
+                 http2: bool = False) -> None:
+        self.download_path = Path(download_path)
+        self.url_ttl = url_ttl
+        self.stats = {'lookups': 0, 'coalesced': 0, 'cached': 0}
+
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[str, str], Future] = {}
+        self._urls: Dict[str, Tuple[float, Optional[str], Optional[str]]] = {}
+        # CAS numbers whose SDS could not be downloaded, with the time of the attempt
+        self._misses: Dict[str, float] = {}
+
+        os.makedirs(self.download_path, exist_ok=True)
+
+        # Warm session, provider health and responses shared by all lookups of this process
+        session = requests.Session()
+        http2_adapter = HTTP2Adapter(max_connections=pool_maxsize) if http2 else None
+        adapter = http2_adapter or requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        self._previous_state = _init_worker({'http_session': session, 'circuit_breaker': CircuitBreaker(),
+                      'response_cache': ResponseCache(), 'tci_client': TCIClient(),
+                      'probe_urls': True, 'http2_adapter': http2_adapter})
+
+    def close(self) -> None:
+        """Put back the module state of `find_sds.find_sds` replaced by the service"""
+        if self._previous_state is not None:
+            _init_worker(self._previous_state)
+            self._previous_state = None
+
+    def _known_miss(self, cas_nr: str) -> bool:
+        # Caller holds the lock
+        now = time.monotonic()
+        cached = self._urls.get(cas_nr)
+        if cached and cached[2] is None and now - cached[0] < self.url_ttl:
+            return True
+        missed_at = self._misses.get(cas_nr)
+        return missed_at is not None and now - missed_at < self.url_ttl
+
+    def _coalesce(self, key: Tuple[str, str], func: Callable):
+        """Run `func()` once for all concurrent callers asking for the same `key`"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.stats['lookups'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if owner:
+            try:
+                future.set_result(func())
+            except Exception as error:
+                future.set_exception(error)
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+        return future.result()
+
+    def lookup_url(self, cas_nr: str) -> Tuple[Optional[str], Optional[str]]:
+        """Find the SDS url of a chemical
+
+        Parameters
+        ----------
+        cas_nr : str
+            CAS# for chemical of interest
+
+        Returns
+        -------
+        Tuple[Optional[str], Optional[str]]
+            the name of the SDS source and the URL of the SDS file,
+            (None, None) if URL cannot be found
+        """
+        with self._lock:
+            cached = self._urls.get(cas_nr)
+            if cached and time.monotonic() - cached[0] < self.url_ttl:
+                self.stats['cached'] += 1
+                return cached[1], cached[2]
+
+        def search() -> Tuple[Optional[str], Optional[str]]:
+            provider, sds_source, full_url = _find_download_url(cas_nr)
+            with self._lock:
+                self._urls[cas_nr] = (time.monotonic(), sds_source, full_url)
+            return sds_source, full_url
+
+        return self._coalesce(('url', cas_nr), search)
+
+    def get_sds(self, cas_nr: str) -> Optional[Path]:
+        """Get the SDS file of a chemical, downloading it if needed
+
+        Parameters
+        ----------
+        cas_nr : str
+            CAS# for chemical of interest
+
+        Returns
+        -------
+        Optional[Path]
+            the path to the SDS file, None if SDS cannot be found
+            (misses are kept for `url_ttl` too)
+        """
+        download_file = sds_path(self.download_path, cas_nr)
+        if download_file:
+            with self._lock:
+                self.stats['cached'] += 1
+            return download_file
+
+        with self._lock:
+            if self._known_miss(cas_nr):
+                self.stats['cached'] += 1
+                return None
+
+        def download() -> Optional[Path]:
+            download_sds(cas_nr, download_path=self.download_path)
+            download_file = sds_path(self.download_path, cas_nr)
+            if not download_file:
+                with self._lock:
+                    self._misses[cas_nr] = time.monotonic()
+            return download_file
+
+        return self._coalesce(('sds', cas_nr), download)
+
+
+class SDSRequestHandler(BaseHTTPRequestHandler):
+    """Serve the `SDSService` of the server over HTTP"""
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Dict) -> None:
+        self._send(status, json.dumps(data).encode())
+
+    def do_GET(self) -> None:
+        service: SDSService = self.server.service
+        match = re.fullmatch(r'/sds/([^/]+)(/url)?/?', self.path)
+        if not match:
+            self._send_json(404, {'error': 'unknown endpoint'})
+            return
+
+        cas_nr, want_url = match[1], match[2]
+        if not CAS_PATTERN.match(cas_nr):
+            self._send_json(400, {'error': f'invalid CAS number: {cas_nr}'})
+            return
+
+        try:
+            if want_url:
+                sds_source, full_url = service.lookup_url(cas_nr)
+                self._send_json(200 if full_url else 404,
+                                {'cas_nr': cas_nr, 'source': sds_source, 'url': full_url})
+            else:
+                download_file = service.get_sds(cas_nr)
+                if download_file:
+                    self._send(200, download_file.read_bytes(), content_type='application/pdf')
+                else:
+                    self._send_json(404, {'cas_nr': cas_nr, 'error': 'SDS not found'})
+        except Exception as error:
+            self._send_json(500, {'cas_nr': cas_nr, 'error': repr(error)})
+
+
+if hasattr(socketserver, 'UnixStreamServer'):    # not available on Windows
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def make_server(service: SDSService, host: str = '127.0.0.1', port: int = 8765,
+                unix_socket: Optional[str] = None) -> socketserver.BaseServer:
+    """Create the HTTP server of the service.
+    Call `serve_forever()` on it, possibly from a thread to embed the service
+
+    Parameters
+    ----------
+    service : SDSService
+    host : str, optional
+        by default '127.0.0.1'
+    port : int, optional
+        by default 8765
+    unix_socket : Optional[str], optional
+        path of a Unix socket to listen on instead of host and port, by default None
+
+    Returns
+    -------
+    socketserver.BaseServer
+
+    Raises
+    ------
+    ValueError
+        if `unix_socket` is given on a platform without Unix sockets (Windows)
+    """
+    if unix_socket and not hasattr(socketserver, 'UnixStreamServer'):
+        raise ValueError('Unix sockets are not supported on this platform')
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixHTTPServer(unix_socket, SDSRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), SDSRequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve SDS lookups from a long-running process')
+    parser.add_argument('--download-path', default='SDS', help='folder of the SDS files (default: SDS)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', help='listen on this Unix socket instead of host:port')
+    parser.add_argument('--url-ttl', type=float, default=24 * 3600,
+                        help='seconds a looked up URL is kept (default: 1 day)')
+    parser.add_argument('--http2', action='store_true',
+                        help="multiplex the requests of concurrent lookups over shared HTTP/2 connections "
+                             "(needs httpx[http2]). Unlike the process pool of find_sds(), which saves "
+                             "no connections with HTTP/2, the lookups of the service share them")
+    args = parser.parse_args()
+    if args.unix_socket and not hasattr(socketserver, 'UnixStreamServer'):
+        parser.error('Unix sockets are not supported on this platform')
+
+    service = SDSService(args.download_path, url_ttl=args.url_ttl, http2=args.http2)
+    server = make_server(service, host=args.host, port=args.port, unix_socket=args.unix_socket)
+    print(f'Serving SDS lookups on {args.unix_socket or f"http://{args.host}:{args.port}"}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+Layout of the SDS files in the download folder.
+
+By default all SDS files are saved in the download folder itself, as
+'<CAS>-SDS.pdf'. Large libraries can spread them into subfolders instead:
+    'prefix': by the first part of the CAS number, in thousands
+              ('64-19-7' -> 0000/64-19-7-SDS.pdf, '885051-07-0' -> 0885/885051-07-0-SDS.pdf)
+    'hash':   by the first characters of a hash of the CAS number
+              ('64-19-7' -> 4b/64-19-7-SDS.pdf)
+
+SDS of each vendor of a chemical (see `all_sources` of find_sds()) are
+saved next to it as '<CAS>-<source>-SDS.pdf' (see `source_file_name()`).
+
+The layout is recorded in the download folder ('.find_sds_layout.json') so
+that `sds_path()` finds the SDS of a CAS number whatever the layout. While
+`migrate()` moves the files, the other layouts are searched too.
+
+Usage:
+    python -m find_sds.storage migrate SDS --layout hash
+    python -m find_sds.storage path SDS 64-19-7
+"""
+
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+LAYOUTS = ['flat', 'prefix', 'hash']
+LAYOUT_FILE = '.find_sds_layout.json'
+# SDS files are named after the CAS number, e.g. '64-19-7-SDS.pdf'
+CAS_FILE_NAME = re.compile(r'^(\d{2,7}-\d{2}-\d)-')
+
+
+class SDSLibrary:
+    """The SDS files of a download folder
+
+    Parameters
+    ----------
+    root : str
+        the download folder
+    layout : str, optional
+        one of `LAYOUTS`, by default 'flat'
+    hash_levels : int, optional
+        the number of nested subfolders of the 'hash' layout (256 each), by default 1
+    migrating : bool, optional
+        files are being moved from another layout (see migrate()), so find()
+        searches all layouts, by default False
+    """
+
+    def __init__(self, root: str, layout: str = 'flat', hash_levels: int = 1, migrating: bool = False) -> None:
+        if layout not in LAYOUTS:
+            raise ValueError(f'layout must be one of {LAYOUTS}, not {layout!r}')
+        self.root = Path(root)
+        self.layout = layout
+        self.hash_levels = hash_levels
+        self.migrating = migrating
+
+    @classmethod
+    def open(cls, root: str) -> 'SDSLibrary':
+        """Open a download folder with the layout recorded in it ('flat' if none)"""
+        layout_file = Path(root) / LAYOUT_FILE
+        if not layout_file.exists():
+            return cls(root)
+        return cls(root, **json.loads(layout_file.read_text(encoding='utf-8')))
+
+    def save_layout(self) -> None:
+        """Record the layout in the download folder"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        settings = {'layout': self.layout, 'hash_levels': self.hash_levels, 'migrating': self.migrating}
+        tmp_file = self.root / f'{LAYOUT_FILE}.tmp'
+        tmp_file.write_text(json.dumps(settings), encoding='utf-8')
+        os.replace(tmp_file, self.root / LAYOUT_FILE)
+
+    def _folder(self, cas_nr: str, layout: str) -> Path:
+        if layout == 'prefix':
+            first_part = cas_nr.split('-')[0]
+            return self.root / (f'{int(first_part) // 1000:04d}' if first_part.isdigit() else 'other')
+        if layout == 'hash':
+            digest = hashlib.sha1(cas_nr.encode()).hexdigest()
+            return self.root.joinpath(*[digest[2 * i:2 * i + 2] for i in range(self.hash_levels)])
+        return self.root
+
+    def path(self, cas_nr: str, file_name: Optional[str] = None, layout: Optional[str] = None) -> Path:
+        """Get the path of the SDS file of a chemical (which may not exist yet)
+
+        Parameters
+        ----------
+        cas_nr : str
+            CAS# for chemical of interest
+        file_name : Optional[str], optional
+            by default '<CAS>-SDS.pdf'
+        layout : Optional[str], optional
+            by default the layout of the library
+
+        Returns
+        -------
+        Path
+        """
+        return self._folder(cas_nr, layout or self.layout) / (file_name or f'{cas_nr}-SDS.pdf')
+
+    def find(self, cas_nr: str, file_name: Optional[str] = None, all_layouts: bool = False) -> Optional[Path]:
+        """Get the path of the SDS file of a chemical if it exists.
+        During `migrate()`, the other layouts are searched too, for files not moved yet
+
+        Parameters
+        ----------
+        cas_nr : str
+            CAS# for chemical of interest
+        file_name : Optional[str], optional
+            by default '<CAS>-SDS.pdf'
+        all_layouts : bool, optional
+            search the other layouts even if no migration is running, by default False
+
+        Returns
+        -------
+        Optional[Path]
+            None if there is no SDS file for this chemical
+        """
+        layouts = [self.layout]
+        if self.migrating or all_layouts:
+            layouts += [layout for layout in LAYOUTS if layout != self.layout]
+        for layout in layouts:
+            path = self.path(cas_nr, file_name, layout)
+            if path.exists():
+                return path
+        return None
+
+    def files(self) -> Iterator[Path]:
+        """Iterate over the SDS files of the library, whatever their layout"""
+        for folder, subfolders, file_names in os.walk(self.root):
+            subfolders[:] = [name for name in subfolders if not name.startswith('.')]
+            for file_name in file_names:
+                if file_name.endswith('.pdf') and not file_name.startswith('.'):
+                    yield Path(folder) / file_name
+
+    def migrate(self, layout: str, hash_levels: int = 1) -> Dict[str, int]:
+        """Move all SDS files into another layout.
+        SDS files can still be found with `sds_path()` while the files are moved
+        (an interrupted migration keeps searching all layouts until run again).
+        Libraries opened before the migration only search their layout: move
+        the files while no find_sds() run is using the folder
+
+        Parameters
+        ----------
+        layout : str
+            one of `LAYOUTS`
+        hash_levels : int, optional
+            see SDSLibrary, by default 1
+
+        Returns
+        -------
+        Dict[str, int]
+            the number of files 'moved' and 'skipped' (already in place, or
+            not named after a CAS number)
+        """
+        # New files go into the new layout right away, existing ones are looked for everywhere until moved
+        target = SDSLibrary(self.root, layout, hash_levels, migrating=True)
+        target.save_layout()
+
+        counts = {'moved': 0, 'skipped': 0}
+        for path in list(self.files()):
+            match = CAS_FILE_NAME.match(path.name)
+            new_path = target.path(match[1], path.name) if match else path
+            if new_path == path:
+                counts['skipped'] += 1
+                continue
+            new_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, new_path)
+            counts['moved'] += 1
+
+        # Remove the folders left empty by the old layout
+        for folder, subfolders, file_names in os.walk(self.root, topdown=False):
+            if Path(folder) != self.root and not Path(folder).name.startswith('.') and not os.listdir(folder):
+                os.rmdir(folder)
+
+        target.migrating = False
+        target.save_layout()
+        self.__dict__.update(target.__dict__)
+        return counts
+
+
+def source_file_name(cas_nr: str, source: str) -> str:
+    """Get the file name of the SDS of a chemical from a given source
+
+    Examples
+    --------
+    >>> source_file_name('64-19-7', 'Alfa-Aesar')
+    '64-19-7-Alfa-Aesar-SDS.pdf'
+    >>> source_file_name('64-19-7', 'Fisher Scientific / Acros')
+    '64-19-7-Fisher-Scientific-Acros-SDS.pdf'
+    """
+    return '{}-{}-SDS.pdf'.format(cas_nr, re.sub(r'[^A-Za-z0-9]+', '-', source).strip('-') or 'unknown')
+
+
+def sds_path(download_path: str, cas_nr: str) -> Optional[Path]:
+    """Get the path of the SDS file of a chemical in a download folder,
+    whatever the layout of the folder
+
+    Parameters
+    ----------
+    download_path : str
+        the download folder of find_sds()
+    cas_nr : str
+        CAS# for chemical of interest
+
+    Returns
+    -------
+    Optional[Path]
+        None if there is no SDS file for this chemical
+
+    Examples
+    --------
+    >>> sds_path('SDS', '64-19-7')
+    PosixPath('SDS/4b/64-19-7-SDS.pdf')
+    """
+    return SDSLibrary.open(download_path).find(cas_nr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Manage the layout of a folder of SDS files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate = subparsers.add_parser('migrate', help='move the SDS files into another layout')
+    migrate.add_argument('download_path')
+    migrate.add_argument('--layout', choices=LAYOUTS, required=True)
+    migrate.add_argument('--hash-levels', type=int, default=1,
+                         help="nested subfolders of the 'hash' layout (default: 1)")
+
+    path = subparsers.add_parser('path', help='print the path of the SDS files of CAS numbers')
+    path.add_argument('download_path')
+    path.add_argument('cas_numbers', nargs='+')
+
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        library = SDSLibrary.open(args.download_path)
+        counts = library.migrate(args.layout, hash_levels=args.hash_levels)
+        print(f"{counts['moved']} SDS files moved, {counts['skipped']} skipped. Layout: {library.layout}")
+    else:
+        for cas_nr in args.cas_numbers:
+            print(f'{cas_nr}: {sds_path(args.download_path, cas_nr) or "not found"}')
+
+
+if __name__ == '__main__':
+    main()
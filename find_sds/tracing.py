@@ -0,0 +1,145 @@
+"""
+Timeline of a find_sds() run, in the Chrome trace-event format.
+
+Each process records spans (lookup of a CAS number, search of a provider,
+wait for a request slot, SDS download, file write) with their start, duration
+and thread into its own file. `export_chrome_trace()` merges them into one
+JSON file for chrome://tracing or https://ui.perfetto.dev, where each worker
+is a row: gaps are idle time, long 'search' spans show where CAS numbers were
+blocked, and spans ending with an error show where timeouts cluster.
+
+Usage:
+    python -m find_sds.tracing trace.parts trace.json
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import util
+from pathlib import Path
+from typing import Dict, Iterator, Optional, TextIO
+
+
+class TraceRecorder:
+    """Record spans of the process it is used in to '<trace_dir>/trace-<pid>.jsonl'
+
+    Parameters
+    ----------
+    trace_dir : str
+        where the spans of all processes are written
+    """
+
+    def __init__(self, trace_dir: str) -> None:
+        self.trace_dir = str(trace_dir)
+        self._setup()
+
+    def _setup(self) -> None:
+        self._file: Optional[TextIO] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict:
+        # Each process writes its own file
+        return {'trace_dir': self.trace_dir}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._setup()
+
+    def _output(self) -> TextIO:
+        if self._pid != os.getpid():
+            os.makedirs(self.trace_dir, exist_ok=True)
+            self._pid = os.getpid()
+            self._file = open(Path(self.trace_dir) / f'trace-{self._pid}.jsonl', 'a', encoding='utf-8')
+            # Name of the row of this process in the trace viewer, e.g. 'ForkPoolWorker-3'
+            self._file.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': self._pid, 'ts': 0,
+                                         'args': {'name': multiprocessing.current_process().name}}) + '\n')
+            # Pool workers exit through multiprocessing, which runs its finalizers
+            util.Finalize(self, self._file.close, exitpriority=10)
+        return self._file
+
+    @contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[Dict]:
+        """Record a span around a block of code
+
+        Parameters
+        ----------
+        name : str
+            e.g. the CAS number, or the provider searched
+        category : str
+            e.g. 'cas', 'search', 'download', 'write'
+        **args
+            shown with the span in the trace viewer
+
+        Yields
+        ------
+        Dict
+            the args of the span, to add results to it
+        """
+        start = time.time()
+        try:
+            yield args
+        except BaseException as error:
+            args['error'] = type(error).__name__
+            raise
+        finally:
+            event = {'name': name, 'cat': category, 'ph': 'X', 'ts': round(start * 1e6),
+                     'dur': round((time.time() - start) * 1e6), 'pid': os.getpid(),
+                     'tid': threading.get_native_id(), 'args': args}
+            line = json.dumps(event, default=str) + '\n'
+            with self._lock:
+                self._output().write(line)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file and self._pid == os.getpid():
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file and self._pid == os.getpid():
+                self._file.close()
+            self._pid = None
+
+
+def export_chrome_trace(trace_dir: str, output_path: str) -> int:
+    """Merge the spans of all processes into a Chrome trace-event JSON file
+
+    Parameters
+    ----------
+    trace_dir : str
+        the `trace_dir` of TraceRecorder
+    output_path : str
+        the JSON file to write
+
+    Returns
+    -------
+    int
+        the number of spans
+    """
+    events = []
+    for path in sorted(Path(trace_dir).glob('trace-*.jsonl')):
+        with open(path, encoding='utf-8') as f:
+            events.extend(json.loads(line) for line in f if line.endswith('\n'))
+    # Enclosing spans first when they start at the same time
+    events.sort(key=lambda event: (event['ts'], -event.get('dur', 0)))
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return sum(event['ph'] == 'X' for event in events)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Merge the spans of a find_sds() run into a Chrome trace-event file')
+    parser.add_argument('trace_dir')
+    parser.add_argument('output_path')
+    args = parser.parse_args()
+    print(f'{export_chrome_trace(args.trace_dir, args.output_path)} spans written to {args.output_path}')
+
+
+if __name__ == '__main__':
+    main()
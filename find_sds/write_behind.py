@@ -0,0 +1,123 @@
+"""
+Write downloaded SDS files to disk behind the download workers.
+
+On slow storage (SMB, NFS), writing and closing a file can take longer than
+downloading it. Workers hand the downloaded content to a bounded queue and go
+back to downloading; writer threads in the main process save the files.
+"""
+
+
+import multiprocessing
+import os
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+
+class WriteBehindWriter:
+    """Files written by background threads from a queue shared with the Pool workers
+
+    `submit()` blocks while `queue_size` files are waiting to be written, so
+    workers cannot run ahead of the storage by more than that. Each file is
+    written to a temporary name, flushed to disk and renamed, so a partly
+    written file never looks like a downloaded SDS. `close()` waits until all
+    files are written and their folders flushed to disk.
+
+    Parameters
+    ----------
+    queue_size : int, optional
+        the number of files waiting to be written, by default 32
+    threads : int, optional
+        the number of writer threads, by default 4
+    fsync : bool, optional
+        flush every file and folder to disk, by default True
+    tracer : Optional[TraceRecorder], optional
+        records a span for each file written, see tracing.py, by default None
+    """
+
+    def __init__(self, queue_size: int = 32, threads: int = 4, fsync: bool = True,
+                 tracer: Optional[Any] = None) -> None:
+        self.queue_size = queue_size
+        self.fsync = fsync
+        self.tracer = tracer
+        self.failures: Dict[str, str] = {}
+        self._queue = multiprocessing.Queue(maxsize=queue_size)
+        self._folders: Set[Path] = set()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def __getstate__(self) -> Dict:
+        # Workers only get the queue, files are written by the process that created the writer
+        return {'queue_size': self.queue_size, 'fsync': self.fsync, '_queue': self._queue}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._threads = []
+        self.tracer = None
+
+    def submit(self, cas_nr: str, path: str, content: bytes) -> None:
+        """Queue a file to be written, waiting while the queue is full
+
+        Parameters
+        ----------
+        cas_nr : str
+            the CAS number of the SDS, to report failed writes
+        path : str
+            the path of the file
+        content : bytes
+        """
+        self._queue.put((cas_nr, str(path), content))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            cas_nr, path, content = item
+            try:
+                with self.tracer.span('write', 'write-behind', cas=cas_nr) if self.tracer else nullcontext():
+                    self._write(Path(path), content)
+            except Exception as error:
+                # Any error is reported: a dead thread would leave the queue full and the workers waiting
+                with self._lock:
+                    self.failures[cas_nr] = f'{path}: {error}' if isinstance(error, OSError) \
+                        else f'{path}: {type(error).__name__}: {error}'
+
+    def _write(self, path: Path, content: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'.{path.name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._folders.add(path.parent)
+
+    def close(self) -> Dict[str, str]:
+        """Wait until all queued files are written and flushed to disk
+
+        Returns
+        -------
+        Dict[str, str]
+            the CAS numbers whose file could not be written, mapped to the error
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        # The renames are only durable once the folders are flushed too
+        if self.fsync and hasattr(os, 'O_DIRECTORY'):    # not available on Windows
+            for folder in self._folders:
+                fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        return self.failures
@@ -0,0 +1,47 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pytest
+from find_sds.response_cache import build_response
+
+
+def tci_page(token, cas_nr=None, product_code=None):
+    products = ''
+    if product_code:
+        products = f'''
+<div id="contentSearchFacet"><span class="facet__text"><a href="#">Products</a><span class="facet__value__count">(1)</span></span></div>
+<div class="prductlist" data-casno="{cas_nr}" data-id="{product_code}"></div>'''
+    return f'''<html><body>
+<form><input type="hidden" name="CSRFToken" value="{token}"></form>
+<script>var ACC = {{config: {{}}}}; ACC.config.encodedContextPath = '\\/US\\/en';</script>{products}
+</body></html>'''
+
+
+class MockTCI:
+    '''Mock of www.tcichemicals.com: a new token for each page, SDS requests need the latest token'''
+
+    def __init__(self):
+        self.token_count = 0
+        self.requests = []
+
+    def get(self, url, params=None, **kwargs):
+        self.token_count += 1
+        cas_nr = (params or {}).get('text')
+        self.requests.append(('get', cas_nr))
+        page = tci_page(f'token-{self.token_count}', cas_nr, {'623-51-8': 'T0211', '885051-07-0': 'B3296'}.get(cas_nr))
+        return build_response(200, {'Content-Type': 'text/html'}, page.encode(), url, 'utf-8')
+
+    def post(self, url, data=None, **kwargs):
+        self.requests.append(('post', data['productCode']))
+        if data['CSRFToken'] != f'token-{self.token_count}':
+            return build_response(403, {}, b'', url)
+        file_name = f'{data["productCode"]}_{data["selectedCountry"]}_{data["langSelector"].upper()}.pdf'
+        return build_response(200, {'content-disposition': f'attachment; filename={file_name}'}, b'', url)
+
+
+@pytest.fixture
+def mock_tci(monkeypatch):
+    mock = MockTCI()
+    monkeypatch.setattr('find_sds.find_sds.requests.Session.get', mock.get)
+    monkeypatch.setattr('find_sds.find_sds.requests.Session.post', mock.post)
+    return mock
@@ -0,0 +1,145 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import random
+
+import pytest
+from find_sds.adaptive import AdaptiveLimiter
+from find_sds.find_sds import _current_provider, _download_content, _fetch, _probe_url
+from find_sds.response_cache import build_response
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr('find_sds.adaptive.time.monotonic', fake_clock)
+    return fake_clock
+
+
+def run_requests(limiter, provider, count, latency, status_code=200):
+    for _ in range(count):
+        assert limiter.try_acquire(provider)
+        limiter.release(provider, latency, status_code)
+
+
+def test_limit_blocks_extra_requests(clock):
+    limiter = AdaptiveLimiter(initial_limit=2)
+    assert limiter.try_acquire('tci')
+    assert limiter.try_acquire('tci')
+    assert not limiter.try_acquire('tci')
+    # Providers have separate limits
+    assert limiter.try_acquire('vwr')
+
+
+def test_fast_responses_grow_limit_up_to_max(clock):
+    limiter = AdaptiveLimiter(max_limit=6, initial_limit=2)
+    run_requests(limiter, 'tci', 6, latency=0.5)
+    assert limiter.limits() == {'tci': 4}
+
+    run_requests(limiter, 'tci', 50, latency=0.5)
+    assert limiter.limits() == {'tci': 6}
+
+
+@pytest.mark.parametrize(
+    "status_code", [429, 503, None]
+)
+def test_throttling_halves_limit_once_per_latency(clock, status_code):
+    limiter = AdaptiveLimiter(max_limit=8, initial_limit=8)
+    run_requests(limiter, 'tci', 1, latency=1.0)
+
+    run_requests(limiter, 'tci', 3, latency=1.0, status_code=status_code)
+    assert limiter.limits() == {'tci': 4}
+
+    clock.now += 1.0
+    run_requests(limiter, 'tci', 1, latency=1.0, status_code=status_code)
+    assert limiter.limits() == {'tci': 2}
+
+
+def test_slow_responses_shrink_limit(clock):
+    limiter = AdaptiveLimiter(max_limit=8, initial_limit=4)
+    run_requests(limiter, 'tci', 1, latency=0.2)
+    run_requests(limiter, 'tci', 6, latency=2.0)
+    assert limiter.limits() == {'tci': 2}
+
+
+def test_fetch_releases_slot_on_error(monkeypatch):
+    limiter = AdaptiveLimiter(initial_limit=1)
+    monkeypatch.setattr('find_sds.find_sds.concurrency_limiter', limiter)
+
+    def mock_failing_request(*args, **kwargs):
+        raise RuntimeError()
+
+    monkeypatch.setattr('find_sds.find_sds.requests.get', mock_failing_request)
+    with pytest.raises(RuntimeError):
+        _fetch('get', 'https://www.chemblink.com/', provider='chemblink')
+    assert limiter.try_acquire('chemblink')
+
+
+def test_slot_of_dead_worker_is_reclaimed(clock):
+    limiter = AdaptiveLimiter(initial_limit=2, lease_timeout=60)
+    # A worker killed in the middle of a request never releases its slot
+    assert limiter.try_acquire('tci')
+    lease = limiter.try_acquire('tci')
+    assert not limiter.try_acquire('tci')
+
+    clock.now += 30
+    limiter.release('tci', 0.5, 200, lease=lease)
+    assert limiter.try_acquire('tci')
+    assert not limiter.try_acquire('tci')
+
+    clock.now += 31
+    assert limiter.try_acquire('tci')
+    # The late release of an expired lease does not free the slot of another request
+    limiter.release('tci', 0.5, 200, lease=lease)
+    assert not limiter.try_acquire('tci')
+
+
+def test_usual_web_latency_keeps_limit_up(clock):
+    # Latencies spread around 0.6 s, all successful: no congestion
+    rng = random.Random(0)
+    limiter = AdaptiveLimiter(max_limit=10)
+    run_requests(limiter, 'vwr', 1, latency=0.1)
+    for _ in range(2000):
+        run_requests(limiter, 'vwr', 1, latency=rng.lognormvariate(-0.5, 0.5))
+    assert limiter.limits() == {'vwr': 10}
+
+
+def test_probes_do_not_count_in_latency(clock):
+    limiter = AdaptiveLimiter(max_limit=8, initial_limit=4)
+    run_requests(limiter, 'tci', 5, latency=1.0)
+    limit = limiter.state['tci']['limit']
+    run_requests(limiter, 'tci', 5, latency=None)
+    assert limiter.state['tci']['limit'] == limit
+    assert limiter.state['tci']['baseline_latency'] == pytest.approx(1.0)
+    # Failed probes still count as errors
+    run_requests(limiter, 'tci', 1, latency=None, status_code=503)
+    assert limiter.state['tci']['limit'] == limit / 2
+
+
+def test_downloads_take_no_slot(monkeypatch):
+    limiter = AdaptiveLimiter(initial_limit=1)
+    monkeypatch.setattr('find_sds.find_sds.concurrency_limiter', limiter)
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {'Content-Type': 'application/pdf'}, b'%PDF', url))
+    monkeypatch.setattr('find_sds.find_sds.requests.head',
+                        lambda url, **kwargs: build_response(200, {}, b'', url))
+
+    assert _download_content('64-19-7', 'chemicalsafety', 'https://cdn.example.com/64-19-7.pdf') == b'%PDF'
+    assert limiter.limits() == {}
+
+    # Probes take a slot, but their latency is not used
+    token = _current_provider.set('tci')
+    try:
+        assert _probe_url('https://www.tcichemicals.com/US/en/p/A0001')
+    finally:
+        _current_provider.reset(token)
+    assert limiter.state['tci']['requests'] == 1
+    assert limiter.state['tci']['baseline_latency'] is None
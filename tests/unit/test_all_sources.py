@@ -0,0 +1,75 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import threading
+from pathlib import Path
+
+import pytest
+from find_sds.find_sds import PROVIDERS, _download_task, download_sds
+from find_sds.response_cache import build_response
+from find_sds.storage import source_file_name
+
+# What each provider finds, if anything
+FOUND = {
+    'vwr': ('VWR', 'https://www.vwr.com/64-19-7.pdf'),
+    'fisher': ('Acros', 'https://www.fishersci.com/acros/64-19-7.pdf'),
+    'tci': ('TCI', 'https://www.tcichemicals.com/64-19-7.pdf'),
+    # Same file as Fisher
+    'chemicalsafety': ('Acros', 'https://www.fishersci.com/acros/64-19-7.pdf'),
+    # Same content as TCI
+    'fluorochem': ('Fluorochem', 'https://www.fluorochem.co.uk/64-19-7.pdf'),
+}
+CONTENT = {
+    'https://www.vwr.com/64-19-7.pdf': b'%PDF-1.4 vwr',
+    'https://www.fishersci.com/acros/64-19-7.pdf': b'%PDF-1.4 acros',
+    'https://www.tcichemicals.com/64-19-7.pdf': b'%PDF-1.4 tci',
+    'https://www.fluorochem.co.uk/64-19-7.pdf': b'%PDF-1.4 tci',
+}
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    '''Providers that only answer once all of them are searched at the same time'''
+    all_searching = threading.Barrier(len(PROVIDERS), timeout=5)
+    downloads = []
+
+    def extractor(provider):
+        def extract(cas_nr):
+            all_searching.wait()
+            return FOUND.get(provider)
+        return extract
+
+    def mock_get(url, **kwargs):
+        downloads.append(url)
+        return build_response(200, {}, CONTENT[url], url)
+
+    for provider in PROVIDERS:
+        monkeypatch.setattr(f'find_sds.find_sds.extract_download_url_from_{provider}', extractor(provider))
+    monkeypatch.setattr('find_sds.find_sds.requests.get', mock_get)
+    return downloads
+
+
+def test_download_from_all_sources(tmpdir, providers):
+    cas_nr, downloaded, sources = download_sds('64-19-7', download_path=tmpdir, all_sources=True)
+    assert (cas_nr, downloaded, sources) == ('64-19-7', True, 'VWR, Acros, TCI')
+    assert sorted(os.listdir(tmpdir)) == ['64-19-7-Acros-SDS.pdf', '64-19-7-TCI-SDS.pdf', '64-19-7-VWR-SDS.pdf']
+    assert (Path(tmpdir) / '64-19-7-Acros-SDS.pdf').read_bytes() == b'%PDF-1.4 acros'
+    # The file found twice is downloaded once
+    assert len(providers) == 4
+
+
+def test_existing_sources_are_not_downloaded_again(tmpdir, providers):
+    (Path(tmpdir) / '64-19-7-SDS.pdf').write_bytes(b'%PDF-1.4 first')
+    (Path(tmpdir) / source_file_name('64-19-7', 'VWR')).write_bytes(b'%PDF-1.4 vwr')
+    result, info = _download_task('64-19-7', download_path=tmpdir, all_sources=True)
+    assert result == ('64-19-7', True, 'Acros, TCI')
+    assert info == {'downloaded': True, 'existed': False, 'provider': 'fisher', 'size': 26}
+    assert 'https://www.vwr.com/64-19-7.pdf' not in providers
+
+    assert download_sds('64-19-7', download_path=tmpdir, all_sources=True) == ('64-19-7', True, None)
+
+
+def test_nothing_found_from_any_source(tmpdir, monkeypatch):
+    for provider in PROVIDERS:
+        monkeypatch.setattr(f'find_sds.find_sds.extract_download_url_from_{provider}', lambda cas_nr: None)
+    assert download_sds('00000-00-0', download_path=tmpdir, all_sources=True) == ('00000-00-0', False, None)
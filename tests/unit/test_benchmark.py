@@ -0,0 +1,75 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import json
+from pathlib import Path
+
+import pytest
+from find_sds.benchmark import CAS_NR, CASES, SIZES, compare, load_fixture_bodies, run_benchmarks
+
+
+@pytest.mark.parametrize(
+    "provider, expect", [
+        ('chemblink', ('Alfa-Aesar', 'https://www.chemblink.com/MSDS/MSDSFiles/64-19-7Alfa-Aesar.pdf')),
+        ('vwr', ('TCI America', 'https://us.vwr.com/assetsvc/asset/en_US/id/18065210/contents')),
+        ('fisher', ('Fisher', 'https://www.fishersci.com/store/msds?partNumber=AC000025&countryCode=US&language=en')),
+        ('tci', 'A0000'),
+        ('chemicalsafety', {'64-19-7': ('Vendor 24', 'https://www.example.com/sds/24.pdf')}),
+        ('fluorochem', {'en-US': ('Fluorochem', 'https://7128445.app.netsuite.com/core/media/media.nl?id=0&lang=en')}),
+    ]
+)
+def test_parse_typical_body(provider, expect):
+    make_body, parse = CASES[provider]
+    assert parse(make_body(SIZES['typical']), CAS_NR) == expect
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(['chemicalsafety'], ['small', 'typical'], repeat=1)
+    assert list(results) == ['chemicalsafety:small', 'chemicalsafety:typical']
+    small, typical = results.values()
+    assert small['ops_per_sec'] > typical['ops_per_sec'] > 0
+    assert 0 < small['peak_kb'] < typical['peak_kb']
+    assert small['body_kb'] < typical['body_kb']
+
+
+def test_compare_with_baseline():
+    baseline = {'vwr:small': {'ops_per_sec': 1000.0, 'peak_kb': 100.0},
+                'vwr:worst': {'ops_per_sec': 10.0, 'peak_kb': 1000.0}}
+    results = {'vwr:small': {'ops_per_sec': 850.0, 'peak_kb': 103.0},
+               'vwr:worst': {'ops_per_sec': 7.0, 'peak_kb': 1500.0},
+               'tci:small': {'ops_per_sec': 1.0, 'peak_kb': 1.0}}
+    assert compare(results, baseline, threshold=0.2) == [
+        'vwr:worst: 7.0 ops/sec, 30% slower than 10.0',
+        'vwr:worst: 1500.0 KB peak, 50% more than 1000.0 KB',
+    ]
+    assert compare(results, baseline, threshold=0.1) == [
+        'vwr:small: 850.0 ops/sec, 15% slower than 1000.0',
+    ] + compare(results, baseline, threshold=0.2)
+
+
+def test_compare_with_empty_peak():
+    baseline = {'tci:small': {'ops_per_sec': 1000.0, 'peak_kb': 0.0}}
+    assert compare({'tci:small': {'ops_per_sec': 1000.0, 'peak_kb': 2.0}}, baseline) == []
+    assert compare({'tci:small': {'ops_per_sec': 1000.0, 'peak_kb': 6.5}}, baseline) == [
+        'tci:small: 6.5 KB peak, 6.5 KB more than 0.0 KB',
+    ]
+
+
+def test_recorded_bodies(tmpdir):
+    def record(host, name, method, url, status_code=200):
+        path = Path(tmpdir) / host / f'{name}.json'
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(json.dumps({'version': 1, 'request': {'method': method, 'url': url},
+                                    'response': {'status_code': status_code, 'text': f'{name} body'}}))
+
+    record('www.fishersci.com', 'get-1', 'GET', 'https://www.fishersci.com/us/en/catalog/search/sds?msdsKeyword=67-64-1')
+    record('www.fishersci.com', 'get-2', 'GET', 'https://www.fishersci.com/us/en/catalog/search/sds', 503)
+    record('www.tcichemicals.com', 'get-1', 'GET', 'https://www.tcichemicals.com/US/en/search/?text=623-51-8')
+    record('www.tcichemicals.com', 'post-1', 'POST', 'https://www.tcichemicals.com/US/en/documentSearch/productSDSSearchDoc')
+    record('dougdiscovery.com', 'post-1', 'POST', 'https://dougdiscovery.com/api/v1/molecules/search')
+
+    assert load_fixture_bodies(tmpdir) == {
+        'fisher': [('get-1 body', '67-64-1')],
+        'tci': [('get-1 body', '623-51-8')],
+        'fluorochem': [('post-1 body', CAS_NR)],
+    }
@@ -0,0 +1,91 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import io
+import json
+import zipfile
+from pathlib import Path
+
+import pytest
+from find_sds.bundle import MANIFEST_NAME, bundle_sds
+from find_sds.response_cache import build_response
+
+SDS_URLS = {
+    '64-19-7': ('fisher', 'Fisher', 'https://www.fishersci.com/64-19-7.pdf'),
+    '67-64-1': ('tci', 'TCI', 'https://www.tcichemicals.com/67-64-1.pdf'),
+}
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    monkeypatch.setattr('find_sds.bundle._find_download_url', lambda cas_nr: SDS_URLS.get(cas_nr, (None, None, None)))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4 ' + url.encode(), url))
+
+
+class Pipe(io.RawIOBase):
+    '''Output that cannot seek, e.g. stdout piped to another program'''
+
+    def __init__(self):
+        self.data = bytearray()
+        self.flushed = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+    def flush(self):
+        self.flushed.append(len(self.data))
+
+
+def test_bundle_to_file(tmpdir, providers):
+    download_path = Path(tmpdir) / 'SDS'
+    download_path.mkdir()
+    (download_path / '71-43-2-SDS.pdf').write_bytes(b'%PDF-1.4 local')
+
+    counts = bundle_sds(['64-19-7', '67-64-1', '71-43-2', '00000-00-0', '64-19-7'], Path(tmpdir) / 'sds.zip',
+                        download_path=download_path, pool_size=2)
+
+    fisher, tci = (len(b'%PDF-1.4 ' + url.encode()) for _, _, url in SDS_URLS.values())
+    assert counts == {'found': 3, 'missing': 1, 'bytes': fisher + tci + 14}
+    with zipfile.ZipFile(Path(tmpdir) / 'sds.zip') as archive:
+        assert sorted(archive.namelist()) == ['64-19-7-SDS.pdf', '67-64-1-SDS.pdf', '71-43-2-SDS.pdf', MANIFEST_NAME]
+        assert archive.namelist()[-1] == MANIFEST_NAME
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+        assert archive.read('64-19-7-SDS.pdf') == b'%PDF-1.4 https://www.fishersci.com/64-19-7.pdf'
+        assert archive.read('71-43-2-SDS.pdf') == b'%PDF-1.4 local'
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+    assert manifest == {
+        'found': [{'cas_nr': '64-19-7', 'file': '64-19-7-SDS.pdf', 'source': 'Fisher', 'size': fisher},
+                  {'cas_nr': '67-64-1', 'file': '67-64-1-SDS.pdf', 'source': 'TCI', 'size': tci},
+                  {'cas_nr': '71-43-2', 'file': '71-43-2-SDS.pdf', 'source': 'local', 'size': 14}],
+        'missing': [{'cas_nr': '00000-00-0', 'error': None}],
+    }
+    # Nothing written to the download folder
+    assert os.listdir(download_path) == ['71-43-2-SDS.pdf']
+
+
+def test_bundle_streamed_to_a_pipe(providers):
+    pipe = Pipe()
+    assert bundle_sds(['64-19-7', '67-64-1'], pipe, pool_size=1)['found'] == 2
+
+    # Each SDS was handed over before the archive was complete
+    assert len(pipe.flushed) >= 2 and pipe.flushed[0] < pipe.flushed[1] < len(pipe.data)
+    with zipfile.ZipFile(io.BytesIO(bytes(pipe.data))) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == ['64-19-7-SDS.pdf', '67-64-1-SDS.pdf', MANIFEST_NAME]
+
+
+def test_download_errors_are_in_the_manifest(tmpdir, monkeypatch):
+    def timeout(url, **kwargs):
+        raise TimeoutError('too slow')
+
+    monkeypatch.setattr('find_sds.bundle._find_download_url', lambda cas_nr: SDS_URLS[cas_nr])
+    monkeypatch.setattr('find_sds.find_sds.requests.get', timeout)
+    assert bundle_sds(['64-19-7'], Path(tmpdir) / 'sds.zip', pool_size=1)['missing'] == 1
+    with zipfile.ZipFile(Path(tmpdir) / 'sds.zip') as archive:
+        assert json.loads(archive.read(MANIFEST_NAME))['missing'] == [{'cas_nr': '64-19-7',
+                                                                       'error': 'TimeoutError: too slow'}]
@@ -0,0 +1,115 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pickle
+
+import pytest
+from find_sds.catalog import CatalogIndex
+from find_sds.find_sds import PROVIDERS, TCIClient, _search_provider, download_sds, extract_download_url_from_tci
+from find_sds.response_cache import build_response
+
+
+@pytest.fixture
+def index(tmpdir):
+    return CatalogIndex(tmpdir / 'catalog.sqlite')
+
+
+def test_import_csv(index, tmpdir):
+    dump = tmpdir / 'tci.csv'
+    dump.write_text('cas,product_code,sds_url\n'
+                    '623-51-8,T0211,\n'
+                    '885051-07-0,B3296,https://www.tcichemicals.com/US/en/sds/B3296_US_EN.pdf\n'
+                    ',X0000,\n', encoding='utf-8')
+    assert index.import_csv(dump, vendor='TCI') == 2
+    assert index.lookup('623-51-8') == [
+        {'vendor': 'tci', 'cas': '623-51-8', 'product_code': 'T0211', 'sds_url': None, 'source': None}]
+    assert index.lookup('885051-07-0', 'tci')[0]['sds_url'] == 'https://www.tcichemicals.com/US/en/sds/B3296_US_EN.pdf'
+    assert index.lookup('885051-07-0', 'vwr') == []
+
+
+def test_old_entries_are_ignored(tmpdir, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('find_sds.catalog.time.time', lambda: now[0])
+    index = CatalogIndex(tmpdir / 'catalog.sqlite', max_age=60)
+    index.add([{'vendor': 'fisher', 'cas': '64-19-7', 'sds_url': 'https://www.fishersci.com/sds.pdf'}])
+    assert len(index.lookup('64-19-7')) == 1
+    now[0] += 61
+    assert index.lookup('64-19-7') == []
+
+
+def test_index_can_be_sent_to_workers(index):
+    index.add([{'vendor': 'fisher', 'cas': '64-19-7', 'sds_url': 'https://www.fishersci.com/sds.pdf'}])
+    assert pickle.loads(pickle.dumps(index)).lookup('64-19-7')[0]['vendor'] == 'fisher'
+
+
+def test_known_sds_url_skips_the_search(index, monkeypatch):
+    index.add([{'vendor': 'fisher', 'cas': '64-19-7', 'sds_url': 'https://www.fishersci.com/sds.pdf',
+                'source': 'Fisher'}])
+    monkeypatch.setattr('find_sds.find_sds.catalog_index', index)
+    monkeypatch.setattr('find_sds.find_sds.extract_download_url_from_fisher', None)
+    assert _search_provider('fisher', '64-19-7') == ('Fisher', 'https://www.fishersci.com/sds.pdf')
+
+
+def test_search_results_are_added_to_the_index(index, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.catalog_index', index)
+    monkeypatch.setattr('find_sds.find_sds.extract_download_url_from_vwr',
+                        lambda cas_nr: ('TCI America', 'https://us.vwr.com/assetsvc/asset/en_US/id/18065210/contents'))
+    _search_provider('vwr', '885051-07-0')
+    assert index.lookup('885051-07-0', 'vwr') == [
+        {'vendor': 'vwr', 'cas': '885051-07-0', 'product_code': '',
+         'sds_url': 'https://us.vwr.com/assetsvc/asset/en_US/id/18065210/contents', 'source': 'TCI America'}]
+
+
+def test_tci_product_number_from_index(index, mock_tci, monkeypatch):
+    index.add([{'vendor': 'tci', 'cas': '623-51-8', 'product_code': 'T0211'}])
+    monkeypatch.setattr('find_sds.find_sds.catalog_index', index)
+    monkeypatch.setattr('find_sds.find_sds.tci_client', TCIClient())
+    assert extract_download_url_from_tci('623-51-8') == ('TCI', 'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf')
+    # No product search, only a token
+    assert mock_tci.requests == [('get', None), ('post', 'T0211')]
+
+    # Product numbers found by searching are kept
+    extract_download_url_from_tci('885051-07-0')
+    assert index.lookup('885051-07-0', 'tci')[0]['product_code'] == 'B3296'
+
+
+def test_remove(index):
+    index.add([{'vendor': 'fisher', 'cas': '64-19-7', 'sds_url': 'https://www.fishersci.com/old.pdf'},
+               {'vendor': 'fisher', 'cas': '64-19-7', 'product_code': 'A38S212'},
+               {'vendor': 'vwr', 'cas': '64-19-7', 'sds_url': 'https://us.vwr.com/sds.pdf'}])
+    assert index.remove('64-19-7', 'Fisher', sds_url='https://www.fishersci.com/old.pdf') == 1
+    assert [entry['vendor'] for entry in index.lookup('64-19-7')] == ['fisher', 'vwr']
+    assert index.remove('64-19-7', 'fisher') == 1
+    assert [entry['vendor'] for entry in index.lookup('64-19-7')] == ['vwr']
+
+
+@pytest.mark.parametrize(
+    "stale_response", [
+        build_response(404, {}, b'', 'https://www.fishersci.com/old.pdf'),
+        build_response(200, {'Content-Type': 'text/html'}, b'<html>Not found</html>', 'https://www.fishersci.com/old.pdf'),
+    ]
+)
+def test_stale_sds_url_is_searched_again(index, tmpdir, monkeypatch, stale_response):
+    index.add([{'vendor': 'fisher', 'cas': '64-19-7', 'sds_url': 'https://www.fishersci.com/old.pdf'}])
+    monkeypatch.setattr('find_sds.find_sds.catalog_index', index)
+    searched = []
+
+    def search(provider):
+        def extract_download_url(cas_nr):
+            searched.append(provider)
+            return ('Fisher', 'https://www.fishersci.com/new.pdf') if provider == 'fisher' else (None, None)
+        return extract_download_url
+
+    for provider in PROVIDERS:
+        monkeypatch.setattr(f'find_sds.find_sds.extract_download_url_from_{provider}', search(provider))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: stale_response if url.endswith('old.pdf')
+                        else build_response(200, {'Content-Type': 'application/pdf'}, b'%PDF-1.4', url))
+
+    assert download_sds('64-19-7', download_path=tmpdir) == ('64-19-7', True, 'Fisher')
+    assert (tmpdir / '64-19-7-SDS.pdf').read_binary() == b'%PDF-1.4'
+    # Providers before Fisher are searched in both passes (from the response cache in a run)
+    before = PROVIDERS[:PROVIDERS.index('fisher')]
+    assert searched == before + before + ['fisher']
+    # Only the URL that works is kept
+    assert [entry['sds_url'] for entry in index.lookup('64-19-7')] == ['https://www.fishersci.com/new.pdf']
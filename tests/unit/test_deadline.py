@@ -0,0 +1,111 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pytest
+from find_sds.adaptive import AdaptiveLimiter
+from find_sds.find_sds import (DeadlineExceeded, PROVIDERS, _deadline, _fetch, _read_content,
+                               _request_timeout, download_sds)
+from find_sds.provider_health import CircuitBreaker
+from find_sds.response_cache import build_response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('find_sds.find_sds.time.monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def deadline(clock):
+    '''The CAS number being looked up has 5 seconds left'''
+    token = _deadline.set(clock[0] + 5)
+    yield
+    _deadline.reset(token)
+
+
+@pytest.mark.parametrize(
+    "timeout, connect_timeout, expect", [
+        (10, None, (5, 5)),
+        (3, None, (3, 3)),
+        (10, 2, (2, 5)),
+        ((1, 4), None, (1, 4)),
+        (None, None, (5, 5)),
+    ]
+)
+def test_request_timeout_is_capped_by_time_left(deadline, monkeypatch, timeout, connect_timeout, expect):
+    monkeypatch.setattr('find_sds.find_sds.connect_timeout', connect_timeout)
+    assert _request_timeout(timeout) == expect
+
+
+def test_connect_timeout_without_deadline(monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.connect_timeout', 3)
+    assert _request_timeout(20) == (3, 20)
+
+
+def test_no_request_after_deadline(deadline, clock, monkeypatch):
+    sent = []
+
+    def mock_get(url, **kwargs):
+        sent.append(kwargs['timeout'])
+        return build_response(200, {}, b'', url)
+
+    monkeypatch.setattr('find_sds.find_sds.requests.get', mock_get)
+    _fetch('get', 'https://www.fishersci.com/us/en/catalog/search/sds', timeout=10)
+    assert sent == [(5, 5)]
+
+    clock[0] += 5
+    with pytest.raises(DeadlineExceeded):
+        _fetch('get', 'https://www.fishersci.com/us/en/catalog/search/sds', timeout=10)
+    assert len(sent) == 1
+
+
+def test_slow_download_is_aborted(deadline, clock):
+    class TrickleResponse:
+        url = 'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf'
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def iter_content(self, chunk_size):
+            while True:
+                clock[0] += 1
+                yield b'x'
+
+    with pytest.raises(DeadlineExceeded):
+        _read_content(TrickleResponse())
+
+
+def test_download_sds_gives_up_after_deadline(tmpdir, clock, monkeypatch):
+    searched = []
+
+    def mock_search_provider(provider, cas_nr):
+        searched.append(provider)
+        clock[0] += 4
+
+    monkeypatch.setattr('find_sds.find_sds._search_provider', mock_search_provider)
+    assert download_sds('64-19-7', download_path=tmpdir, deadline=10) == ('64-19-7', False, None)
+    assert searched == PROVIDERS[:3]
+
+
+def test_deadline_is_not_a_provider_failure(tmpdir, clock, monkeypatch):
+    breaker = CircuitBreaker(max_failures=1)
+    monkeypatch.setattr('find_sds.find_sds.circuit_breaker', breaker)
+
+    def slow_provider(cas_nr):
+        clock[0] += 20
+        raise DeadlineExceeded()
+
+    for provider in PROVIDERS:
+        monkeypatch.setattr(f'find_sds.find_sds.extract_download_url_from_{provider}', slow_provider)
+    download_sds('64-19-7', download_path=tmpdir, deadline=10)
+    assert breaker.allow(PROVIDERS[0])
+
+
+def test_limiter_wait_is_bounded():
+    limiter = AdaptiveLimiter(initial_limit=1, poll_interval=0.01)
+    assert limiter.acquire('tci', timeout=0.05)
+    assert not limiter.acquire('tci', timeout=0.05)
@@ -0,0 +1,130 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pytest
+from find_sds.find_sds import (ResponseTooLarge, UnexpectedContentType, _download_content, _download_task,
+                               _read_content, _read_sds)
+from find_sds.progress import ProgressReporter
+from find_sds.response_cache import build_response
+
+SDS_URL = 'https://www.fishersci.com/store/msds?partNumber=A38S212'
+
+
+class StreamedResponse:
+    '''A response whose body is sent in chunks, counting the chunks read'''
+    url = SDS_URL
+
+    def __init__(self, headers, chunks):
+        self.headers = headers
+        self.chunks = chunks
+        self.sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.sent += 1
+            yield chunk
+
+
+@pytest.fixture
+def limit(monkeypatch):
+    '''SDS files of at most 1 kB'''
+    monkeypatch.setattr('find_sds.find_sds.max_download_bytes', 1024)
+
+
+@pytest.mark.parametrize(
+    "headers", [
+        {'Content-Type': 'application/pdf'},
+        {'Content-Type': 'application/octet-stream; charset=binary'},
+        {},
+    ]
+)
+def test_sds_is_read(limit, headers):
+    response = StreamedResponse(headers, [b'%PDF-1.4\n', b'x' * 500])
+    assert _read_sds(response) == b'%PDF-1.4\n' + b'x' * 500
+
+
+def test_too_large_by_content_length(limit):
+    response = StreamedResponse({'Content-Type': 'application/pdf', 'Content-Length': '4096'}, [b'%PDF'])
+    with pytest.raises(ResponseTooLarge):
+        _read_sds(response)
+    assert response.sent == 0
+
+
+def test_too_large_while_streaming(limit):
+    # Content-Length missing, or lying
+    response = StreamedResponse({'Content-Length': '10'}, (b'%PDF' + b'x' * 252 for _ in range(100)))
+    with pytest.raises(ResponseTooLarge):
+        _read_sds(response)
+    assert response.sent == 5
+
+
+@pytest.mark.parametrize(
+    "headers, chunks", [
+        ({'Content-Type': 'text/html; charset=utf-8'}, [b'<!DOCTYPE html>']),
+        ({'Content-Type': 'application/json'}, [b'{"error": "not found"}']),
+        ({}, [b'\r\n  ', b'<html><body>Product not found</body></html>', b'x' * 1000]),
+        ({'Content-Type': 'application/octet-stream'}, [b'<?xml version="1.0"?>', b'x' * 1000]),
+    ]
+)
+def test_not_a_pdf(limit, headers, chunks):
+    response = StreamedResponse(headers, chunks)
+    with pytest.raises(UnexpectedContentType):
+        _read_sds(response)
+    assert response.sent < len(chunks)
+
+
+def test_any_type_and_size(monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.max_download_bytes', None)
+    monkeypatch.setattr('find_sds.find_sds.sds_content_types', [])
+    response = StreamedResponse({'Content-Type': 'text/plain', 'Content-Length': str(2**40)}, [b'x' * 4096])
+    assert _read_sds(response) == b'x' * 4096
+    # Only the SDS downloads are checked
+    assert _read_content(StreamedResponse({}, [b'<html>'])) == b'<html>'
+
+
+def test_rejection_is_counted(tmpdir, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds._find_download_url', lambda cas_nr: ('fisher', 'Fisher', SDS_URL))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {'Content-Type': 'text/html'}, b'<html>', url))
+
+    result, info = _download_task('64-19-7', str(tmpdir))
+    assert result == ('64-19-7', False, None)
+    assert info == {'downloaded': False, 'existed': False, 'rejected': 'wrong_type'}
+    assert not os.listdir(tmpdir)
+
+    progress = ProgressReporter(total=2, interval=0, stream=None)
+    progress.update(**info)
+    progress.update(downloaded=False, rejected='too_large')
+    snapshot = progress.snapshot()
+    assert snapshot['rejected'] == {'wrong_type': 1, 'too_large': 1}
+    assert 'rejected wrong_type=1, too_large=1' in progress.format(snapshot)
+
+
+@pytest.mark.parametrize(
+    "status_code, redirected", [
+        (404, False),
+        (200, True),
+        (200, False),
+    ]
+)
+def test_streamed_response_is_closed(monkeypatch, status_code, redirected):
+    responses = []
+
+    def mock_get(url, **kwargs):
+        response = build_response(status_code, {'Content-Type': 'application/pdf'}, b'%PDF-1.4', url)
+        if redirected:
+            response.history = [build_response(302, {}, b'', url)]
+        response.close = lambda: responses.append(response)
+        return response
+
+    monkeypatch.setattr('find_sds.find_sds.requests.get', mock_get)
+    content = _download_content('64-19-7', 'fisher', SDS_URL)
+    assert content == (b'%PDF-1.4' if status_code == 200 and not redirected else None)
+    # Whether its body was read or not
+    assert responses
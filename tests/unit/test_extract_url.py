@@ -1,10 +1,12 @@
 import sys, os
 sys.path.append(os.path.realpath('find_sds'))
 
+import json
 import re
 import pytest
 from find_sds.find_sds import extract_download_url_from_fisher, \
                                     extract_download_url_from_chemicalsafety, \
+                                    extract_download_urls_from_chemicalsafety, \
                                     extract_download_url_from_fluorochem, \
                                     extract_download_url_from_chemblink, \
                                     extract_download_url_from_vwr, \
@@ -106,6 +108,57 @@ def test_extract_url_from_chemicalsafety_with_exception(monkeypatch, cas_nr, exp
     assert result == expect
 
 
+class MockChemicalSafetyResponse:
+    status_code = 200
+    history = []
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def json(self):
+        return {'cols': [{'name': 'MSDS_ID'}, {'name': 'MANUFACT'}, {'name': 'CAS'}, {'name': 'HTTPMSDSREF'}],
+                'rows': self.rows}
+
+
+def test_extract_urls_from_chemicalsafety_in_batches(monkeypatch):
+    searches = []
+
+    def mock_post(session, url, data=None, **kwargs):
+        criteria = json.loads(data)['Criteria']
+        searches.append(criteria)
+        rows = [
+            ['1', 'Alfa Aesar', '623-51-8', 'https://www.alfa.com/en/msds/?sku=A14321'],
+            ['2', 'Ambeed, Inc.', '623-51-8', 'https://file.ambeed.com/SDS-A305712.pdf'],
+            ['3', 'Tokyo Chemical Industry Co., Ltd.', '623-51-8', 'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf'],
+            ['4', 'COMBI-BLOCKS', '1450-76-6', 'https://www.combi-blocks.com/msds/ST-9753.pdf'],
+            ['5', 'Other', '67-68-5', 'https://example.com/not-requested.pdf'],
+        ]
+        return MockChemicalSafetyResponse([row for row in rows if f'cas|{row[2]}' in criteria])
+
+    monkeypatch.setattr('find_sds.find_sds.requests.Session.post', mock_post)
+    results = extract_download_urls_from_chemicalsafety(['623-51-8', '1450-76-6', '00000-00-0'], batch_size=2)
+
+    assert searches == [['cas|623-51-8', 'cas|1450-76-6'], ['cas|00000-00-0']]
+    assert results == {
+        '623-51-8': ('Tokyo Chemical Industry Co., Ltd.', 'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf'),
+        '1450-76-6': ('COMBI-BLOCKS', 'https://www.combi-blocks.com/msds/ST-9753.pdf'),
+        '00000-00-0': None,
+    }
+
+
+def test_extract_urls_from_chemicalsafety_skips_failed_batches(monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.requests.Session.post', mock_raise_exception)
+    assert extract_download_urls_from_chemicalsafety(['623-51-8']) == {}
+
+
+def test_extract_url_from_chemicalsafety_uses_batch_results(monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.chemicalsafety_urls', {'623-51-8': ('COMBI-BLOCKS', 'https://x.pdf'),
+                                                                   '00000-00-0': None})
+    monkeypatch.setattr('find_sds.find_sds.requests.Session', mock_raise_exception)
+    assert extract_download_url_from_chemicalsafety('623-51-8') == ('COMBI-BLOCKS', 'https://x.pdf')
+    assert extract_download_url_from_chemicalsafety('00000-00-0') is None
+
+
 @pytest.mark.parametrize(
     "cas_nr, expect", [
         ('623-51-8', (
@@ -0,0 +1,107 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pickle
+from functools import partial
+
+import pytest
+import requests
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('h2')
+
+from find_sds.find_sds import _fetch
+from find_sds.http2 import HTTP2Adapter
+from find_sds.http_fixtures import FixtureStore
+
+
+@pytest.fixture
+def server(monkeypatch):
+    '''httpx clients answered by a handler instead of the network'''
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        if request.url.path == '/redirect':
+            return httpx.Response(302, headers={'Location': '/sds.pdf'})
+        if request.url.path == '/timeout':
+            raise httpx.ConnectTimeout('connect timed out', request=request)
+        if request.url.path == '/slow':
+            raise httpx.ReadTimeout('read timed out', request=request)
+        return httpx.Response(200, headers=[('Content-Type', 'application/pdf'), ('Set-Cookie', 'session=1'),
+                                            ('Set-Cookie', 'token=abc')], content=b'%PDF-1.4' * 1000)
+
+    monkeypatch.setattr('find_sds.http2.httpx.Client', partial(httpx.Client, transport=httpx.MockTransport(handler)))
+    return requests_seen
+
+
+def test_requests_session_through_httpx(server):
+    adapter = HTTP2Adapter()
+    session = adapter.mount(requests.Session())
+    r = session.get('https://www.tcichemicals.com/sds.pdf', headers={'User-Agent': 'find_sds'},
+                    timeout=(3, 20), stream=True)
+
+    assert r.status_code == 200 and r.headers['Content-Type'] == 'application/pdf'
+    assert b''.join(r.iter_content(4096)) == b'%PDF-1.4' * 1000
+    assert session.cookies.get_dict() == {'session': '1', 'token': 'abc'}
+    request, = server
+    assert request.headers['User-Agent'] == 'find_sds'
+    assert request.extensions['timeout'] == {'connect': 3, 'read': 20, 'write': 20, 'pool': 20}
+
+    # Cookies and redirects are still handled by the session
+    r = session.get('https://www.tcichemicals.com/redirect', timeout=20)
+    assert [response.status_code for response in r.history] == [302]
+    assert r.url == 'https://www.tcichemicals.com/sds.pdf'
+    assert server[-1].headers['Cookie'] in ['session=1; token=abc', 'token=abc; session=1']
+
+
+def test_one_client_per_process(server):
+    adapter = HTTP2Adapter()
+    with requests.Session() as session:
+        adapter.mount(session).get('https://chemicalsafety.com/sds.pdf')
+    client = adapter.client
+    # Closing a session keeps the connections of the process open
+    assert not client.is_closed
+    assert adapter.mount(requests.Session()).get('https://chemicalsafety.com/sds.pdf').status_code == 200
+    assert adapter.client is client
+
+    copy = pickle.loads(pickle.dumps(adapter))
+    assert copy.max_connections == 20 and copy._client is None
+    adapter.shutdown()
+    assert client.is_closed
+
+
+@pytest.mark.parametrize(
+    "path, error", [
+        ('/timeout', requests.ConnectTimeout),
+        ('/slow', requests.ReadTimeout),
+    ]
+)
+def test_errors_are_requests_errors(server, path, error):
+    with pytest.raises(error):
+        HTTP2Adapter().mount(requests.Session()).get(f'https://www.fishersci.com{path}')
+
+
+def test_fetch_uses_the_adapter_of_the_process(server, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.http2_adapter', HTTP2Adapter())
+    monkeypatch.setattr('find_sds.find_sds.requests.get', lambda *args, **kwargs: pytest.fail('sent over HTTP/1.1'))
+
+    assert _fetch('get', 'https://www.chemblink.com/sds.pdf', cache=False).content.startswith(b'%PDF')
+    with requests.Session() as session:
+        _fetch('get', 'https://www.fishersci.com/sds.pdf', session=session, cache=False)
+        assert session.cookies.get_dict() == {'session': '1', 'token': 'abc'}
+    assert [request.url.host for request in server] == ['www.chemblink.com', 'www.fishersci.com']
+
+
+def test_fixtures_are_recorded_and_replayed(server, tmpdir):
+    session = HTTP2Adapter().mount(requests.Session())
+    for mode in ['record', 'replay']:
+        store = FixtureStore(tmpdir, mode=mode)
+        store.install()
+        try:
+            assert session.get('https://www.tcichemicals.com/sds.pdf').content == b'%PDF-1.4' * 1000
+        finally:
+            store.uninstall()
+    # Replayed without a request
+    assert len(server) == 1
+    assert len((tmpdir / 'www.tcichemicals.com').listdir()) == 1
@@ -0,0 +1,99 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from find_sds.find_sds import extract_download_url_from_chemblink, extract_download_url_from_fluorochem
+from find_sds.http_fixtures import FIXTURE_VERSION, FixtureNotFound, FixtureStore
+from find_sds.response_cache import build_response
+
+
+CHEMBLINK_PAGE = '''<html><body>
+<a href="/MSDS/MSDSFiles/64-19-7Alfa-Aesar.pdf" class="blue" target="_blank">View / download</a>
+</body></html>'''
+
+FLUOROCHEM_ANSWER = {'data': [{'molecule': {'sds': {'custrecord_sdslink_en': '/core/media/media.nl?id=1'}}}]}
+
+
+def mock_vendor_send(adapter, request, *args, **kwargs):
+    '''Answer like the vendor sites would'''
+    if 'chemblink' in request.url:
+        content, content_type = CHEMBLINK_PAGE.encode(), 'text/html'
+    else:
+        content, content_type = json.dumps(FLUOROCHEM_ANSWER).encode(), 'application/json'
+    response = build_response(200, {'Content-Type': content_type}, content, request.url, 'utf-8', 'OK')
+    response.request = request
+    return response
+
+
+def mock_network_down(adapter, request, *args, **kwargs):
+    raise requests.ConnectionError('network is down')
+
+
+@pytest.fixture
+def record_then_replay(tmpdir, monkeypatch):
+    '''Record responses from mock vendor sites, then replay them with the network down'''
+    monkeypatch.setattr(HTTPAdapter, 'send', mock_vendor_send)
+    recorder = FixtureStore(tmpdir, mode='record')
+    recorder.install()
+    try:
+        expect = (extract_download_url_from_chemblink('64-19-7'),
+                  extract_download_url_from_fluorochem('64-19-7'))
+    finally:
+        recorder.uninstall()
+
+    monkeypatch.setattr(HTTPAdapter, 'send', mock_network_down)
+    player = FixtureStore(tmpdir, mode='replay')
+    player.install()
+    yield expect
+    player.uninstall()
+
+
+def test_replay_without_network(record_then_replay):
+    assert record_then_replay == (
+        ('Alfa-Aesar', 'https://www.chemblink.com/MSDS/MSDSFiles/64-19-7Alfa-Aesar.pdf'),
+        ('Fluorochem', 'https://7128445.app.netsuite.com/core/media/media.nl?id=1'),
+    )
+    assert extract_download_url_from_chemblink('64-19-7') == record_then_replay[0]
+    assert extract_download_url_from_fluorochem('64-19-7') == record_then_replay[1]
+
+
+def test_replay_at_high_concurrency(record_then_replay):
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        results = list(executor.map(extract_download_url_from_chemblink, ['64-19-7'] * 200))
+    assert results == [record_then_replay[0]] * 200
+
+
+def test_fixture_files_are_versioned(tmpdir, monkeypatch):
+    monkeypatch.setattr(HTTPAdapter, 'send', mock_vendor_send)
+    recorder = FixtureStore(tmpdir, mode='record')
+    recorder.install()
+    try:
+        requests.get('https://www.chemblink.com/MSDS/64-19-7MSDS.htm')
+    finally:
+        recorder.uninstall()
+
+    fixture_file, = (tmpdir / 'www.chemblink.com').listdir()
+    fixture = json.loads(fixture_file.read_text('utf-8'))
+    assert fixture['version'] == FIXTURE_VERSION
+    assert fixture['request'] == {'method': 'GET', 'url': 'https://www.chemblink.com/MSDS/64-19-7MSDS.htm'}
+    assert fixture['response']['text'] == CHEMBLINK_PAGE
+
+
+def test_missing_fixture_in_replay(tmpdir):
+    player = FixtureStore(tmpdir, mode='replay')
+    player.install()
+    try:
+        with pytest.raises(FixtureNotFound):
+            requests.get('https://www.chemblink.com/MSDS/00000-00-0MSDS.htm')
+    finally:
+        player.uninstall()
+
+
+def test_invalid_mode(tmpdir):
+    with pytest.raises(ValueError):
+        FixtureStore(tmpdir, mode='live')
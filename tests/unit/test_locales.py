@@ -0,0 +1,88 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import json
+from pathlib import Path
+
+import pytest
+from find_sds.find_sds import (_time_left, download_sds, extract_localized_urls_from_fluorochem, find_sds,
+                               parse_locale)
+from find_sds.response_cache import build_response
+
+FLUOROCHEM_LINKS = {'custrecord_sdslink_en': '/core/media/en.pdf', 'custrecord_sdslink_de': '/core/media/de.pdf'}
+
+
+@pytest.mark.parametrize(
+    "locale, expect", [
+        ('en-US', ('en', 'US')),
+        ('ja_JP', ('ja', 'JP')),
+        ('DE-de', ('de', 'DE')),
+        ('fr', ('fr', 'FR')),
+    ]
+)
+def test_parse_locale(locale, expect):
+    assert parse_locale(locale) == expect
+
+
+@pytest.fixture
+def fluorochem(monkeypatch):
+    '''One Fluorochem search answers all languages'''
+    searches = []
+
+    def mock_post(url, data=None, **kwargs):
+        searches.append(json.loads(data)['q'])
+        body = {'data': [{'molecule': {'sds': FLUOROCHEM_LINKS}}]}
+        return build_response(200, {'Content-Type': 'application/json'}, json.dumps(body).encode(), url)
+
+    monkeypatch.setattr('find_sds.find_sds.requests.post', mock_post)
+    return searches
+
+
+def test_fluorochem_locales_in_one_request(fluorochem):
+    assert extract_localized_urls_from_fluorochem('64-19-7', ['en-GB', 'de-DE', 'ja-JP']) == {
+        'en-GB': ('Fluorochem', 'https://7128445.app.netsuite.com/core/media/en.pdf'),
+        'de-DE': ('Fluorochem', 'https://7128445.app.netsuite.com/core/media/de.pdf'),
+    }
+    assert fluorochem == ['64-19-7']
+
+
+def test_download_sds_in_several_locales(tmpdir, fluorochem, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.sds_locales', ['en-US', 'de-DE', 'ja-JP'])
+    monkeypatch.setattr('find_sds.find_sds.extract_localized_urls_from_tci', lambda cas_nr, locales: {})
+    monkeypatch.setattr('find_sds.find_sds._find_download_url',
+                        lambda cas_nr: ('fisher', 'Fisher', 'https://www.fishersci.com/sds.pdf'))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, url.encode(), url))
+
+    assert download_sds('64-19-7', download_path=tmpdir) == ('64-19-7', True, 'Fisher')
+    assert sorted(os.listdir(tmpdir)) == ['64-19-7-SDS.pdf', '64-19-7-de-DE-SDS.pdf']
+    assert (Path(tmpdir) / '64-19-7-de-DE-SDS.pdf').read_bytes() == b'https://7128445.app.netsuite.com/core/media/de.pdf'
+
+    # Only the missing locale is searched again
+    assert download_sds('64-19-7', download_path=tmpdir) == ('64-19-7', True, None)
+    assert fluorochem == ['64-19-7', '64-19-7']
+
+
+def test_one_deadline_for_all_locales(tmpdir, fluorochem, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('find_sds.find_sds.time.monotonic', lambda: now[0])
+    monkeypatch.setattr('find_sds.find_sds.sds_locales', ['en-US', 'de-DE'])
+
+    def slow_tci(cas_nr, locales):
+        now[0] += 8
+        return {}
+
+    time_left = []
+    monkeypatch.setattr('find_sds.find_sds.extract_localized_urls_from_tci', slow_tci)
+    monkeypatch.setattr('find_sds.find_sds._find_download_url',
+                        lambda cas_nr: time_left.append(_time_left()) or (None, None, None))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4', url))
+
+    download_sds('64-19-7', download_path=tmpdir, deadline=10)
+    assert time_left == [2]
+
+
+def test_all_sources_in_several_locales_is_refused(tmpdir):
+    with pytest.raises(ValueError, match='locales'):
+        find_sds(['64-19-7'], download_path=tmpdir, all_sources=True, locales=['en-US', 'de-DE'])
@@ -0,0 +1,65 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pytest
+from find_sds.find_sds import _probe_url, extract_download_url_from_chemblink, extract_download_url_from_tci
+from find_sds.response_cache import build_response
+
+
+class MockServer:
+    def __init__(self, head_status, get_status=200):
+        self.head_status = head_status
+        self.get_status = get_status
+        self.requests = []
+
+    def head(self, url, **kwargs):
+        self.requests.append(('head', url))
+        return build_response(self.head_status, {}, b'', url)
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(('get', url, (headers or {}).get('Range')))
+        return build_response(self.get_status, {}, b'%PDF-1.4', url)
+
+
+@pytest.mark.parametrize(
+    "head_status, get_status, expect", [
+        (200, 200, True),
+        (404, 200, False),
+        (410, 200, False),
+        (302, 200, False),
+        (500, 200, None),
+        (403, 200, None),
+        (405, 206, True),
+        (405, 404, False),
+    ]
+)
+def test_probe_url(monkeypatch, head_status, get_status, expect):
+    server = MockServer(head_status, get_status)
+    monkeypatch.setattr('find_sds.find_sds.requests.head', server.head)
+    monkeypatch.setattr('find_sds.find_sds.requests.get', server.get)
+    assert _probe_url('https://www.chemblink.com/MSDS/64-19-7MSDS.htm') is expect
+    if head_status == 405:
+        assert server.requests[-1] == ('get', 'https://www.chemblink.com/MSDS/64-19-7MSDS.htm', 'bytes=0-1023')
+
+
+def test_chemblink_missing_page_is_not_downloaded(monkeypatch):
+    server = MockServer(head_status=404)
+    monkeypatch.setattr('find_sds.find_sds.probe_urls', True)
+    monkeypatch.setattr('find_sds.find_sds.requests.head', server.head)
+    monkeypatch.setattr('find_sds.find_sds.requests.get', server.get)
+    assert extract_download_url_from_chemblink('00000-00-0') is None
+    assert server.requests == [('head', 'https://www.chemblink.com/MSDS/00000-00-0MSDS.htm')]
+
+
+@pytest.mark.parametrize(
+    "head_status, expect_posts", [
+        (200, 0),
+        (404, 1),
+    ]
+)
+def test_tci_predictable_sds_url(mock_tci, monkeypatch, head_status, expect_posts):
+    monkeypatch.setattr('find_sds.find_sds.probe_urls', True)
+    monkeypatch.setattr('find_sds.find_sds.requests.Session.head',
+                        lambda session, url, **kwargs: build_response(head_status, {}, b'', url))
+    assert extract_download_url_from_tci('623-51-8') == ('TCI', 'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf')
+    assert [request[0] for request in mock_tci.requests].count('post') == expect_posts
@@ -0,0 +1,62 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pstats
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+
+import pytest
+from find_sds.find_sds import _download_task, _init_worker
+from find_sds.profiling import WorkerProfiler, profile_report
+from find_sds.response_cache import build_response
+
+
+def test_profile_of_this_process(tmpdir):
+    profiler = WorkerProfiler(tmpdir, 'all')
+    profiler.start()
+    with profiler.measure('search:tci'):
+        data = [bytes(1000) for _ in range(100)]
+    # The memory still held by the stage counts
+    assert profiler.stages['search:tci']['allocated'] >= sum(map(len, data))
+    profiler.stop()
+
+    assert sorted(os.listdir(tmpdir)) == [f'worker-{os.getpid()}.json', f'worker-{os.getpid()}.prof']
+    report = profile_report(tmpdir)
+    assert 'search:tci' in report
+    assert 'Top allocation sites' in report
+    assert (Path(tmpdir) / 'report.txt').read_text() == report
+
+
+def test_measure_without_start_is_a_no_op(tmpdir):
+    profiler = WorkerProfiler(tmpdir)
+    with profiler.measure('download'):
+        pass
+    profiler.stop()
+    assert profile_report(tmpdir) is None
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError, match='mode'):
+        WorkerProfiler('profile', 'disk')
+
+
+def test_profiles_of_pool_workers_are_merged(tmpdir, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds._find_download_url',
+                        lambda cas_nr: ('fisher', 'Fisher', 'https://www.fishersci.com/sds.pdf'))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4', url))
+    profile_path = Path(tmpdir) / 'profile'
+    profiler = WorkerProfiler(profile_path, 'cpu')
+    task = partial(_download_task, download_path=Path(tmpdir) / 'SDS')
+
+    with Pool(2, initializer=_init_worker, initargs=({'profiler': profiler},)) as p:
+        p.map(task, ['50-00-0', '64-19-7', '67-64-1', '71-43-2'])
+        p.close()
+        p.join()
+
+    profiles = list(profile_path.glob('worker-*.prof'))
+    assert 1 <= len(profiles) <= 2
+    report = profile_report(profile_path)
+    assert ' download ' in report and ' write ' in report
+    assert any('download_sds' in function for _, _, function in pstats.Stats(str(profile_path / 'merged.prof')).stats)
@@ -0,0 +1,99 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import io
+import json
+from pathlib import Path
+
+import pytest
+from find_sds.find_sds import _download_task
+from find_sds.progress import ProgressReporter, count_started
+from find_sds.response_cache import build_response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('find_sds.progress.time.monotonic', lambda: now[0])
+    return now
+
+
+def test_counts_rates_and_eta(clock):
+    progress = ProgressReporter(total=100, workers=10, window=60)
+    for i in range(20):
+        clock[0] += 1
+        progress.update(downloaded=i % 4 != 0, provider='tci' if i % 2 else 'vwr', size=2**20)
+    progress.update(downloaded=True, existed=True)
+
+    snapshot = progress.snapshot()
+    assert (snapshot['done'], snapshot['downloaded'], snapshot['existing'], snapshot['missing']) == (21, 15, 1, 5)
+    assert snapshot['in_flight'] == 10
+    assert snapshot['cas_per_sec'] == pytest.approx(21 / 20)
+    assert snapshot['bytes_per_sec'] == pytest.approx(20 * 2**20 / 20)
+    assert snapshot['eta'] == round(79 / (21 / 20))
+    assert snapshot['provider_hits'] == {'tci': 10, 'vwr': 5}
+
+
+def test_rates_follow_recent_throughput(clock):
+    progress = ProgressReporter(total=1000, window=60)
+    for _ in range(100):
+        clock[0] += 1
+        progress.update(downloaded=True)
+        progress.snapshot()
+    # Throughput drops to one CAS every 10 s
+    for _ in range(12):
+        clock[0] += 10
+        progress.update(downloaded=True)
+        progress.snapshot()
+    assert progress.snapshot()['cas_per_sec'] == pytest.approx(0.1, rel=0.2)
+
+
+def test_report_prints_and_saves_snapshots(clock, tmpdir):
+    stream = io.StringIO()
+    snapshot_path = Path(tmpdir) / 'progress.jsonl'
+    progress = ProgressReporter(total=4, workers=2, interval=5, stream=stream, snapshot_path=snapshot_path)
+    clock[0] += 2
+    progress.update(downloaded=True, provider='chemicalsafety', size=1000)
+    progress.report()
+    clock[0] += 60
+    progress.report()
+    progress.close()
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0].startswith('[progress] 1/4 (25.0%): 1 downloaded, 0 existing, 0 missing, 2 in flight')
+    assert lines[0].endswith('| chemicalsafety=1')
+    # A stall shows up
+    assert lines[1].endswith('nothing done for 0:01:00')
+    snapshots = [json.loads(line) for line in snapshot_path.read_text().splitlines()]
+    assert len(snapshots) == 3
+    assert snapshots[-1]['done'] == 1
+
+
+def test_download_task_reports_provider_and_size(tmpdir, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds._find_download_url',
+                        lambda cas_nr: ('fisher', 'Fisher', 'https://www.fishersci.com/sds.pdf'))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4', url))
+    assert _download_task('64-19-7', download_path=tmpdir) == (
+        ('64-19-7', True, 'Fisher'), {'downloaded': True, 'existed': False, 'provider': 'fisher', 'size': 8})
+    assert _download_task('64-19-7', download_path=tmpdir) == (
+        ('64-19-7', True, None), {'downloaded': True, 'existed': True})
+
+
+def test_in_flight_counts_started_lookups(clock, tmpdir, monkeypatch):
+    started = {}
+    progress = ProgressReporter(total=100, workers=10, started=started)
+    # Workers idle (e.g. waiting for the pool to hand out work)
+    assert progress.snapshot()['in_flight'] == 0
+
+    count_started(started, 'w1')
+    count_started(started, 'w2')
+    count_started(started, 'w2')
+    progress.update(downloaded=True)
+    assert started == {'w1': 1, 'w2': 2}
+    assert progress.snapshot()['in_flight'] == 2
+
+    monkeypatch.setattr('find_sds.find_sds.tasks_started', started)
+    monkeypatch.setattr('find_sds.find_sds.download_sds', lambda cas_nr, **kwargs: (cas_nr, True, None))
+    _download_task('64-19-7', download_path=tmpdir)
+    assert started[os.getpid()] == 1
@@ -0,0 +1,98 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pytest
+from find_sds.find_sds import download_sds, _search_provider
+from find_sds.provider_health import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr('find_sds.provider_health.time.monotonic', fake_clock)
+    return fake_clock
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(max_failures=3, window=60, cooldown=300)
+    for _ in range(2):
+        breaker.record_failure('tci')
+    assert breaker.allow('tci')
+
+    breaker.record_failure('tci')
+    assert not breaker.allow('tci')
+    assert breaker.allow('vwr')
+    assert breaker.summary() == {'tci': {'open': True, 'trips': 1, 'skipped': 1}}
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(max_failures=2)
+    breaker.record_failure('tci')
+    breaker.record_success('tci')
+    breaker.record_failure('tci')
+    assert breaker.allow('tci')
+
+
+def test_failures_outside_window_are_forgotten(clock):
+    breaker = CircuitBreaker(max_failures=2, window=60)
+    breaker.record_failure('tci')
+    clock.now += 61
+    breaker.record_failure('tci')
+    assert breaker.allow('tci')
+
+
+def test_probe_after_cooldown(clock):
+    breaker = CircuitBreaker(max_failures=1, cooldown=300)
+    breaker.record_failure('tci')
+    assert not breaker.allow('tci')
+
+    clock.now += 300
+    # Only one probe is let through
+    assert breaker.allow('tci')
+    assert not breaker.allow('tci')
+
+    # Failed probe: skipped for another cooldown
+    breaker.record_failure('tci')
+    assert not breaker.allow('tci')
+    clock.now += 300
+    assert breaker.allow('tci')
+
+    # Successful probe: circuit closed
+    breaker.record_success('tci')
+    assert breaker.allow('tci')
+    assert breaker.summary()['tci'] == {'open': False, 'trips': 2, 'skipped': 3}
+
+
+def test_search_provider_records_swallowed_errors(monkeypatch, clock):
+    breaker = CircuitBreaker(max_failures=2)
+    monkeypatch.setattr('find_sds.find_sds.circuit_breaker', breaker)
+
+    def mock_failing_request(*args, **kwargs):
+        raise RuntimeError()
+
+    monkeypatch.setattr('find_sds.find_sds.requests.get', mock_failing_request)
+    for _ in range(2):
+        assert _search_provider('chemblink', '64-19-7') is None
+    assert not breaker.allow('chemblink')
+
+
+def test_download_sds_skips_open_providers(tmpdir, monkeypatch, clock):
+    breaker = CircuitBreaker(max_failures=1)
+    breaker.record_failure('chemblink')
+    monkeypatch.setattr('find_sds.find_sds.circuit_breaker', breaker)
+
+    searched = []
+    for provider in ['chemblink', 'vwr', 'fisher', 'tci', 'chemicalsafety', 'fluorochem']:
+        monkeypatch.setattr(f'find_sds.find_sds.extract_download_url_from_{provider}',
+                            lambda cas_nr, provider=provider: searched.append(provider))
+
+    assert download_sds('64-19-7', download_path=tmpdir) == ('64-19-7', False, None)
+    assert searched == ['vwr', 'fisher', 'tci', 'chemicalsafety', 'fluorochem']
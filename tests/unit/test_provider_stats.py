@@ -0,0 +1,74 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pytest
+from find_sds.find_sds import PROVIDERS, _find_download_url
+from find_sds.provider_stats import ProviderStats, cas_bucket
+
+
+@pytest.mark.parametrize(
+    "cas_nr, expect", [
+        ('64-19-7', 'cas-2'),
+        ('7440-06-4', 'cas-4'),
+        ('885051-07-0', 'cas-6'),
+    ]
+)
+def test_cas_bucket(cas_nr, expect):
+    assert cas_bucket(cas_nr) == expect
+
+
+def test_default_order_without_statistics():
+    stats = ProviderStats()
+    assert stats.order(PROVIDERS) == PROVIDERS
+    # Preferred providers win ties
+    assert stats.order(PROVIDERS, preferred=['fluorochem', 'tci']) == [
+        'fluorochem', 'tci', 'chemblink', 'vwr', 'fisher', 'chemicalsafety']
+
+
+def test_providers_ordered_by_expected_time_to_hit():
+    stats = ProviderStats()
+    for _ in range(20):
+        stats.record('chemblink', '64-19-7', hit=False, search_time=0.5)
+        stats.record('tci', '64-19-7', hit=True, search_time=1.0)
+        stats.record('chemicalsafety', '64-19-7', hit=True, search_time=0.5)
+    assert stats.order(['chemblink', 'tci', 'chemicalsafety']) == ['chemicalsafety', 'tci', 'chemblink']
+
+
+def test_bucket_statistics_once_there_are_enough_lookups():
+    stats = ProviderStats(min_bucket_lookups=5)
+    for _ in range(30):
+        stats.record('vwr', '64-19-7', hit=True, search_time=1.0)
+        stats.record('tci', '64-19-7', hit=False, search_time=1.0)
+    for _ in range(5):
+        stats.record('vwr', '885051-07-0', hit=False, search_time=1.0)
+        stats.record('tci', '885051-07-0', hit=True, search_time=1.0)
+    assert stats.order(['vwr', 'tci'], '50-00-0') == ['vwr', 'tci']
+    assert stats.order(['vwr', 'tci'], '123456-00-0') == ['tci', 'vwr']
+
+
+def test_statistics_are_kept_across_runs(tmpdir):
+    path = tmpdir / 'provider_stats.json'
+    stats = ProviderStats(path)
+    stats.record('tci', '64-19-7', hit=True, search_time=0.2)
+    stats.save()
+
+    stats = ProviderStats(path)
+    stats.load()
+    assert stats.state == {'*|tci': [1, 0, 0.2], 'cas-2|tci': [1, 0, 0.2]}
+
+
+def test_find_download_url_learns_order(monkeypatch):
+    searched = []
+
+    def mock_search_provider(provider, cas_nr):
+        searched.append(provider)
+        if provider == 'chemicalsafety':
+            return 'Sigma-Aldrich', 'https://chemicalsafety.com/sds.pdf'
+
+    stats = ProviderStats()
+    for _ in range(10):
+        stats.record('chemicalsafety', '64-19-7', hit=True, search_time=1.0)
+    monkeypatch.setattr('find_sds.find_sds.provider_stats', stats)
+    monkeypatch.setattr('find_sds.find_sds._search_provider', mock_search_provider)
+    assert _find_download_url('64-19-7') == ('chemicalsafety', 'Sigma-Aldrich', 'https://chemicalsafety.com/sds.pdf')
+    assert searched == ['chemicalsafety']
@@ -0,0 +1,147 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import json
+import time
+from pathlib import Path
+
+import pytest
+from find_sds.find_sds import download_sds
+from find_sds.refresh import DAY, RefreshBudget, RefreshScheduler, refresh_sds, staleness
+from find_sds.response_cache import build_response
+
+NOW = 1_700_000_000
+
+
+@pytest.mark.parametrize(
+    "kwargs, expect", [
+        ({'checked': NOW - 100 * DAY}, 100 / 365),
+        ({'checked': NOW - 400 * DAY}, 400 / 365),
+        # Changed once: checked twice as often
+        ({'checked': NOW - 200 * DAY, 'changes': 1, 'checks': 2}, 400 / 365),
+        ({'checked': NOW - 100 * DAY, 'vendor_change_rate': 0.5}, 150 / 365),
+        ({'checked': NOW - 100 * DAY, 'revision_date': NOW - 4 * 365 * DAY}, 200 / 365),
+        ({'checked': NOW - 100 * DAY, 'revision_date': NOW - 365 * DAY}, 100 / 365),
+    ]
+)
+def test_staleness(kwargs, expect):
+    assert staleness(NOW, max_age=365 * DAY, **kwargs) == pytest.approx(expect)
+
+
+def test_budget():
+    budget = RefreshBudget(max_requests=10, max_bytes=1000)
+    budget.spend(requests=5, size=900)
+    assert not budget.exhausted()
+    budget.spend(requests=5)
+    assert budget.exhausted()
+    assert RefreshBudget(max_seconds=0).exhausted()
+    assert RefreshBudget().time_left() is None
+
+
+def save_sds(folder, cas_nr, age_days, content=b'%PDF-1.4 old'):
+    path = Path(folder) / f'{cas_nr}-SDS.pdf'
+    path.write_bytes(content)
+    os.utime(path, (time.time() - age_days * DAY,) * 2)
+    return path
+
+
+def test_due_most_overdue_first(tmpdir):
+    save_sds(tmpdir, '64-19-7', 400)
+    save_sds(tmpdir, '67-64-1', 800)
+    save_sds(tmpdir, '71-43-2', 30)
+    (Path(tmpdir) / 'notes.pdf').write_bytes(b'%PDF-1.4')
+    assert [cas_nr for cas_nr, score in RefreshScheduler(tmpdir).due()] == ['67-64-1', '64-19-7']
+
+    # A recent check counts, not the age of the file
+    scheduler = RefreshScheduler(tmpdir)
+    scheduler.record('67-64-1', changed=False, source='fisher')
+    scheduler.save()
+    assert [cas_nr for cas_nr, score in RefreshScheduler(tmpdir).due()] == ['64-19-7']
+
+
+def test_sds_that_changed_are_due_sooner(tmpdir):
+    save_sds(tmpdir, '64-19-7', 200)
+    scheduler = RefreshScheduler(tmpdir)
+    assert scheduler.due() == []
+    scheduler.state['64-19-7'] = {'checked': time.time() - 200 * DAY, 'checks': 3, 'changes': 2}
+    assert [cas_nr for cas_nr, score in scheduler.due()] == ['64-19-7']
+
+
+
+def test_only_main_sds_is_due(tmpdir):
+    save_sds(tmpdir, '64-19-7', 400)
+    for name in ['64-19-7-Fisher-SDS.pdf', '64-19-7-de-DE-SDS.pdf', '67-64-1-Fisher-SDS.pdf']:
+        path = Path(tmpdir) / name
+        path.write_bytes(b'%PDF-1.4')
+        os.utime(path, (time.time() - 800 * DAY,) * 2)
+    due = RefreshScheduler(tmpdir).due()
+    assert [cas_nr for cas_nr, score in due] == ['64-19-7']
+    # Files of other locales and sources are not refreshed, and do not count
+    assert due[0][1] == pytest.approx(400 / 365, rel=1e-3)
+
+
+def test_failed_checks_back_off(tmpdir):
+    save_sds(tmpdir, '64-19-7', 800)
+    save_sds(tmpdir, '67-64-1', 400)
+    scheduler = RefreshScheduler(tmpdir)
+    now = time.time()
+    scheduler.record_failure('64-19-7', now=now)
+    assert [cas_nr for cas_nr, score in scheduler.due(now)] == ['67-64-1']
+    # Due again, first, after a day, then after 2 days once it failed again
+    assert [cas_nr for cas_nr, score in scheduler.due(now + DAY)] == ['64-19-7', '67-64-1']
+    scheduler.record_failure('64-19-7', now=now + DAY)
+    assert [cas_nr for cas_nr, score in scheduler.due(now + 2.5 * DAY)] == ['67-64-1']
+    assert [cas_nr for cas_nr, score in scheduler.due(now + 3 * DAY)] == ['64-19-7', '67-64-1']
+
+    scheduler.record('64-19-7', changed=False, source='fisher', now=now + 3 * DAY)
+    assert scheduler.state['64-19-7'] == {'checked': now + 3 * DAY, 'checks': 1, 'changes': 0, 'source': 'fisher'}
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    '''Every SDS is found at Fisher, and has changed'''
+    monkeypatch.setattr('find_sds.find_sds._find_download_url',
+                        lambda cas_nr: ('fisher', 'Fisher', f'https://www.fishersci.com/{cas_nr}.pdf'))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4 new', url))
+
+
+def test_download_sds_refresh(tmpdir, provider):
+    path = save_sds(tmpdir, '64-19-7', 400)
+    assert download_sds('64-19-7', download_path=tmpdir) == ('64-19-7', True, None)
+    assert download_sds('64-19-7', download_path=tmpdir, refresh=True) == ('64-19-7', True, 'Fisher')
+    assert path.read_bytes() == b'%PDF-1.4 new'
+
+    # An unchanged SDS is not written again
+    mtime = path.stat().st_mtime
+    time.sleep(0.01)
+    download_sds('64-19-7', download_path=tmpdir, refresh=True)
+    assert path.stat().st_mtime == mtime
+
+
+def test_refresh_stops_when_budget_is_spent(tmpdir, provider):
+    for i, cas_nr in enumerate(['50-00-0', '64-19-7', '67-64-1', '71-43-2']):
+        save_sds(tmpdir, cas_nr, 1000 - i)
+
+    # One request per SDS: 2 batches of 1 SDS
+    assert refresh_sds(tmpdir, pool_size=1, max_requests=2) == {'due': 4, 'checked': 2, 'changed': 2, 'failed': 0}
+    state = json.loads((Path(tmpdir) / '.find_sds_refresh.json').read_text())
+    assert sorted(state) == ['50-00-0', '64-19-7']
+    assert state['50-00-0']['source'] == 'fisher'
+
+    # The next run goes on with the others
+    assert refresh_sds(tmpdir, pool_size=2) == {'due': 2, 'checked': 2, 'changed': 2, 'failed': 0}
+    assert RefreshScheduler(tmpdir).due() == []
+
+
+def test_sds_not_found_does_not_take_the_budget_again(tmpdir, monkeypatch):
+    for i, cas_nr in enumerate(['50-00-0', '64-19-7', '67-64-1']):
+        save_sds(tmpdir, cas_nr, 1000 - i)
+    monkeypatch.setattr('find_sds.find_sds._find_download_url',
+                        lambda cas_nr: ('fisher', 'Fisher', f'https://www.fishersci.com/{cas_nr}.pdf')
+                        if cas_nr != '50-00-0' else (None, None, None))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4 new', url))
+
+    assert refresh_sds(tmpdir, pool_size=1, max_minutes=10) == {'due': 3, 'checked': 2, 'changed': 2, 'failed': 1}
+    assert RefreshScheduler(tmpdir).due() == []
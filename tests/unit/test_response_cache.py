@@ -0,0 +1,220 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pickle
+
+import pytest
+import requests
+from find_sds.find_sds import _fetch
+from find_sds.response_cache import (DiskResponseCache, ResponseCache, build_response,
+                                     freshness_lifetime, make_cache_key)
+
+
+def make_response(content=b'<html></html>', status_code=200, headers=None):
+    return build_response(status_code, {'Content-Type': 'text/html', **(headers or {})}, content,
+                          'https://us.vwr.com/store/msds')
+
+
+@pytest.mark.parametrize(
+    "request1, request2, same_key", [
+        (('get', 'https://us.vwr.com/store/msds', {'keyword': '64-19-7'}, None),
+         ('get', 'https://us.vwr.com/store/msds?keyword=64-19-7', None, None), True),
+        (('get', 'https://us.vwr.com/store/msds', {'keyword': '64-19-7'}, None),
+         ('get', 'https://us.vwr.com/store/msds', {'keyword': '67-68-5'}, None), False),
+        (('post', 'https://dougdiscovery.com/api/v1/molecules/search', None, '{"q": "64-19-7"}'),
+         ('post', 'https://dougdiscovery.com/api/v1/molecules/search', None, '{"q": "64-19-7"}'), True),
+        (('post', 'https://dougdiscovery.com/api/v1/molecules/search', None, '{"q": "64-19-7"}'),
+         ('get', 'https://dougdiscovery.com/api/v1/molecules/search', None, '{"q": "64-19-7"}'), False),
+    ]
+)
+def test_make_cache_key(request1, request2, same_key):
+    key1 = make_cache_key(request1[0], request1[1], params=request1[2], data=request1[3])
+    key2 = make_cache_key(request2[0], request2[1], params=request2[2], data=request2[3])
+    assert (key1 == key2) == same_key
+
+
+def test_cache_hit_and_miss():
+    cache = ResponseCache()
+    key = make_cache_key('get', 'https://us.vwr.com/store/msds', params={'keyword': '64-19-7'})
+    assert cache.get(key) is None
+
+    cache.put(key, make_response())
+    response, cookies = cache.get(key)
+    assert response.status_code == 200
+    assert response.text == '<html></html>'
+    assert response.history == []
+    assert cache.summary() == {'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_only_successful_responses_are_cached():
+    cache = ResponseCache()
+    cache.put('error', make_response(status_code=503))
+    redirected = make_response()
+    redirected.history = [make_response(status_code=302)]
+    cache.put('redirected', redirected)
+    assert cache.get('error') is None
+    assert cache.get('redirected') is None
+
+
+def test_expired_responses_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('find_sds.response_cache.time.monotonic', lambda: now[0])
+    cache = ResponseCache(ttl=60)
+    cache.put('key', make_response())
+    now[0] += 61
+    assert cache.get('key') is None
+
+
+@pytest.mark.parametrize(
+    "max_entries, max_bytes", [
+        (2, 1000),
+        (10, 25),
+    ]
+)
+def test_least_recently_used_is_evicted(max_entries, max_bytes):
+    cache = ResponseCache(max_entries=max_entries, max_bytes=max_bytes)
+    for key in ['a', 'b']:
+        cache.put(key, make_response(content=b'x' * 10))
+    cache.get('a')
+    cache.put('c', make_response(content=b'x' * 10))
+
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    assert cache.summary()['evictions'] == 1
+
+
+def test_cache_pickles_without_responses():
+    cache = ResponseCache()
+    cache.put('key', make_response())
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.get('key') is None
+    assert copy.summary()['misses'] == 1
+
+
+def test_fetch_uses_cache(monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.response_cache', ResponseCache())
+    requests_sent = []
+
+    def mock_get(url, **kwargs):
+        requests_sent.append(url)
+        return make_response()
+
+    monkeypatch.setattr('find_sds.find_sds.requests.get', mock_get)
+    for _ in range(3):
+        response = _fetch('get', 'https://us.vwr.com/store/msds', params={'keyword': '64-19-7'})
+        assert response.text == '<html></html>'
+    _fetch('get', 'https://us.vwr.com/store/msds', cache=False, params={'keyword': '64-19-7'})
+
+    assert len(requests_sent) == 2
+
+
+@pytest.mark.parametrize(
+    "headers, expect", [
+        ({}, 3600),
+        ({'Cache-Control': 'max-age=600'}, 600),
+        ({'Cache-Control': 'private, max-age=600', 'Age': '100'}, 500),
+        ({'Cache-Control': 'no-store'}, None),
+        ({'Cache-Control': 'no-cache'}, None),
+        ({'Expires': 'Thu, 01 Jan 2026 01:00:00 GMT', 'Date': 'Thu, 01 Jan 2026 00:00:00 GMT'}, 3600),
+        ({'Expires': '0'}, None),
+        ({'Cache-Control': 'max-age=60', 'Expires': 'Thu, 01 Jan 2026 01:00:00 GMT'}, 60),
+    ]
+)
+def test_freshness_lifetime(headers, expect):
+    assert freshness_lifetime(requests.structures.CaseInsensitiveDict(headers), default_ttl=3600) == expect
+
+
+VWR_KEY = make_cache_key('get', 'https://us.vwr.com/store/msds', params={'keyword': '64-19-7'})
+
+
+def test_disk_cache_is_kept_across_runs(tmpdir):
+    cache = DiskResponseCache(tmpdir / 'http_cache.sqlite')
+    response = make_response(headers={'Cache-Control': 'max-age=600'})
+    response.cookies.set('JSESSIONID', 'abc', domain='us.vwr.com', path='/')
+    cache.put(VWR_KEY, response)
+    cache.close()
+
+    # Another run, or another process
+    cache = DiskResponseCache(tmpdir / 'http_cache.sqlite')
+    response, cookies = cache.get(VWR_KEY)
+    assert response.text == '<html></html>'
+    assert response.headers['Cache-Control'] == 'max-age=600'
+    assert cookies['JSESSIONID'] == 'abc'
+    assert cache.get(make_cache_key('get', 'https://us.vwr.com/store/msds', params={'keyword': '67-68-5'})) is None
+    assert cache.summary() == {'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_disk_cache_honors_cache_headers(tmpdir, monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr('find_sds.response_cache.time.time', lambda: now[0])
+    cache = DiskResponseCache(tmpdir / 'http_cache.sqlite', default_ttl=3600)
+    cache.put(VWR_KEY, make_response(headers={'Cache-Control': 'no-store'}))
+    assert cache.get(VWR_KEY) is None
+
+    cache.put(VWR_KEY, make_response(headers={'Cache-Control': 'max-age=60'}))
+    now[0] += 61
+    assert cache.get(VWR_KEY) is None
+
+    cache.put(VWR_KEY, make_response())
+    now[0] += 3000
+    assert cache.get(VWR_KEY)
+
+
+def test_disk_cache_evicts_least_recently_used(tmpdir, monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr('find_sds.response_cache.time.time', lambda: now[0])
+    cache = DiskResponseCache(tmpdir / 'http_cache.sqlite', max_bytes=25)
+    keys = [make_cache_key('get', 'https://us.vwr.com/store/msds', params={'keyword': cas_nr})
+            for cas_nr in ['64-19-7', '67-68-5', '75-09-2']]
+    for key in keys[:2]:
+        cache.put(key, make_response(content=b'x' * 10))
+        now[0] += 100
+    cache.get(keys[0])
+    now[0] += 100
+    cache.put(keys[2], make_response(content=b'x' * 10))
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) and cache.get(keys[2])
+    assert cache.summary()['evictions'] == 1
+
+
+def test_disk_cache_evicts_every_few_responses(tmpdir, monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr('find_sds.response_cache.time.time', lambda: now[0])
+    cache = DiskResponseCache(tmpdir / 'http_cache.sqlite', max_bytes=1000, evict_interval=3)
+    keys = [make_cache_key('get', 'https://us.vwr.com/store/msds', params={'keyword': cas_nr})
+            for cas_nr in ['64-19-7', '67-68-5', '75-09-2', '71-43-2']]
+    for key in keys[:2]:
+        cache.put(key, make_response(headers={'Cache-Control': 'max-age=60'}, content=b'x' * 10))
+    now[0] += 61
+    cache.put(keys[2], make_response(content=b'x' * 10))
+    assert cache.summary()['evictions'] == 2
+
+    # Or sooner, once 5% of the cache is written
+    cache.put(keys[0], make_response(headers={'Cache-Control': 'max-age=60'}, content=b'x' * 10))
+    now[0] += 61
+    cache.put(keys[1], make_response(content=b'x' * 50))
+    assert cache.summary()['evictions'] == 3
+
+    cache.put(keys[3], make_response(headers={'Cache-Control': 'max-age=60'}, content=b'x' * 10))
+    now[0] += 61
+    cache.close()
+    assert cache.summary()['evictions'] == 4
+
+
+def test_fetch_uses_disk_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.response_cache', ResponseCache())
+    monkeypatch.setattr('find_sds.find_sds.http_cache', pickle.loads(pickle.dumps(
+        DiskResponseCache(tmpdir / 'http_cache.sqlite'))))
+    requests_sent = []
+
+    def mock_get(url, **kwargs):
+        requests_sent.append(url)
+        return make_response()
+
+    monkeypatch.setattr('find_sds.find_sds.requests.get', mock_get)
+    _fetch('get', 'https://us.vwr.com/store/msds', params={'keyword': '64-19-7'})
+    # A new run starts with an empty memory cache
+    monkeypatch.setattr('find_sds.find_sds.response_cache', ResponseCache())
+    assert _fetch('get', 'https://us.vwr.com/store/msds', params={'keyword': '64-19-7'}).text == '<html></html>'
+    assert len(requests_sent) == 1
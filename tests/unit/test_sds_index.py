@@ -0,0 +1,98 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import time
+from pathlib import Path
+
+import pytest
+from find_sds.sds_index import SDSIndex, parse_sds
+from find_sds.storage import SDSLibrary
+
+ACETIC_ACID = '''SAFETY DATA SHEET
+Revision date 12-Feb-2020
+Product name : Acetic acid, glacial
+Company : Fisher Scientific
+Signal word Danger
+H226 Flammable liquid and vapor. H314 Causes severe skin burns and eye damage.
+P210 P280 P303+P361+P353 P305+P351+P338
+'''
+
+BENZENE = '''Product name: Benzene
+Manufacturer: TCI America
+Revision Date: 2021-03-01
+Signal Word: DANGER
+H225 H304 H315 H319 H340 H350 H372 H412
+P201 P210
+'''
+
+
+def test_parse_sds():
+    assert parse_sds(ACETIC_ACID) == {
+        'product_name': 'Acetic acid, glacial',
+        'vendor': 'Fisher Scientific',
+        'revision_date': '12-Feb-2020',
+        'signal_word': 'Danger',
+        'h_codes': 'H226 H314',
+        'p_codes': 'P210 P280 P303 P305 P338 P351 P353 P361',
+    }
+
+
+@pytest.mark.parametrize(
+    "text, expect", [
+        ('H300+H310+H330 Fatal if swallowed', 'H300 H310 H330'),
+        ('H360FD May damage fertility', 'H360FD'),
+        ('EUH066 H336', 'EUH066 H336'),
+        ('No hazards (SH3000)', ''),
+    ]
+)
+def test_parse_h_codes(text, expect):
+    assert parse_sds(text)['h_codes'] == expect
+
+
+@pytest.fixture
+def library(tmpdir, monkeypatch):
+    '''Download folder where the "PDF" files are plain text'''
+    monkeypatch.setattr('find_sds.sds_index.extract_text',
+                        lambda path: Path(path).read_text(encoding='utf-8'))
+    SDSLibrary(tmpdir, 'prefix').save_layout()
+    for cas_nr, text in [('64-19-7', ACETIC_ACID), ('71-43-2', BENZENE)]:
+        path = SDSLibrary.open(tmpdir).path(cas_nr)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+    return Path(tmpdir)
+
+
+def test_search(library):
+    index = SDSIndex(library)
+    assert index.update(processes=2) == {'indexed': 2, 'unchanged': 0, 'removed': 0, 'failed': 0}
+
+    assert [row['cas'] for row in index.search(code='H350')] == ['71-43-2']
+    assert [row['cas'] for row in index.search(code='p210')] == ['64-19-7', '71-43-2']
+    assert [row['cas'] for row in index.search(signal_word='danger', code='H314')] == ['64-19-7']
+    assert [row['cas'] for row in index.search(text='"flammable liquid"')] == ['64-19-7']
+    assert index.search(cas_nr='71-43-2')[0]['path'] == library / '0000' / '71-43-2-SDS.pdf'
+    assert index.search(code='H400') == []
+
+
+def test_only_new_and_changed_files_are_read(library, monkeypatch):
+    SDSIndex(library).update(processes=1)
+
+    changed = library / '0000' / '64-19-7-SDS.pdf'
+    changed.write_text(ACETIC_ACID.replace('H226', 'H225'), encoding='utf-8')
+    os.utime(changed, (time.time() + 10, time.time() + 10))
+    (library / '0000' / '71-43-2-SDS.pdf').unlink()
+    (library / '0000' / '67-64-1-SDS.pdf').write_text('Product name: Acetone\nH225 H319 H336', encoding='utf-8')
+
+    index = SDSIndex(library)
+    assert index.update(processes=1) == {'indexed': 2, 'unchanged': 0, 'removed': 1, 'failed': 0}
+    assert [row['cas'] for row in index.search(code='H225')] == ['64-19-7', '67-64-1']
+    assert index.search(code='H350') == []
+    assert index.update(processes=1) == {'indexed': 0, 'unchanged': 2, 'removed': 0, 'failed': 0}
+
+
+def test_unreadable_file_is_not_retried_until_changed(library, monkeypatch):
+    (library / 'broken-SDS.pdf').write_bytes(b'\xff\xfe not text')
+    index = SDSIndex(library)
+    assert index.update(processes=1)['failed'] == 1
+    assert len(index.search()) == 2
+    assert index.update(processes=1)['failed'] == 0
@@ -0,0 +1,144 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+from find_sds.service import SDSService, make_server
+
+
+@pytest.fixture
+def service(tmpdir, monkeypatch):
+    # SDSService installs its sessions, circuit breaker and cache into find_sds.find_sds
+    monkeypatch.setattr('find_sds.find_sds.http_session', None)
+    monkeypatch.setattr('find_sds.find_sds.circuit_breaker', None)
+    monkeypatch.setattr('find_sds.find_sds.response_cache', None)
+    monkeypatch.setattr('find_sds.find_sds.tci_client', None)
+    monkeypatch.setattr('find_sds.find_sds.probe_urls', False)
+    return SDSService(tmpdir)
+
+
+def test_concurrent_lookups_are_coalesced(service, monkeypatch):
+    calls = []
+
+    def mock_find_download_url(cas_nr):
+        calls.append(cas_nr)
+        time.sleep(0.2)
+        return 'tci', 'TCI', f'https://www.tcichemicals.com/US/en/sds/{cas_nr}.pdf'
+
+    monkeypatch.setattr('find_sds.service._find_download_url', mock_find_download_url)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.lookup_url('64-19-7')))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['64-19-7']
+    assert results == [('TCI', 'https://www.tcichemicals.com/US/en/sds/64-19-7.pdf')] * 5
+
+    # Later lookups are answered from memory
+    assert service.lookup_url('64-19-7') == results[0]
+    assert calls == ['64-19-7']
+
+
+def test_lookup_errors_reach_every_waiter(service, monkeypatch):
+    def mock_find_download_url(cas_nr):
+        raise RuntimeError()
+
+    monkeypatch.setattr('find_sds.service._find_download_url', mock_find_download_url)
+    with pytest.raises(RuntimeError):
+        service.lookup_url('64-19-7')
+    # Nothing is left in flight after an error
+    with pytest.raises(RuntimeError):
+        service.lookup_url('64-19-7')
+
+
+def test_get_sds_serves_existing_file(service, monkeypatch):
+    existing_file = Path(service.download_path) / '64-19-7-SDS.pdf'
+    existing_file.write_bytes(b'%PDF-1.4')
+    monkeypatch.setattr('find_sds.service.download_sds', None)
+    assert service.get_sds('64-19-7') == existing_file
+
+
+@pytest.fixture
+def server_url(service, monkeypatch):
+    monkeypatch.setattr('find_sds.service._find_download_url',
+                        lambda cas_nr: (None, None, None) if cas_nr == '00000-00-0'
+                        else ('fisher', 'Fisher', 'https://www.fishersci.com/sds.pdf'))
+    (Path(service.download_path) / '64-19-7-SDS.pdf').write_bytes(b'%PDF-1.4')
+
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_unix_socket_not_supported(service, monkeypatch, tmpdir):
+    monkeypatch.delattr('find_sds.service.socketserver.UnixStreamServer')
+    with pytest.raises(ValueError, match='Unix sockets are not supported'):
+        make_server(service, unix_socket=str(Path(tmpdir) / 'find_sds.sock'))
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+
+
+@pytest.mark.parametrize(
+    "path, expect_status, expect_body", [
+        ('/sds/64-19-7', 200, b'%PDF-1.4'),
+        ('/sds/64-19-7/url', 200,
+         {'cas_nr': '64-19-7', 'source': 'Fisher', 'url': 'https://www.fishersci.com/sds.pdf'}),
+        ('/sds/00000-00-0/url', 404, {'cas_nr': '00000-00-0', 'source': None, 'url': None}),
+        ('/sds/..%2F..%2Fetc/url', 400, {'error': 'invalid CAS number: ..%2F..%2Fetc'}),
+        ('/unknown', 404, {'error': 'unknown endpoint'}),
+    ]
+)
+def test_http_endpoints(server_url, path, expect_status, expect_body):
+    status, body = get(server_url + path)
+    assert status == expect_status
+    assert (body if isinstance(expect_body, bytes) else json.loads(body)) == expect_body
+
+
+@pytest.mark.parametrize(
+    "looked_up", [True, False]
+)
+def test_misses_are_not_searched_again(service, monkeypatch, looked_up):
+    searched = []
+    monkeypatch.setattr('find_sds.service._find_download_url', lambda cas_nr: (None, None, None))
+    monkeypatch.setattr('find_sds.service.download_sds',
+                        lambda cas_nr, download_path: searched.append(cas_nr) or (cas_nr, False, None))
+
+    if looked_up:
+        # A miss of the URL lookup is a miss of the SDS too
+        assert service.lookup_url('00000-00-0') == (None, None)
+    assert service.get_sds('00000-00-0') is None
+    assert service.get_sds('00000-00-0') is None
+    assert searched == ([] if looked_up else ['00000-00-0'])
+
+    # Until they expire
+    service.url_ttl = 0
+    assert service.get_sds('00000-00-0') is None
+    assert searched == ['00000-00-0'] * (1 if looked_up else 2)
+
+
+def test_close_restores_module_state(tmpdir, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.http_session', None)
+    service = SDSService(tmpdir)
+    import find_sds.find_sds
+    assert find_sds.find_sds.http_session is not None
+    service.close()
+    assert find_sds.find_sds.http_session is None
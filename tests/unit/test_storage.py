@@ -0,0 +1,92 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+from pathlib import Path
+
+import pytest
+from find_sds.find_sds import _library, download_sds
+from find_sds.response_cache import build_response
+from find_sds.storage import SDSLibrary, sds_path
+
+
+@pytest.mark.parametrize(
+    "layout, cas_nr, expect", [
+        ('flat', '64-19-7', '64-19-7-SDS.pdf'),
+        ('prefix', '64-19-7', '0000/64-19-7-SDS.pdf'),
+        ('prefix', '7440-06-4', '0007/7440-06-4-SDS.pdf'),
+        ('prefix', '885051-07-0', '0885/885051-07-0-SDS.pdf'),
+        ('hash', '64-19-7', '4b/64-19-7-SDS.pdf'),
+    ]
+)
+def test_path(tmpdir, layout, cas_nr, expect):
+    assert SDSLibrary(tmpdir, layout).path(cas_nr) == Path(tmpdir) / expect
+
+
+def test_layout_is_recorded(tmpdir):
+    SDSLibrary(tmpdir, 'hash', hash_levels=2).save_layout()
+    library = SDSLibrary.open(tmpdir)
+    assert (library.layout, library.hash_levels) == ('hash', 2)
+    assert SDSLibrary.open(Path(tmpdir) / 'new').layout == 'flat'
+
+
+def test_migrate_flat_library(tmpdir):
+    cas_numbers = ['64-19-7', '7440-06-4', '885051-07-0']
+    for cas_nr in cas_numbers:
+        (Path(tmpdir) / f'{cas_nr}-SDS.pdf').write_bytes(b'%PDF-1.4')
+    (Path(tmpdir) / 'notes.pdf').write_bytes(b'%PDF-1.4')
+
+    library = SDSLibrary.open(tmpdir)
+    assert library.migrate('prefix') == {'moved': 3, 'skipped': 1}
+    assert sorted(os.listdir(tmpdir)) == ['.find_sds_layout.json', '0000', '0007', '0885', 'notes.pdf']
+    for cas_nr in cas_numbers:
+        assert sds_path(tmpdir, cas_nr) == library.path(cas_nr)
+
+    # And on to another layout, without leftover folders
+    assert SDSLibrary.open(tmpdir).migrate('hash') == {'moved': 3, 'skipped': 1}
+    assert not (Path(tmpdir) / '0000').exists()
+    assert sds_path(tmpdir, '64-19-7') == Path(tmpdir) / '4b' / '64-19-7-SDS.pdf'
+
+
+def test_files_not_moved_yet_are_found(tmpdir):
+    (Path(tmpdir) / '64-19-7-SDS.pdf').write_bytes(b'%PDF-1.4')
+    SDSLibrary(tmpdir, 'hash', migrating=True).save_layout()
+    assert sds_path(tmpdir, '64-19-7') == Path(tmpdir) / '64-19-7-SDS.pdf'
+    assert sds_path(tmpdir, '67-68-5') is None
+
+
+def test_other_layouts_are_searched_only_during_migration(tmpdir, monkeypatch):
+    checked = []
+    exists = Path.exists
+    monkeypatch.setattr('find_sds.storage.Path.exists', lambda path: checked.append(path) or exists(path))
+    (Path(tmpdir) / '64-19-7-SDS.pdf').write_bytes(b'%PDF-1.4')
+
+    library = SDSLibrary(tmpdir, 'hash')
+    assert library.find('67-68-5') is None
+    assert checked == [library.path('67-68-5')]
+    assert library.find('64-19-7') is None
+    assert library.find('64-19-7', all_layouts=True) == Path(tmpdir) / '64-19-7-SDS.pdf'
+
+    # Once moved, files are only looked for in the new layout
+    SDSLibrary.open(tmpdir).migrate('hash')
+    assert not SDSLibrary.open(tmpdir).migrating
+    assert sds_path(tmpdir, '64-19-7') == library.path('64-19-7')
+
+
+def test_layout_of_existing_files_is_not_mixed(tmpdir, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds._libraries', {})
+    (Path(tmpdir) / '64-19-7-SDS.pdf').write_bytes(b'%PDF-1.4')
+    with pytest.raises(ValueError, match='migrate'):
+        _library(tmpdir, 'hash')
+
+
+def test_download_sds_saves_into_layout(tmpdir, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds._libraries', {})
+    _library(tmpdir, 'prefix')
+    monkeypatch.setattr('find_sds.find_sds._find_download_url',
+                        lambda cas_nr: ('fisher', 'Fisher', 'https://www.fishersci.com/sds.pdf'))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4', url))
+    assert download_sds('64-19-7', download_path=tmpdir) == ('64-19-7', True, 'Fisher')
+    assert sds_path(tmpdir, '64-19-7') == Path(tmpdir) / '0000' / '64-19-7-SDS.pdf'
+    # Found on the next run
+    assert download_sds('64-19-7', download_path=tmpdir) == ('64-19-7', True, None)
@@ -0,0 +1,79 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import pytest
+from find_sds.find_sds import TCIClient, extract_download_url_from_tci, extract_localized_urls_from_tci
+from find_sds.response_cache import ResponseCache, build_response
+
+
+def test_token_from_search_page_is_reused(mock_tci):
+    client = TCIClient()
+    assert client.search('623-51-8') == 'T0211'
+    assert client.sds_file_name('T0211') == 'T0211_US_EN.pdf'
+    assert client.sds_url('T0211_US_EN.pdf') == 'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf'
+    # No extra request for a token
+    assert mock_tci.requests == [('get', '623-51-8'), ('post', 'T0211')]
+
+
+def test_rejected_request_refreshes_token(mock_tci):
+    client = TCIClient()
+    client.search('623-51-8')
+    # Token changes on TCI side (e.g. expired session)
+    mock_tci.token_count += 1
+    assert client.sds_file_name('T0211') == 'T0211_US_EN.pdf'
+    assert mock_tci.requests == [('get', '623-51-8'), ('post', 'T0211'), ('get', None), ('post', 'T0211')]
+
+
+def test_search_page_is_not_cached(mock_tci, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.response_cache', ResponseCache())
+    # e.g. next run, with the responses kept on disk
+    for client in [TCIClient(), TCIClient()]:
+        assert client.search('623-51-8') == 'T0211'
+        assert client.sds_file_name('T0211') == 'T0211_US_EN.pdf'
+    # The token of a cached page would be rejected, then refreshed
+    assert mock_tci.requests == [('get', '623-51-8'), ('post', 'T0211')] * 2
+
+
+def test_expired_token_is_refreshed(mock_tci, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('find_sds.find_sds.time.monotonic', lambda: now[0])
+    client = TCIClient(token_ttl=60)
+    client.search('623-51-8')
+    now[0] += 61
+    client.sds_file_name('T0211')
+    assert mock_tci.requests == [('get', '623-51-8'), ('get', None), ('post', 'T0211')]
+
+
+def test_no_sds_file_name(mock_tci, monkeypatch):
+    client = TCIClient()
+    client.search('623-51-8')
+    # TCI answers without a file name, even with a new token
+    monkeypatch.setattr(client, '_post_sds_search',
+                        lambda product_code, locale: build_response(200, {}, b'', client.sds_search_url))
+    assert client.sds_file_name('T0211') is None
+    monkeypatch.setattr('find_sds.find_sds.tci_client', client)
+    assert extract_localized_urls_from_tci('623-51-8', ['en-US']) == {}
+
+
+@pytest.mark.parametrize(
+    "cas_nr, expect", [
+        ('623-51-8', ('TCI', 'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf')),
+        ('885051-07-0', ('TCI', 'https://www.tcichemicals.com/US/en/sds/B3296_US_EN.pdf')),
+        ('00000-00-0', None),
+    ]
+)
+def test_extract_url_from_tci_with_worker_client(mock_tci, monkeypatch, cas_nr, expect):
+    monkeypatch.setattr('find_sds.find_sds.tci_client', TCIClient())
+    assert extract_download_url_from_tci(cas_nr) == expect
+
+
+def test_extra_locales_reuse_the_search(mock_tci, monkeypatch):
+    monkeypatch.setattr('find_sds.find_sds.tci_client', TCIClient())
+    assert extract_localized_urls_from_tci('623-51-8', ['en-US', 'ja-JP', 'de-DE']) == {
+        'en-US': ('TCI', 'https://www.tcichemicals.com/US/en/sds/T0211_US_EN.pdf'),
+        'ja-JP': ('TCI', 'https://www.tcichemicals.com/US/en/sds/T0211_JP_JA.pdf'),
+        'de-DE': ('TCI', 'https://www.tcichemicals.com/US/en/sds/T0211_DE_DE.pdf'),
+    }
+    # Searched again for another locale later: no new search
+    extract_localized_urls_from_tci('623-51-8', ['fr-FR'])
+    assert mock_tci.requests == [('get', '623-51-8')] + [('post', 'T0211')] * 4
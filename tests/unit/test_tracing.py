@@ -0,0 +1,55 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import json
+from pathlib import Path
+
+import pytest
+import requests
+from find_sds.find_sds import PROVIDERS, _download_task
+from find_sds.response_cache import build_response
+from find_sds.tracing import TraceRecorder, export_chrome_trace
+
+
+def load_spans(path):
+    return [event for event in json.loads(Path(path).read_text())['traceEvents'] if event['ph'] == 'X']
+
+
+def test_spans_are_exported(tmpdir):
+    tracer = TraceRecorder(Path(tmpdir) / 'parts')
+    with tracer.span('64-19-7', 'cas') as args:
+        with tracer.span('fisher', 'search', cas='64-19-7'):
+            pass
+        args['downloaded'] = True
+    with pytest.raises(requests.Timeout):
+        with tracer.span('tci', 'search', cas='67-64-1'):
+            raise requests.Timeout()
+    tracer.close()
+
+    assert export_chrome_trace(Path(tmpdir) / 'parts', Path(tmpdir) / 'trace.json') == 3
+    trace = json.loads((Path(tmpdir) / 'trace.json').read_text())
+    assert trace['traceEvents'][0] == {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'ts': 0,
+                                       'args': {'name': 'MainProcess'}}
+    cas, search, timeout = sorted(load_spans(Path(tmpdir) / 'trace.json'), key=lambda event: event['name'])[:3]
+    assert (cas['name'], cas['args']) == ('64-19-7', {'downloaded': True})
+    assert cas['ts'] <= search['ts'] and search['ts'] + search['dur'] <= cas['ts'] + cas['dur']
+    assert search['pid'] == os.getpid() and search['tid']
+    assert timeout['args'] == {'cas': '67-64-1', 'error': 'Timeout'}
+
+
+def test_spans_of_a_lookup(tmpdir, monkeypatch):
+    tracer = TraceRecorder(Path(tmpdir) / 'parts')
+    monkeypatch.setattr('find_sds.find_sds.tracer', tracer)
+    for provider in PROVIDERS:
+        monkeypatch.setattr(f'find_sds.find_sds.extract_download_url_from_{provider}', lambda cas_nr: None)
+    monkeypatch.setattr('find_sds.find_sds.extract_download_url_from_fisher',
+                        lambda cas_nr: ('Fisher', 'https://www.fishersci.com/sds.pdf'))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4', url))
+
+    _download_task('64-19-7', download_path=Path(tmpdir) / 'SDS')
+    tracer.close()
+    export_chrome_trace(Path(tmpdir) / 'parts', Path(tmpdir) / 'trace.json')
+    spans = [(event['cat'], event['name']) for event in load_spans(Path(tmpdir) / 'trace.json')]
+    assert spans == [('cas', '64-19-7'), ('search', 'chemblink'), ('search', 'vwr'), ('search', 'fisher'),
+                     ('download', 'download'), ('write', 'write')]
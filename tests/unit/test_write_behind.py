@@ -0,0 +1,103 @@
+import sys, os
+sys.path.append(os.path.realpath('find_sds'))
+
+import threading
+import time
+from contextlib import nullcontext
+from multiprocessing import Pool
+from pathlib import Path
+
+from find_sds.find_sds import download_sds
+from find_sds.response_cache import build_response
+from find_sds.write_behind import WriteBehindWriter
+
+
+def test_files_are_written_before_close_returns(tmpdir):
+    writer = WriteBehindWriter(queue_size=4, threads=2)
+    for i in range(10):
+        writer.submit(f'{i}-00-0', Path(tmpdir) / f'{i}-00-0-SDS.pdf', b'%PDF-1.4')
+    assert writer.close() == {}
+    assert sorted(os.listdir(tmpdir)) == sorted(f'{i}-00-0-SDS.pdf' for i in range(10))
+
+
+def test_failed_writes_are_reported(tmpdir):
+    (Path(tmpdir) / 'not_a_folder').write_text('')
+    writer = WriteBehindWriter()
+    writer.submit('64-19-7', Path(tmpdir) / 'not_a_folder' / '64-19-7-SDS.pdf', b'%PDF-1.4')
+    assert list(writer.close()) == ['64-19-7']
+
+
+class FailingTracer:
+    '''Tracer failing on the first file'''
+
+    def __init__(self):
+        self.spans = 0
+
+    def span(self, *args, **kwargs):
+        self.spans += 1
+        if self.spans == 1:
+            raise ValueError('bad span')
+        return nullcontext()
+
+
+def test_writer_survives_any_error(tmpdir):
+    writer = WriteBehindWriter(queue_size=1, threads=1, tracer=FailingTracer())
+    for i in range(5):
+        writer.submit(f'{i}-00-0', Path(tmpdir) / f'{i}-00-0-SDS.pdf', b'%PDF-1.4')
+    assert writer.close() == {'0-00-0': f"{Path(tmpdir) / '0-00-0-SDS.pdf'}: ValueError: bad span"}
+    assert len(os.listdir(tmpdir)) == 4
+
+
+class BlockedWriter(WriteBehindWriter):
+    '''Writer stuck on slow storage until `storage_ready` is set'''
+
+    def __init__(self, *args, **kwargs):
+        self.storage_ready = threading.Event()
+        super().__init__(*args, **kwargs)
+
+    def _write(self, path, content):
+        self.storage_ready.wait()
+        super()._write(path, content)
+
+
+def test_submit_waits_while_queue_is_full(tmpdir):
+    writer = BlockedWriter(queue_size=1, threads=1)
+    writer.submit('1-00-0', Path(tmpdir) / '1-00-0-SDS.pdf', b'%PDF-1.4')    # being written
+    time.sleep(0.1)
+    writer.submit('2-00-0', Path(tmpdir) / '2-00-0-SDS.pdf', b'%PDF-1.4')    # waiting in queue
+
+    third = threading.Thread(target=writer.submit, args=('3-00-0', Path(tmpdir) / '3-00-0-SDS.pdf', b'%PDF-1.4'))
+    third.start()
+    third.join(0.2)
+    assert third.is_alive()
+
+    writer.storage_ready.set()
+    third.join(5)
+    assert not third.is_alive()
+    assert writer.close() == {}
+    assert len(os.listdir(tmpdir)) == 3
+
+
+def submit_from_worker(writer, folder):
+    writer.submit('64-19-7', Path(folder) / '64-19-7-SDS.pdf', b'%PDF-1.4')
+
+
+def test_workers_submit_to_writer_of_main_process(tmpdir):
+    writer = WriteBehindWriter()
+    # Queues can only reach workers when they start, as with the Pool initializer of find_sds()
+    with Pool(1,initializer=submit_from_worker, initargs=(writer, str(tmpdir))) as p:
+        p.map(len, [[]])
+    assert writer.close() == {}
+    assert (Path(tmpdir) / '64-19-7-SDS.pdf').read_bytes() == b'%PDF-1.4'
+
+
+def test_download_sds_hands_file_to_writer(tmpdir, monkeypatch):
+    writer = WriteBehindWriter()
+    monkeypatch.setattr('find_sds.find_sds.disk_writer', writer)
+    monkeypatch.setattr('find_sds.find_sds._find_download_url',
+                        lambda cas_nr: ('fisher', 'Fisher', 'https://www.fishersci.com/sds.pdf'))
+    monkeypatch.setattr('find_sds.find_sds.requests.get',
+                        lambda url, **kwargs: build_response(200, {}, b'%PDF-1.4', url))
+    assert download_sds('64-19-7', download_path=tmpdir) == ('64-19-7', True, 'Fisher')
+    writer.close()
+    assert (Path(tmpdir) / '64-19-7-SDS.pdf').read_bytes() == b'%PDF-1.4'